@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Database snapshots outside the bot
+
+Usage:
+    python backup_db.py snapshot [--label pre-draw]
+    python backup_db.py list
+    python backup_db.py verify backups/quiz_bot-20241231-120000-000000-auto.db.gz
+    python backup_db.py restore backups/quiz_bot-20241231-120000-000000-auto.db.gz restored.db
+
+snapshot is safe while the bot is running. verify checks the checksum,
+decompresses to a scratch file and runs an integrity check, without touching
+the live database. restore does the same and then moves the verified copy
+into place; stop the bot before restoring over quiz_bot.db.
+"""
+
+import argparse
+import logging
+import os
+
+from config import Config
+from database import Database
+from utils.backup_utils import create_snapshot, list_snapshots, verify_snapshot
+from utils.logging_utils import setup_logging
+
+
+def print_verify(result: dict):
+    print(f"{result['path']}")
+    print(f"  checksum:  {result['checksum']}")
+    print(f"  integrity: {result['integrity']}")
+    for table, count in result['tables'].items():
+        print(f"  {table}: {count}")
+    print("  OK" if result['ok'] else "  FAILED")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Take, list, verify or restore quiz bot database snapshots")
+    parser.add_argument("command", choices=["snapshot", "list", "verify", "restore"])
+    parser.add_argument("paths", nargs="*", help="snapshot file (verify, restore) and target database (restore)")
+    parser.add_argument("--db", default="quiz_bot.db", help="SQLite database path")
+    parser.add_argument("--dir", help="snapshot directory (default: BACKUP_DIR)")
+    parser.add_argument("--label", default="manual", help="snapshot label")
+    parser.add_argument("--force", action="store_true", help="restore over an existing file")
+    args = parser.parse_args()
+    
+    config = Config()
+    setup_logging(level=getattr(logging, config.log_level, logging.INFO))
+    directory = args.dir or config.backup_dir
+    
+    if args.command == "snapshot":
+        result = create_snapshot(Database(args.db, config.min_referrals), directory, args.label,
+                                 config.backup_keep, config.backup_pages, config.backup_step_sleep)
+        print(f"{result['path']}: {result['bytes']} bytes in {result['seconds']}s")
+        print(f"sha256: {result['sha256']}")
+        return 0
+    
+    if args.command == "list":
+        for path in list_snapshots(directory):
+            print(f"{os.path.basename(path)}  {os.path.getsize(path)}")
+        return 0
+    
+    if args.command == "verify":
+        if not args.paths:
+            parser.error("verify needs snapshot paths")
+        ok = True
+        for path in args.paths:
+            result = verify_snapshot(path)
+            print_verify(result)
+            ok = ok and result['ok']
+        return 0 if ok else 1
+    
+    if len(args.paths) != 2:
+        parser.error("restore needs a snapshot and a target database path")
+    snapshot, target = args.paths
+    if os.path.exists(target) and not args.force:
+        print(f"{target} exists, use --force to overwrite it")
+        return 1
+    result = verify_snapshot(snapshot, restore_to=target)
+    print_verify(result)
+    if not result['ok']:
+        return 1
+    # A stale WAL from the old database must not be replayed over the restored file
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    print(f"restored to {target}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
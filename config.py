@@ -4,15 +4,87 @@ Configuration settings for the Quiz Bot
 
 import os
 
+from utils.flood_control import parse_limits
+
 class Config:
     def __init__(self):
         self.bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
         self.bot_username = os.getenv("BOT_USERNAME", "QuizBot")
         self.group_id = os.getenv("GROUP_ID")  # The group where users should join
         self.group_username = os.getenv("GROUP_USERNAME", "testforviktorina")  # Group username
-        self.min_referrals = int(os.getenv("MIN_REFERRALS", "1"))
+        # Referrals needed to take part; changing it recomputes every eligible flag at startup
+        self.min_referrals = max(1, int(os.getenv("MIN_REFERRALS", "1")))
         self.admin_ids = self._parse_admin_ids()
         
+        # Quiz cutoff times entered with /setdate are in this UTC offset (Tashkent)
+        self.quiz_utc_offset = float(os.getenv("QUIZ_UTC_OFFSET", "5"))
+        
+        # Winner draw: "weighted" by referral_count or "uniform"
+        self.draw_weighted = os.getenv("DRAW_MODE", "weighted").lower() != "uniform"
+        
+        # referral_count reconciliation: one chunk of users per interval, a full pass per pass interval
+        self.reconcile_chunk_size = int(os.getenv("RECONCILE_CHUNK_SIZE", "1000"))
+        self.reconcile_interval = float(os.getenv("RECONCILE_INTERVAL", "2"))
+        self.reconcile_pass_interval = float(os.getenv("RECONCILE_PASS_INTERVAL", "3600"))
+        
+        # Invite-screen entries expire after the TTL (seconds); compaction deletes them in batches
+        self.pending_referral_ttl = int(os.getenv("PENDING_REFERRAL_TTL", "86400"))
+        self.pending_compact_interval = float(os.getenv("PENDING_COMPACT_INTERVAL", "600"))
+        self.pending_compact_batch = int(os.getenv("PENDING_COMPACT_BATCH", "1000"))
+        
+        # Snapshots: online backup every BACKUP_INTERVAL seconds, BACKUP_KEEP kept per label;
+        # pages per step and the pause between steps bound the impact on live traffic
+        self.backup_dir = os.getenv("BACKUP_DIR", "backups")
+        self.backup_interval = float(os.getenv("BACKUP_INTERVAL", "21600"))
+        self.backup_keep = int(os.getenv("BACKUP_KEEP", "14"))
+        self.backup_pages = int(os.getenv("BACKUP_PAGES", "256"))
+        self.backup_step_sleep = float(os.getenv("BACKUP_STEP_SLEEP", "0.005"))
+        
+        # Processed Telegram update ids kept for skipping redeliveries (sliding window of ids)
+        self.processed_update_window = int(os.getenv("PROCESSED_UPDATE_WINDOW", "100000"))
+        
+        # Bot API connection pools: getUpdates alone, interactive replies, and throttled bulk sends
+        # (winner notices, admin broadcasts, exports); HTTP2 needs the h2 package
+        self.http2 = os.getenv("HTTP2", "").lower() in ("1", "true", "yes")
+        self.http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.http_updates_timeout = float(os.getenv("HTTP_UPDATES_TIMEOUT", "10"))
+        self.http_interactive_pool_size = int(os.getenv("HTTP_INTERACTIVE_POOL_SIZE", "8"))
+        self.http_interactive_timeout = float(os.getenv("HTTP_INTERACTIVE_TIMEOUT", "5"))
+        self.http_interactive_pool_timeout = float(os.getenv("HTTP_INTERACTIVE_POOL_TIMEOUT", "1"))
+        self.http_bulk_pool_size = int(os.getenv("HTTP_BULK_POOL_SIZE", "2"))
+        self.http_bulk_timeout = float(os.getenv("HTTP_BULK_TIMEOUT", "60"))
+        self.http_bulk_rate = float(os.getenv("HTTP_BULK_RATE", "20"))
+        
+        # Circuit breaker: opens when CIRCUIT_FAILURE_RATE of the last CIRCUIT_WINDOW Bot API calls
+        # (at least CIRCUIT_MIN_CALLS) failed, probes again after CIRCUIT_COOLDOWN seconds
+        self.circuit_failure_rate = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+        self.circuit_window = int(os.getenv("CIRCUIT_WINDOW", "20"))
+        self.circuit_min_calls = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+        self.circuit_cooldown = float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+        
+        # Outbox of notifications deferred during outages: drain interval, batch, and age after which they are dropped
+        self.outbox_drain_interval = float(os.getenv("OUTBOX_DRAIN_INTERVAL", "60"))
+        self.outbox_batch = int(os.getenv("OUTBOX_BATCH", "50"))
+        self.outbox_ttl = int(os.getenv("OUTBOX_TTL", "86400"))
+        
+        # Phone numbers typed without a country code are in this country (Uzbekistan)
+        self.phone_country_code = os.getenv("PHONE_COUNTRY_CODE", "998")
+        self.phone_national_length = int(os.getenv("PHONE_NATIONAL_LENGTH", "9"))
+        
+        # Abuse report: this many referred users joining within the window is flagged
+        self.referral_burst_window = int(os.getenv("REFERRAL_BURST_WINDOW", "60"))
+        self.referral_burst_size = int(os.getenv("REFERRAL_BURST_SIZE", "5"))
+        
+        # Flood control: per-user token buckets as "kind=per_second/burst,..." over the defaults
+        # in utils.flood_control; kinds are command names, text, contact, callback and default
+        self.flood_limits = parse_limits(os.getenv("FLOOD_LIMITS", ""))
+        
+        # Logging: records beyond the burst per interval are sampled 1-in-N
+        self.log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+        self.log_sample_burst = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+        self.log_sample_interval = float(os.getenv("LOG_SAMPLE_INTERVAL", "1.0"))
+        self.log_sample_every = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+        
     def _parse_admin_ids(self):
         """Parse admin IDs from environment variable"""
         admin_ids_str = os.getenv("ADMIN_IDS", "")
@@ -3,19 +3,50 @@ Database management for Telegram Quiz Bot
 Handles SQLite database operations for users, referrals, quiz settings, and admins
 """
 
+import re
 import sqlite3
 import logging
 from datetime import datetime
-from typing import List, Optional, Tuple
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 import threading
+import time
+
+from utils import journal
 
 logger = logging.getLogger(__name__)
 
+STATS_COLUMNS = ('starts', 'phones', 'joins', 'referrals', 'eligible')
+
+# Name matches ranked per /find query; the rest of a very common name is not scored
+SEARCH_CANDIDATES = 500
+
+
 class Database:
-    def __init__(self, db_path: str = "quiz_bot.db"):
+    def __init__(self, db_path: str = "quiz_bot.db", min_referrals: int = 1, pending_ttl: int = 86400,
+                 update_window: int = 100000):
         self.db_path = db_path
+        self.min_referrals = min_referrals
+        self.pending_ttl = pending_ttl
+        self.update_window = update_window
+        self._update_marks = 0
         self.lock = threading.Lock()
+        self.campaign_id = None
+        self.listeners = []
         self.init_database()
+        self._apply_min_referrals()
+    
+    def subscribe(self, callback):
+        """Register callback(event, data) to be told about committed changes"""
+        self.listeners.append(callback)
+    
+    def _publish(self, event: str, **data):
+        """Notify listeners of a committed change; listener errors never fail the write"""
+        for callback in self.listeners:
+            try:
+                callback(event, data)
+            except Exception as e:
+                logger.error("Database listener failed", extra={'event': 'listener_failed', 'change': event, 'error': e})
     
     def init_database(self):
         """Initialize database tables"""
@@ -23,6 +54,19 @@ class Database:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
+            # Incremental auto-vacuum lets compaction hand freed pages back;
+            # an existing file only switches mode on a full rebuild, done once
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('SELECT COUNT(*) FROM sqlite_master')
+                if cursor.fetchone()[0]:
+                    logger.info("Rebuilding database for incremental auto-vacuum", extra={'event': 'auto_vacuum_enable'})
+                    cursor.execute('VACUUM')
+            
+            # WAL lets streaming readers run alongside the writer
+            cursor.execute('PRAGMA journal_mode=WAL')
+            
             # Users table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -32,7 +76,9 @@ class Database:
                     referral_count INTEGER DEFAULT 0,
                     eligible BOOLEAN DEFAULT 0,
                     join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    referral_code TEXT UNIQUE
+                    referral_code TEXT UNIQUE,
+                    phone_number TEXT,
+                    phone_e164 TEXT
                 )
             ''')
             
@@ -92,29 +138,542 @@ class Database:
                 )
             ''')
             
+            # Draws: seed commitment and audit record of each winner draw
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS draws (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    seed TEXT,
+                    seed_hash TEXT,
+                    snapshot_digest TEXT,
+                    algorithm TEXT,
+                    participant_count INTEGER DEFAULT 0,
+                    winners TEXT,
+                    status TEXT DEFAULT 'committed',
+                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    completed_date TIMESTAMP
+                )
+            ''')
+            
+            # Frozen, ordered eligible set of each draw
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS draw_entries (
+                    draw_id INTEGER,
+                    position INTEGER,
+                    user_id INTEGER,
+                    weight INTEGER,
+                    PRIMARY KEY (draw_id, position)
+                ) WITHOUT ROWID
+            ''')
+            
+            self._add_column_if_missing(cursor, 'winners', 'draw_id', 'INTEGER')
+            self._add_column_if_missing(cursor, 'quiz_settings', 'cutoff_ts', 'INTEGER')
+            self._add_column_if_missing(cursor, 'quiz_settings', 'snapshot_ts', 'INTEGER')
+            
+            # Campaigns: one quiz run each; only the active one lives in the hot tables
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS campaigns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT,
+                    quiz_date TEXT,
+                    cutoff_ts INTEGER,
+                    snapshot_ts INTEGER,
+                    status TEXT DEFAULT 'active',
+                    participant_count INTEGER,
+                    referral_count INTEGER,
+                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    archived_date TIMESTAMP
+                )
+            ''')
+            # Referral threshold the campaign's eligible flags were computed with
+            self._add_column_if_missing(cursor, 'campaigns', 'min_referrals', 'INTEGER')
+            
+            # Existing rows predate campaigns and belong to the first one
+            for table in ('referrals', 'pending_referrals', 'winners', 'draws'):
+                self._add_column_if_missing(cursor, table, 'campaign_id', 'INTEGER DEFAULT 1')
+            
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_referrals_campaign ON referrals (campaign_id, referrer_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending_campaign ON pending_referrals (campaign_id, referral_code)')
+            # Newest unexpired entry on group join; expired entries for compaction
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending_recent ON pending_referrals (campaign_id, created_date)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending_created ON pending_referrals (created_date)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_winners_campaign ON winners (campaign_id, user_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_draws_campaign ON draws (campaign_id, id)')
+            
+            # Cold tables holding archived campaigns
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS referrals_archive (
+                    id INTEGER PRIMARY KEY,
+                    campaign_id INTEGER,
+                    referrer_id INTEGER,
+                    referred_id INTEGER,
+                    date TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS winners_archive (
+                    id INTEGER PRIMARY KEY,
+                    campaign_id INTEGER,
+                    user_id INTEGER,
+                    prize_type TEXT,
+                    selected_date TIMESTAMP,
+                    draw_id INTEGER
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS draw_entries_archive (
+                    draw_id INTEGER,
+                    position INTEGER,
+                    user_id INTEGER,
+                    weight INTEGER,
+                    PRIMARY KEY (draw_id, position)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS campaign_results_archive (
+                    campaign_id INTEGER,
+                    user_id INTEGER,
+                    referral_count INTEGER,
+                    eligible BOOLEAN,
+                    PRIMARY KEY (campaign_id, user_id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_referrals_archive_campaign ON referrals_archive (campaign_id, referrer_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_winners_archive_campaign ON winners_archive (campaign_id, user_id)')
+            
+            cursor.execute("SELECT id FROM campaigns WHERE status = 'active' ORDER BY id DESC LIMIT 1")
+            result = cursor.fetchone()
+            if result:
+                self.campaign_id = result[0]
+            else:
+                cursor.execute('SELECT COUNT(*) FROM campaigns')
+                if cursor.fetchone()[0] == 0:
+                    # First start with campaigns: carry over the legacy quiz_settings row
+                    cursor.execute('''
+                        INSERT INTO campaigns (id, name, quiz_date, cutoff_ts, snapshot_ts)
+                        SELECT 1, 'Viktorina #1', quiz_date, cutoff_ts, snapshot_ts
+                        FROM (SELECT 1) LEFT JOIN quiz_settings ON quiz_settings.id = 1
+                    ''')
+                else:
+                    cursor.execute("INSERT INTO campaigns (name) VALUES ('Viktorina')")
+                self.campaign_id = cursor.lastrowid
+            
+            # Analytics rollups, maintained incrementally by _bump_stats
+            for table in ('stats_hourly', 'stats_daily'):
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        campaign_id INTEGER,
+                        bucket INTEGER,
+                        starts INTEGER DEFAULT 0,
+                        phones INTEGER DEFAULT 0,
+                        joins INTEGER DEFAULT 0,
+                        referrals INTEGER DEFAULT 0,
+                        eligible INTEGER DEFAULT 0,
+                        PRIMARY KEY (campaign_id, bucket)
+                    ) WITHOUT ROWID
+                ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stats_totals (
+                    campaign_id INTEGER PRIMARY KEY,
+                    starts INTEGER DEFAULT 0,
+                    phones INTEGER DEFAULT 0,
+                    joins INTEGER DEFAULT 0,
+                    referrals INTEGER DEFAULT 0,
+                    eligible INTEGER DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stats_referrers (
+                    campaign_id INTEGER,
+                    referrer_id INTEGER,
+                    referrals INTEGER DEFAULT 0,
+                    PRIMARY KEY (campaign_id, referrer_id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_referrers_top ON stats_referrers (campaign_id, referrals DESC)')
+            self._backfill_stats(cursor)
+            
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_winners_user ON winners (user_id)')
+            
+            # One account per phone: phone_e164 is filled on write and by backfill_phone_numbers
+            self._add_column_if_missing(cursor, 'users', 'phone_e164', 'TEXT')
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_phone_e164 ON users (phone_e164)')
+            
+            # Telegram language_code of the user's last interaction, picks their message locale
+            self._add_column_if_missing(cursor, 'users', 'language_code', 'TEXT')
+            
+            self._init_user_search(cursor)
+            
+            # Audit trail of referral_count drift fixed by reconcile_referral_counts
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS counter_repairs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    campaign_id INTEGER,
+                    user_id INTEGER,
+                    old_count INTEGER,
+                    new_count INTEGER,
+                    old_eligible BOOLEAN,
+                    new_eligible BOOLEAN,
+                    repaired_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            self._init_journal(cursor)
+            
+            # Conversation state of users who are not idle (idle users have no row)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_states (
+                    user_id INTEGER PRIMARY KEY,
+                    state INTEGER NOT NULL,
+                    updated_ts INTEGER
+                ) WITHOUT ROWID
+            ''')
+            
+            # Telegram updates whose writes are committed, for skipping redeliveries after a crash;
+            # only the last update_window ids are kept
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS processed_updates (
+                    update_id INTEGER,
+                    subject INTEGER DEFAULT 0,
+                    PRIMARY KEY (update_id, subject)
+                ) WITHOUT ROWID
+            ''')
+            
+            # Non-critical messages that could not be sent during a Bot API outage, oldest first
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    kind TEXT,
+                    created_ts INTEGER NOT NULL
+                )
+            ''')
+            
             conn.commit()
             conn.close()
             logger.info("Database initialized successfully")
     
-    def add_user(self, user_id: int, username: str, first_name: str, referral_code: str) -> bool:
-        """Add a new user to the database"""
+    def _init_user_search(self, cursor):
+        """
+        Full-text index over username and first_name for /find.
+
+        users_fts is a regular FTS5 table keyed by rowid = user_id rather than
+        an external-content one, so the triggers never need a row's old
+        values: a REPLACE (which skips delete triggers) cannot leave stale
+        entries because the insert trigger clears the rowid first. Phone and
+        referral code prefixes are answered by range scans on plain indexes.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+        exists = cursor.fetchone() is not None
+        
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                username, first_name,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users
+            BEGIN
+                DELETE FROM users_fts WHERE rowid = new.user_id;
+                INSERT INTO users_fts (rowid, username, first_name)
+                VALUES (new.user_id, new.username, new.first_name);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username, first_name ON users
+            BEGIN
+                UPDATE users_fts SET username = new.username, first_name = new.first_name
+                WHERE rowid = new.user_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users
+            BEGIN
+                DELETE FROM users_fts WHERE rowid = old.user_id;
+            END
+        ''')
+        
+        if not exists:
+            cursor.execute('''
+                INSERT INTO users_fts (rowid, username, first_name)
+                SELECT user_id, username, first_name FROM users
+            ''')
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_phone_number ON users (phone_number)')
+    
+    def _init_journal(self, cursor):
+        """
+        Append-only event journal (kind codes in utils/journal.py).
+
+        Users, phones and referrals are journaled by triggers, so every
+        write path, bulk imports included, records its events in the same
+        transaction. Winners, consumed pending referrals and campaign starts
+        are journaled by the methods that write them, which lets a rebuild
+        rewrite the winners table without journaling it again. A database
+        that predates the journal is seeded with its current state first.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events'")
+        seed = cursor.fetchone() is None
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY,
+                ts INTEGER NOT NULL,
+                kind INTEGER NOT NULL,
+                a INTEGER,
+                b INTEGER,
+                info TEXT
+            )
+        ''')
+        # Campaign starts and winners are rare; replay finds them without a scan
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_events_barriers ON events (kind, id)
+            WHERE kind IN ({journal.WINNER_CHOSEN}, {journal.CAMPAIGN_STARTED})
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_checkpoints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER,
+                counts BLOB,
+                winners TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        if seed:
+            now = "CAST(strftime('%s', 'now') AS INTEGER)"
+            cursor.execute(f'''
+                INSERT INTO events (ts, kind, a) VALUES ({now}, ?, ?)
+            ''', (journal.CAMPAIGN_STARTED, self.campaign_id))
+            cursor.execute(f'''
+                INSERT INTO events (ts, kind, a)
+                SELECT COALESCE(CAST(strftime('%s', join_date) AS INTEGER), {now}), ?, user_id
+                FROM users ORDER BY user_id
+            ''', (journal.USER_CREATED,))
+            cursor.execute(f'''
+                INSERT INTO events (ts, kind, a, info)
+                SELECT {now}, ?, user_id, COALESCE(phone_e164, phone_number)
+                FROM users WHERE phone_number IS NOT NULL ORDER BY user_id
+            ''', (journal.PHONE_SET,))
+            cursor.execute(f'''
+                INSERT INTO events (ts, kind, a, b)
+                SELECT COALESCE(CAST(strftime('%s', date) AS INTEGER), {now}), ?, referrer_id, referred_id
+                FROM referrals WHERE campaign_id = ? ORDER BY id
+            ''', (journal.REFERRAL_CREDITED, self.campaign_id))
+            cursor.execute(f'''
+                INSERT INTO events (ts, kind, a, b, info)
+                SELECT COALESCE(CAST(strftime('%s', selected_date) AS INTEGER), {now}), ?, user_id, draw_id, prize_type
+                FROM winners WHERE campaign_id = ? ORDER BY id
+            ''', (journal.WINNER_CHOSEN, self.campaign_id))
+            cursor.execute('SELECT COUNT(*) FROM events')
+            logger.info("Event journal seeded", extra={'event': 'journal_seeded', 'events': cursor.fetchone()[0]})
+        
+        now = "CAST(strftime('%s', 'now') AS INTEGER)"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS events_user_created AFTER INSERT ON users BEGIN
+                INSERT INTO events (ts, kind, a) VALUES ({now}, {journal.USER_CREATED}, new.user_id);
+                INSERT INTO events (ts, kind, a, info)
+                SELECT {now}, {journal.PHONE_SET}, new.user_id, COALESCE(new.phone_e164, new.phone_number)
+                WHERE new.phone_number IS NOT NULL;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS events_phone_set AFTER UPDATE OF phone_number, phone_e164 ON users
+            WHEN new.phone_number IS NOT old.phone_number OR new.phone_e164 IS NOT old.phone_e164 BEGIN
+                INSERT INTO events (ts, kind, a, info)
+                VALUES ({now}, {journal.PHONE_SET}, new.user_id, COALESCE(new.phone_e164, new.phone_number));
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS events_referral_credited AFTER INSERT ON referrals BEGIN
+                INSERT INTO events (ts, kind, a, b) VALUES ({now}, {journal.REFERRAL_CREDITED}, new.referrer_id, new.referred_id);
+            END
+        ''')
+    
+    def _journal(self, cursor, kind: int, a: int, b: Optional[int] = None, info: Optional[str] = None):
+        """Append one event inside the caller's transaction"""
+        cursor.execute('''
+            INSERT INTO events (ts, kind, a, b, info) VALUES (?, ?, ?, ?, ?)
+        ''', (int(time.time()), kind, a, b, info))
+    
+    def _add_column_if_missing(self, cursor, table: str, column: str, definition: str):
+        """Add a column to an existing table (CREATE TABLE IF NOT EXISTS won't)"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    def _eligible_source(self, cursor) -> str:
+        """
+        SQL selecting (user_id, referral_count) of the current eligible set.
+
+        Once the cutoff snapshot has been taken this reads the frozen
+        eligible_snapshot table; before that it reads the live users table.
+        """
+        cursor.execute('SELECT snapshot_ts FROM campaigns WHERE id = ?', (self.campaign_id,))
+        result = cursor.fetchone()
+        if result and result[0]:
+            return 'SELECT user_id, referral_count FROM eligible_snapshot'
+        return 'SELECT user_id, referral_count FROM users WHERE eligible = 1'
+    
+    def _bump_stats(self, cursor, **deltas):
+        """
+        Add funnel deltas (starts, phones, joins, referrals, eligible) to the
+        hourly, daily and total rollups of the active campaign.
+
+        Runs on the caller's cursor so the rollups commit in the same
+        transaction as the change they count.
+        """
+        columns = [column for column in STATS_COLUMNS if deltas.get(column)]
+        if not columns:
+            return
+        
+        values = [deltas[column] for column in columns]
+        names = ", ".join(columns)
+        placeholders = ", ".join("?" * len(columns))
+        updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in columns)
+        
+        now = int(time.time())
+        for table, bucket in (('stats_hourly', now - now % 3600), ('stats_daily', now - now % 86400)):
+            cursor.execute(f'''
+                INSERT INTO {table} (campaign_id, bucket, {names})
+                VALUES (?, ?, {placeholders})
+                ON CONFLICT(campaign_id, bucket) DO UPDATE SET {updates}
+            ''', [self.campaign_id, bucket] + values)
+        
+        cursor.execute(f'''
+            INSERT INTO stats_totals (campaign_id, {names})
+            VALUES (?, {placeholders})
+            ON CONFLICT(campaign_id) DO UPDATE SET {updates}
+        ''', [self.campaign_id] + values)
+    
+    def _backfill_stats(self, cursor):
+        """Seed the rollups from existing rows the first time they are created"""
+        cursor.execute('SELECT COUNT(*) FROM stats_totals')
+        if cursor.fetchone()[0]:
+            return
+        
+        cursor.execute('''
+            INSERT INTO stats_totals (campaign_id, starts, phones, joins, referrals, eligible)
+            SELECT ?,
+                   (SELECT COUNT(*) FROM users),
+                   (SELECT COUNT(*) FROM users WHERE phone_number IS NOT NULL),
+                   0,
+                   (SELECT COUNT(*) FROM referrals WHERE campaign_id = ?),
+                   (SELECT COUNT(*) FROM users WHERE eligible = 1)
+        ''', (self.campaign_id, self.campaign_id))
+        
+        for table, size in (('stats_hourly', 3600), ('stats_daily', 86400)):
+            cursor.execute(f'''
+                INSERT INTO {table} (campaign_id, bucket, referrals)
+                SELECT ?, CAST(strftime('%s', date) AS INTEGER) / {size} * {size} AS bucket, COUNT(*)
+                FROM referrals WHERE campaign_id = ?
+                GROUP BY bucket
+            ''', (self.campaign_id, self.campaign_id))
+        
+        cursor.execute('''
+            INSERT INTO stats_referrers (campaign_id, referrer_id, referrals)
+            SELECT ?, referrer_id, COUNT(*) FROM referrals WHERE campaign_id = ?
+            GROUP BY referrer_id
+        ''', (self.campaign_id, self.campaign_id))
+    
+    def _read_connection(self) -> sqlite3.Connection:
+        """Open a read-only connection for long scans that must not hold the lock"""
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+    
+    def backup_to(self, dest_path: str, pages: int = 256, sleep: float = 0.005) -> Optional[dict]:
+        """
+        Copy the live database to dest_path with SQLite's online backup API.
+
+        Runs without the lock, `pages` pages per step with a pause between
+        steps. The source keeps one read transaction open for the whole copy,
+        so under WAL writers carry on and the copy is a consistent snapshot
+        that never restarts. Returns the page count and page size.
+        """
+        try:
+            source = sqlite3.connect(self.db_path, isolation_level=None)
+            dest = sqlite3.connect(dest_path)
+            # The copy is a scratch file; an fsync of it would stall the live WAL's fsyncs
+            dest.execute('PRAGMA synchronous = OFF')
+            try:
+                source.execute('BEGIN')
+                page_size = source.execute('PRAGMA page_size').fetchone()[0]
+                page_count = source.execute('PRAGMA page_count').fetchone()[0]
+                # backup()'s own sleep only applies to busy retries; pace the steps here
+                source.backup(dest, pages=pages, progress=lambda status, remaining, total: time.sleep(sleep))
+                source.execute('COMMIT')
+            finally:
+                dest.close()
+                source.close()
+            
+            logger.info("Database backup copied", extra={'event': 'backup_copied', 'pages': page_count})
+            return {'pages': page_count, 'page_size': page_size}
+        except Exception as e:
+            logger.error("Error backing up database", extra={'event': 'backup_failed', 'error': e})
+            return None
+    
+    def add_user(self, user_id: int, username: str, first_name: str,
+                 generate_code: Callable[[int, int], str], source: str = 'start',
+                 language_code: Optional[str] = None) -> Optional[str]:
+        """
+        Insert a user or update their username/first_name/language_code in place.
+
+        A single INSERT ... ON CONFLICT DO UPDATE that only writes when a
+        name or a known language_code actually changed, so referral_count, eligible, phone_number and
+        join_date are never reset and unchanged rows are not rewritten.
+        Returns 'created', 'updated' or 'unchanged' (None on error). Users
+        created via /start count as funnel starts. Referral codes come from
+        generate_code(user_id, attempt), retried if another user has the code.
+        """
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    INSERT OR REPLACE INTO users (user_id, username, first_name, referral_code, phone_number)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, username, first_name, referral_code, None))
+                attempt = 0
+                while True:
+                    try:
+                        cursor.execute('''
+                            INSERT INTO users (user_id, username, first_name, referral_code, language_code)
+                            VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(user_id) DO UPDATE SET
+                                username = excluded.username,
+                                first_name = excluded.first_name,
+                                language_code = COALESCE(excluded.language_code, users.language_code)
+                            WHERE users.username IS NOT excluded.username
+                               OR users.first_name IS NOT excluded.first_name
+                               OR (excluded.language_code IS NOT NULL
+                                   AND users.language_code IS NOT excluded.language_code)
+                            RETURNING user_id
+                        ''', (user_id, username, first_name, generate_code(user_id, attempt), language_code))
+                        break
+                    except sqlite3.IntegrityError as e:
+                        if 'referral_code' not in str(e) or attempt >= 5:
+                            raise
+                        attempt += 1
+                
+                written = cursor.fetchone() is not None
+                # A fresh connection's last insert rowid only moves if a row was inserted
+                if written and cursor.lastrowid == user_id:
+                    status = 'created'
+                elif written:
+                    status = 'updated'
+                else:
+                    status = 'unchanged'
+                
+                if status == 'created' and source == 'start':
+                    self._bump_stats(cursor, starts=1)
                 
                 conn.commit()
                 conn.close()
-                logger.info(f"User {user_id} added successfully")
-                return True
+                if status == 'created':
+                    self._publish('user_added', user_id=user_id)
+                    logger.info("User added successfully", extra={'event': 'user_added', 'user_id': user_id, 'source': source})
+                return status
             except Exception as e:
-                logger.error(f"Error adding user {user_id}: {e}")
-                return False
+                logger.error("Error adding user", extra={'event': 'user_add_failed', 'user_id': user_id, 'error': e})
+                return None
     
     def get_user(self, user_id: int) -> Optional[dict]:
         """Get user information by user_id"""
@@ -124,7 +683,8 @@ class Database:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
-                    SELECT user_id, username, first_name, referral_count, eligible, referral_code, phone_number
+                    SELECT user_id, username, first_name, referral_count, eligible, referral_code, phone_number,
+                           language_code
                     FROM users WHERE user_id = ?
                 ''', (user_id,))
                 
@@ -139,56 +699,529 @@ class Database:
                         'referral_count': result[3],
                         'eligible': result[4],
                         'referral_code': result[5],
-                        'phone_number': result[6]
+                        'phone_number': result[6],
+                        'language_code': result[7]
                     }
                 return None
             except Exception as e:
-                logger.error(f"Error getting user {user_id}: {e}")
+                logger.error("Error getting user", extra={'event': 'user_get_failed', 'user_id': user_id, 'error': e})
                 return None
     
-    def add_referral(self, referrer_id: int, referred_id: int) -> bool:
-        """Add a referral relationship"""
+    def add_referral(self, referrer_id: int, referred_id: int, update_id: Optional[int] = None) -> bool:
+        """
+        Add a referral relationship.
+
+        With update_id, the Telegram update is recorded as processed in the
+        same transaction, so a redelivered update credits nothing twice.
+        """
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
-                # Check if referral already exists
-                cursor.execute('''
-                    SELECT COUNT(*) FROM referrals 
-                    WHERE referrer_id = ? AND referred_id = ?
-                ''', (referrer_id, referred_id))
+                if update_id is not None and not self._mark_update(cursor, update_id, referred_id):
+                    conn.close()
+                    return False
                 
-                if cursor.fetchone()[0] > 0:
+                credited = self._credit_referral(cursor, referrer_id, referred_id)
+                if credited is None:
                     conn.close()
                     return False
                 
-                # Add referral
+                conn.commit()
+                conn.close()
+                referral_count, created_ts = credited
+                self._publish('referral_added', referrer_id=referrer_id, referred_id=referred_id,
+                              referral_count=referral_count, created_ts=created_ts)
+                logger.info("Referral added", extra={'event': 'referral_added', 'referrer_id': referrer_id, 'referred_id': referred_id})
+                return True
+            except Exception as e:
+                logger.error("Error adding referral", extra={'event': 'referral_add_failed', 'referrer_id': referrer_id, 'referred_id': referred_id, 'error': e})
+                return False
+    
+    def _credit_referral(self, cursor, referrer_id: int, referred_id: int) -> Optional[Tuple[int, int]]:
+        """
+        Insert the referral and update the referrer's counters inside the
+        caller's transaction; (referral_count, referred user's join ts), or
+        None if this referral already exists.
+        """
+        # Check if referral already exists
+        cursor.execute('''
+            SELECT COUNT(*) FROM referrals 
+            WHERE campaign_id = ? AND referrer_id = ? AND referred_id = ?
+        ''', (self.campaign_id, referrer_id, referred_id))
+        
+        if cursor.fetchone()[0] > 0:
+            return None
+        
+        # Add referral
+        cursor.execute('''
+            INSERT INTO referrals (campaign_id, referrer_id, referred_id)
+            VALUES (?, ?, ?)
+        ''', (self.campaign_id, referrer_id, referred_id))
+        
+        # Update referrer's count
+        cursor.execute('''
+            UPDATE users SET referral_count = referral_count + 1
+            WHERE user_id = ?
+            RETURNING referral_count
+        ''', (referrer_id,))
+        result = cursor.fetchone()
+        referral_count = result[0] if result else 0
+        
+        cursor.execute('''
+            SELECT CAST(strftime('%s', join_date) AS INTEGER) FROM users WHERE user_id = ?
+        ''', (referred_id,))
+        result = cursor.fetchone()
+        created_ts = result[0] if result and result[0] is not None else int(time.time())
+        
+        # Check if user is now eligible (min_referrals+ referrals)
+        cursor.execute('''
+            UPDATE users SET eligible = 1
+            WHERE user_id = ? AND referral_count >= ? AND eligible = 0
+        ''', (referrer_id, self.min_referrals))
+        became_eligible = cursor.rowcount
+        
+        self._bump_stats(cursor, referrals=1, eligible=became_eligible)
+        cursor.execute('''
+            INSERT INTO stats_referrers (campaign_id, referrer_id, referrals)
+            VALUES (?, ?, 1)
+            ON CONFLICT(campaign_id, referrer_id) DO UPDATE SET referrals = referrals + 1
+        ''', (self.campaign_id, referrer_id))
+        return referral_count, created_ts
+    
+    def _mark_update(self, cursor, update_id: int, subject: int = 0) -> bool:
+        """
+        Record (update_id, subject) as processed in the caller's transaction;
+        False if it already was. subject tells apart the users of one update
+        (a join message can add several members). Every few hundred marks,
+        ids older than the sliding window are dropped with one range delete.
+        """
+        cursor.execute('''
+            INSERT OR IGNORE INTO processed_updates (update_id, subject) VALUES (?, ?)
+        ''', (update_id, subject))
+        if not cursor.rowcount:
+            logger.info("Redelivered update skipped", extra={'event': 'update_duplicate', 'update_id': update_id, 'subject': subject})
+            return False
+        self._update_marks += 1
+        if self._update_marks % 256 == 0:
+            cursor.execute('DELETE FROM processed_updates WHERE update_id < ?', (update_id - self.update_window,))
+        return True
+    
+    def process_group_join(self, user_id: int, update_id: int) -> Optional[dict]:
+        """
+        Everything a group join writes, in one transaction: the processed
+        update mark, the funnel counter, and crediting plus consuming the
+        newest unexpired pending referral. A redelivered join returns
+        {'duplicate': True} and writes nothing, so it can neither count
+        twice nor credit (and notify) a different referrer. Otherwise
+        returns 'referrer_id' and 'credited'.
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                if not self._mark_update(cursor, update_id, user_id):
+                    conn.close()
+                    return {'duplicate': True, 'referrer_id': None, 'credited': False}
+                
+                self._bump_stats(cursor, joins=1)
+                
+                # Match with the most recent unexpired pending referral as a heuristic
                 cursor.execute('''
-                    INSERT INTO referrals (referrer_id, referred_id)
-                    VALUES (?, ?)
-                ''', (referrer_id, referred_id))
+                    SELECT referral_code, referrer_id FROM pending_referrals
+                    WHERE campaign_id = ? AND created_date > datetime('now', ?)
+                    ORDER BY created_date DESC
+                    LIMIT 1
+                ''', (self.campaign_id, self._pending_age()))
+                pending = cursor.fetchone()
+                
+                credited = None
+                referrer_id = None
+                if pending and pending[1] != user_id:
+                    referral_code, referrer_id = pending
+                    credited = self._credit_referral(cursor, referrer_id, user_id)
+                    if credited is not None:
+                        self._journal(cursor, journal.PENDING_CONSUMED, referrer_id, info=referral_code)
+                        cursor.execute('''
+                            DELETE FROM pending_referrals WHERE campaign_id = ? AND referral_code = ?
+                        ''', (self.campaign_id, referral_code))
+                
+                conn.commit()
+                conn.close()
+                if credited is not None:
+                    referral_count, created_ts = credited
+                    self._publish('referral_added', referrer_id=referrer_id, referred_id=user_id,
+                                  referral_count=referral_count, created_ts=created_ts)
+                    logger.info("Referral added", extra={'event': 'referral_added', 'referrer_id': referrer_id, 'referred_id': user_id})
+                return {'duplicate': False, 'referrer_id': referrer_id, 'credited': credited is not None}
+            except Exception as e:
+                logger.error("Error processing group join", extra={'event': 'group_join_failed', 'user_id': user_id, 'update_id': update_id, 'error': e})
+                return None
+    
+    def iter_processed_updates(self, chunk_size: int = 10000) -> Iterator[Tuple[int, int]]:
+        """Stream (update_id, subject) of the processed-update window, oldest first"""
+        conn = self._read_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT update_id, subject FROM processed_updates ORDER BY update_id')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def import_users(self, rows: Iterable[Tuple[int, str, str, Optional[str]]],
+                     generate_code: Callable[[int, int], str], chunk_size: int = 5000) -> Optional[dict]:
+        """
+        Bulk-insert (user_id, username, first_name, phone_e164) rows.
+
+        Each chunk is one executemany in its own transaction. Existing users
+        are left untouched. Referral codes come from generate_code(user_id,
+        attempt); a code already taken in the table or the chunk is retried
+        with the next attempt, and a phone that already belongs to another
+        account is dropped from the imported row rather than failing it.
+        """
+        counts = {'inserted': 0, 'existing': 0, 'code_retries': 0, 'phone_conflicts': 0}
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            with self.lock:
+                try:
+                    conn = sqlite3.connect(self.db_path)
+                    cursor = conn.cursor()
+                    
+                    def taken_values(column, values):
+                        if not values:
+                            return set()
+                        placeholders = ",".join("?" * len(values))
+                        cursor.execute(f'SELECT {column} FROM users WHERE {column} IN ({placeholders})', values)
+                        return {row[0] for row in cursor.fetchall()}
+                    
+                    user_ids = [row[0] for row in chunk]
+                    existing = taken_values('user_id', user_ids)
+                    chunk = [row for row in chunk if row[0] not in existing]
+                    
+                    codes = {user_id: generate_code(user_id, 0) for user_id, _, _, _ in chunk}
+                    taken_codes = taken_values('referral_code', list(codes.values()))
+                    taken_phones = taken_values('phone_e164', [row[3] for row in chunk if row[3]])
+                    
+                    params = []
+                    for user_id, username, first_name, phone_e164 in chunk:
+                        code = codes[user_id]
+                        attempt = 0
+                        while code in taken_codes:
+                            attempt += 1
+                            code = generate_code(user_id, attempt)
+                            # Retried codes are rare enough to check one by one
+                            taken_codes |= taken_values('referral_code', [code])
+                        
+                        counts['code_retries'] += attempt
+                        taken_codes.add(code)
+                        
+                        if phone_e164 and phone_e164 in taken_phones:
+                            counts['phone_conflicts'] += 1
+                            phone_e164 = None
+                        elif phone_e164:
+                            taken_phones.add(phone_e164)
+                        params.append((user_id, username, first_name, code, phone_e164, phone_e164))
+                    
+                    cursor.executemany('''
+                        INSERT INTO users (user_id, username, first_name, referral_code, phone_number, phone_e164)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', params)
+                    
+                    conn.commit()
+                    conn.close()
+                    counts['inserted'] += len(params)
+                    counts['existing'] += len(existing)
+                except Exception as e:
+                    logger.error("Error importing users", extra={'event': 'user_import_failed', 'error': e})
+                    return None
+        
+        logger.info("Users imported", extra={'event': 'users_imported', **counts})
+        return counts
+    
+    def import_referrals(self, pairs: Iterable[Tuple[int, int, Optional[str]]],
+                         chunk_size: int = 5000) -> Optional[dict]:
+        """
+        Bulk-insert (referrer_id, referred_id, date) pairs into the current campaign.
+
+        Pairs whose users are unknown or that already exist are skipped.
+        Counts are not touched here; call recompute_referral_counts afterwards.
+        """
+        counts = {'inserted': 0, 'skipped': 0}
+        pairs = iter(pairs)
+        while True:
+            chunk = list(islice(pairs, chunk_size))
+            if not chunk:
+                break
+            with self.lock:
+                try:
+                    conn = sqlite3.connect(self.db_path)
+                    cursor = conn.cursor()
+                    
+                    cursor.executemany('''
+                        INSERT OR IGNORE INTO referrals (campaign_id, referrer_id, referred_id, date)
+                        SELECT ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP)
+                        WHERE EXISTS (SELECT 1 FROM users WHERE user_id = ?)
+                          AND EXISTS (SELECT 1 FROM users WHERE user_id = ?)
+                    ''', [(self.campaign_id, referrer_id, referred_id, date, referrer_id, referred_id)
+                          for referrer_id, referred_id, date in chunk])
+                    inserted = cursor.rowcount
+                    
+                    conn.commit()
+                    conn.close()
+                    counts['inserted'] += inserted
+                    counts['skipped'] += len(chunk) - inserted
+                except Exception as e:
+                    logger.error("Error importing referrals", extra={'event': 'referral_import_failed', 'error': e})
+                    return None
+        
+        logger.info("Referrals imported", extra={'event': 'referrals_imported', **counts})
+        return counts
+    
+    def _apply_min_referrals(self):
+        """Recompute eligibility if the configured threshold changed since it was last applied"""
+        with self.lock:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            # Campaigns from before the threshold was recorded used the old hard-coded 1
+            cursor.execute('SELECT COALESCE(min_referrals, 1) FROM campaigns WHERE id = ?', (self.campaign_id,))
+            applied = cursor.fetchone()[0]
+            conn.close()
+        
+        if applied != self.min_referrals:
+            logger.info("Referral threshold changed", extra={'event': 'min_referrals_changed',
+                                                             'old': applied, 'new': self.min_referrals})
+            self.recompute_referral_counts()
+    
+    def recompute_referral_counts(self) -> Optional[dict]:
+        """
+        Rebuild referral_count, eligible and the referral rollups from the
+        current campaign's referrals in one set-based transaction.
+
+        referral_count is reconciled against COUNT(*) on referrals and
+        eligible is derived from min_referrals. Only rows whose values
+        actually change are written, and the counts are joined from a
+        per-referrer aggregate instead of a subquery per user, so this is
+        cheap enough to run while the bot is live.
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
                 
-                # Update referrer's count
                 cursor.execute('''
-                    UPDATE users SET referral_count = referral_count + 1
-                    WHERE user_id = ?
-                ''', (referrer_id,))
+                    CREATE TEMP TABLE referral_totals AS
+                    SELECT referrer_id AS user_id, COUNT(*) AS referral_count
+                    FROM referrals WHERE campaign_id = ?
+                    GROUP BY referrer_id
+                ''', (self.campaign_id,))
+                cursor.execute('CREATE UNIQUE INDEX temp.idx_referral_totals ON referral_totals (user_id)')
+                counts = self._apply_referral_totals(cursor)
+                
+                conn.commit()
+                conn.close()
+                self._publish('counts_recomputed', counts=self.iter_referral_counts, edges=self.iter_referral_edges)
+                logger.info("Referral counts recomputed", extra={'event': 'referral_counts_recomputed', **counts,
+                                                                  'min_referrals': self.min_referrals})
+                return counts
+            except Exception as e:
+                logger.error("Error recomputing referral counts", extra={'event': 'referral_recompute_failed', 'error': e})
+                return None
+    
+    def _apply_referral_totals(self, cursor) -> dict:
+        """
+        Write the per-user counts in temp.referral_totals to users and the rollups.
+
+        Only rows whose values actually change are written; eligible is
+        derived from min_referrals. Drops the temp table.
+        """
+        cursor.execute('''
+            UPDATE users SET referral_count = t.referral_count
+            FROM referral_totals t
+            WHERE t.user_id = users.user_id AND users.referral_count != t.referral_count
+        ''')
+        updated = cursor.rowcount
+        cursor.execute('''
+            UPDATE users SET referral_count = 0
+            WHERE referral_count != 0
+              AND user_id NOT IN (SELECT user_id FROM referral_totals)
+        ''')
+        updated += cursor.rowcount
+        
+        cursor.execute('''
+            UPDATE users SET eligible = (referral_count >= ?)
+            WHERE eligible != (referral_count >= ?)
+        ''', (self.min_referrals, self.min_referrals))
+        eligible_changed = cursor.rowcount
+        
+        cursor.execute('DELETE FROM stats_referrers WHERE campaign_id = ?', (self.campaign_id,))
+        cursor.execute('''
+            INSERT INTO stats_referrers (campaign_id, referrer_id, referrals)
+            SELECT ?, user_id, referral_count FROM referral_totals
+        ''', (self.campaign_id,))
+        cursor.execute('''
+            INSERT INTO stats_totals (campaign_id, referrals, eligible)
+            SELECT ?, (SELECT COALESCE(SUM(referral_count), 0) FROM referral_totals),
+                   (SELECT COUNT(*) FROM users WHERE eligible = 1)
+            ON CONFLICT(campaign_id) DO UPDATE SET
+                referrals = excluded.referrals, eligible = excluded.eligible
+        ''', (self.campaign_id,))
+        cursor.execute('DROP TABLE temp.referral_totals')
+        
+        cursor.execute('UPDATE campaigns SET min_referrals = ? WHERE id = ?', (self.min_referrals, self.campaign_id))
+        return {'updated': updated, 'eligible_changed': eligible_changed}
+    
+    def reconcile_referral_counts(self, after_user_id: int, chunk_size: int = 1000) -> Optional[dict]:
+        """
+        Check one keyset chunk of users against the referrals table and fix drift.
+
+        Counts come from an index range scan on referrals (campaign_id,
+        referrer_id) per user. Rows whose referral_count or eligible flag
+        disagree are repaired with one executemany and logged to
+        counter_repairs in the same short transaction. Returns the last
+        user_id checked (None at the end of the table) and the repairs.
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
                 
-                # Check if user is now eligible (1+ referrals)
                 cursor.execute('''
-                    UPDATE users SET eligible = 1
-                    WHERE user_id = ? AND referral_count >= 1
-                ''', (referrer_id,))
+                    SELECT u.user_id, u.referral_count, u.eligible,
+                           (SELECT COUNT(*) FROM referrals r
+                            WHERE r.campaign_id = ? AND r.referrer_id = u.user_id)
+                    FROM users u
+                    WHERE u.user_id > ?
+                    ORDER BY u.user_id
+                    LIMIT ?
+                ''', (self.campaign_id, after_user_id, chunk_size))
+                rows = cursor.fetchall()
+                
+                repairs = []
+                for user_id, referral_count, eligible, actual in rows:
+                    should_be_eligible = int(actual >= self.min_referrals)
+                    if referral_count != actual or bool(eligible) != bool(should_be_eligible):
+                        repairs.append((user_id, referral_count, actual, eligible, should_be_eligible))
                 
+                if repairs:
+                    cursor.executemany('''
+                        UPDATE users SET referral_count = ?, eligible = ? WHERE user_id = ?
+                    ''', [(new_count, new_eligible, user_id) for user_id, _, new_count, _, new_eligible in repairs])
+                    cursor.executemany('''
+                        INSERT INTO counter_repairs (campaign_id, user_id, old_count, new_count, old_eligible, new_eligible)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', [(self.campaign_id,) + repair for repair in repairs])
+                    conn.commit()
+                conn.close()
+                
+                if repairs:
+                    self._publish('referral_counts_repaired',
+                                  counts=[(user_id, new_count) for user_id, _, new_count, _, _ in repairs])
+                    logger.warning("Referral counts repaired", extra={'event': 'referral_counts_repaired',
+                                                                       'repaired': len(repairs)})
+                
+                return {
+                    'last_user_id': rows[-1][0] if len(rows) == chunk_size else None,
+                    'checked': len(rows),
+                    'repaired': len(repairs)
+                }
+            except Exception as e:
+                logger.error("Error reconciling referral counts", extra={'event': 'referral_reconcile_failed', 'error': e})
+                return None
+    
+    def get_journal_checkpoint(self) -> Optional[journal.JournalState]:
+        """Latest replay checkpoint, or None to replay from the first event"""
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute('SELECT event_id, counts, winners FROM event_checkpoints ORDER BY id DESC LIMIT 1')
+                result = cursor.fetchone()
+                conn.close()
+                return journal.JournalState.decode(*result) if result else None
+            except Exception as e:
+                logger.error("Error reading journal checkpoint", extra={'event': 'journal_checkpoint_get_failed', 'error': e})
+                return None
+    
+    def save_journal_checkpoint(self, state: journal.JournalState, keep: int = 5) -> bool:
+        """Store a replayed state so later replays start from it; older checkpoints beyond keep are dropped"""
+        counts, winners = state.encode()
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO event_checkpoints (event_id, counts, winners) VALUES (?, ?, ?)
+                ''', (state.event_id, counts, winners))
+                cursor.execute('''
+                    DELETE FROM event_checkpoints
+                    WHERE id NOT IN (SELECT id FROM event_checkpoints ORDER BY id DESC LIMIT ?)
+                ''', (keep,))
                 conn.commit()
                 conn.close()
-                logger.info(f"Referral added: {referrer_id} -> {referred_id}")
+                logger.info("Journal checkpoint saved", extra={'event': 'journal_checkpoint_saved', 'event_id': state.event_id,
+                                                               'bytes': len(counts)})
                 return True
             except Exception as e:
-                logger.error(f"Error adding referral: {e}")
+                logger.error("Error saving journal checkpoint", extra={'event': 'journal_checkpoint_save_failed', 'error': e})
                 return False
     
+    def replay_journal(self, state: Optional[journal.JournalState] = None) -> Optional[journal.JournalState]:
+        """Replay the journal into state (a fresh one replays from the first event) on a read-only connection"""
+        state = state or journal.JournalState()
+        try:
+            conn = self._read_connection()
+            try:
+                journal.replay(conn, state)
+            finally:
+                conn.close()
+            return state
+        except Exception as e:
+            logger.error("Error replaying journal", extra={'event': 'journal_replay_failed', 'error': e})
+            return None
+    
+    def rebuild_from_journal(self, state: journal.JournalState) -> Optional[dict]:
+        """
+        Overwrite referral counters and the active campaign's winners with a replayed state.
+
+        Counters go through the same set-based path as
+        recompute_referral_counts; winners are deleted and reinserted from
+        the journal in one transaction (without journaling them again).
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('CREATE TEMP TABLE referral_totals (user_id INTEGER PRIMARY KEY, referral_count INTEGER)')
+                cursor.executemany('INSERT INTO referral_totals VALUES (?, ?)', state.counts.items())
+                counts = self._apply_referral_totals(cursor)
+                
+                cursor.execute('DELETE FROM winners WHERE campaign_id = ?', (self.campaign_id,))
+                cursor.executemany('''
+                    INSERT INTO winners (campaign_id, user_id, prize_type, draw_id, selected_date)
+                    VALUES (?, ?, ?, ?, datetime(?, 'unixepoch'))
+                ''', [(self.campaign_id, user_id, prize_type, draw_id, ts)
+                      for user_id, prize_type, draw_id, ts in state.winners])
+                counts['winners'] = len(state.winners)
+                
+                conn.commit()
+                conn.close()
+                self._publish('counts_recomputed', counts=self.iter_referral_counts, edges=self.iter_referral_edges)
+                logger.info("State rebuilt from journal", extra={'event': 'journal_rebuilt', 'event_id': state.event_id, **counts})
+                return counts
+            except Exception as e:
+                logger.error("Error rebuilding from journal", extra={'event': 'journal_rebuild_failed', 'error': e})
+                return None
+    
     def get_user_by_referral_code(self, referral_code: str) -> Optional[dict]:
         """Get user by referral code"""
         with self.lock:
@@ -197,7 +1230,7 @@ class Database:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
-                    SELECT user_id, username, first_name, referral_count, eligible
+                    SELECT user_id, username, first_name, referral_count, eligible, language_code
                     FROM users WHERE referral_code = ?
                 ''', (referral_code,))
                 
@@ -210,11 +1243,12 @@ class Database:
                         'username': result[1],
                         'first_name': result[2],
                         'referral_count': result[3],
-                        'eligible': result[4]
+                        'eligible': result[4],
+                        'language_code': result[5]
                     }
                 return None
             except Exception as e:
-                logger.error(f"Error getting user by referral code: {e}")
+                logger.error("Error getting user by referral code", extra={'event': 'user_by_code_failed', 'referral_code': referral_code, 'error': e})
                 return None
     
     def get_all_participants(self) -> List[dict]:
@@ -224,10 +1258,12 @@ class Database:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    SELECT user_id, username, first_name, referral_count, phone_number
-                    FROM users WHERE eligible = 1
-                    ORDER BY referral_count DESC
+                cursor.execute(f'''
+                    WITH eligible AS ({self._eligible_source(cursor)})
+                    SELECT u.user_id, u.username, u.first_name, e.referral_count, u.phone_number
+                    FROM eligible e
+                    JOIN users u ON u.user_id = e.user_id
+                    ORDER BY e.referral_count DESC
                 ''')
                 
                 results = cursor.fetchall()
@@ -243,50 +1279,229 @@ class Database:
                         'phone_number': row[4]
                     })
                 
-                logger.info(f"Found {len(participants)} eligible participants")
+                logger.info("Eligible participants loaded", extra={'event': 'participants_loaded', 'count': len(participants)})
                 return participants
             except Exception as e:
-                logger.error(f"Error getting participants: {e}")
+                logger.error("Error getting participants", extra={'event': 'participants_failed', 'error': e})
                 return []
     
-    def update_user_info(self, user_id: int, username: str, first_name: str) -> bool:
-        """Update user's username and first_name"""
+    def update_user_phone(self, user_id: int, phone_number: str) -> bool:
+        """
+        Update user's phone number (already normalized to E.164).
+
+        The unique index on phone_e164 rejects a number that belongs to
+        another account, in which case nothing is written and False is
+        returned.
+        """
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
+                # First phone for this user moves them along the funnel
                 cursor.execute('''
-                    UPDATE users SET username = ?, first_name = ?
-                    WHERE user_id = ?
-                ''', (username, first_name, user_id))
+                    UPDATE users SET phone_number = ?, phone_e164 = ?
+                    WHERE user_id = ? AND phone_number IS NULL
+                ''', (phone_number, phone_number, user_id))
+                
+                if cursor.rowcount:
+                    self._bump_stats(cursor, phones=1)
+                else:
+                    cursor.execute('''
+                        UPDATE users SET phone_number = ?, phone_e164 = ?
+                        WHERE user_id = ?
+                    ''', (phone_number, phone_number, user_id))
                 
                 conn.commit()
                 conn.close()
+                logger.info("Phone number updated", extra={'event': 'phone_updated', 'user_id': user_id})
                 return True
+            except sqlite3.IntegrityError:
+                conn.close()
+                logger.warning("Phone number already registered", extra={'event': 'phone_duplicate', 'user_id': user_id})
+                return False
             except Exception as e:
-                logger.error(f"Error updating user info: {e}")
+                logger.error("Error updating phone number", extra={'event': 'phone_update_failed', 'user_id': user_id, 'error': e})
                 return False
     
-    def update_user_phone(self, user_id: int, phone_number: str) -> bool:
-        """Update user's phone number"""
+    def get_user_id_by_phone(self, phone_number: str) -> Optional[int]:
+        """Owner of an E.164 phone number (unique index lookup)"""
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    UPDATE users SET phone_number = ?
-                    WHERE user_id = ?
-                ''', (phone_number, user_id))
+                cursor.execute('SELECT user_id FROM users WHERE phone_e164 = ?', (phone_number,))
+                result = cursor.fetchone()
+                conn.close()
                 
-                conn.commit()
+                return result[0] if result else None
+            except Exception as e:
+                logger.error("Error getting user by phone", extra={'event': 'user_by_phone_failed', 'error': e})
+                return None
+    
+    def backfill_phone_numbers(self, normalize, chunk_size: int = 1000) -> Optional[dict]:
+        """
+        Normalize stored phone numbers and fill phone_e164 for existing users.
+
+        Walks users by user_id in chunks, each chunk in its own short
+        transaction so the bot keeps serving in between. Rows are visited in
+        user_id order, so when several accounts share a number the oldest
+        one keeps it in phone_e164; the others still get the normalized
+        phone_number (which the draw uses to give one prize per phone) and
+        are counted as duplicates. Numbers that cannot be normalized are
+        left as they are.
+        """
+        counts = {'normalized': 0, 'duplicates': 0, 'invalid': 0}
+        last_user_id = -1
+        while True:
+            with self.lock:
+                try:
+                    conn = sqlite3.connect(self.db_path)
+                    cursor = conn.cursor()
+                    
+                    cursor.execute('''
+                        SELECT user_id, phone_number FROM users
+                        WHERE user_id > ? AND phone_number IS NOT NULL AND phone_e164 IS NULL
+                        ORDER BY user_id
+                        LIMIT ?
+                    ''', (last_user_id, chunk_size))
+                    rows = cursor.fetchall()
+                    if not rows:
+                        conn.close()
+                        break
+                    last_user_id = rows[-1][0]
+                    
+                    normalized = []
+                    for user_id, phone_number in rows:
+                        phone_e164 = normalize(phone_number)
+                        if phone_e164:
+                            normalized.append((user_id, phone_e164))
+                        else:
+                            counts['invalid'] += 1
+                    
+                    # Numbers already owned by an account (or earlier in this chunk) are duplicates
+                    placeholders = ",".join("?" * len(normalized))
+                    cursor.execute(f'''
+                        SELECT phone_e164 FROM users WHERE phone_e164 IN ({placeholders})
+                    ''', [phone_e164 for _, phone_e164 in normalized])
+                    taken = {row[0] for row in cursor.fetchall()}
+                    
+                    owners = []
+                    duplicates = []
+                    for user_id, phone_e164 in normalized:
+                        if phone_e164 in taken:
+                            duplicates.append((phone_e164, user_id))
+                        else:
+                            taken.add(phone_e164)
+                            owners.append((phone_e164, phone_e164, user_id))
+                    
+                    cursor.executemany('''
+                        UPDATE users SET phone_number = ?, phone_e164 = ? WHERE user_id = ?
+                    ''', owners)
+                    cursor.executemany('''
+                        UPDATE users SET phone_number = ? WHERE user_id = ?
+                    ''', duplicates)
+                    
+                    conn.commit()
+                    conn.close()
+                    counts['normalized'] += len(owners)
+                    counts['duplicates'] += len(duplicates)
+                except Exception as e:
+                    logger.error("Error backfilling phone numbers", extra={'event': 'phone_backfill_failed', 'error': e})
+                    return None
+        
+        logger.info("Phone numbers backfilled", extra={'event': 'phone_backfill_done', **counts})
+        return counts
+    
+    def search_users(self, query: str, country_code: str = '998', limit: int = 10) -> List[dict]:
+        """
+        Find users by user_id, referral code prefix, phone prefix or name.
+
+        Matches are ranked by kind (exact user_id, referral code, phone, then
+        username/first name by FTS5 bm25) and each kind is a single index
+        lookup or range scan, so the cost does not grow with the user count.
+        """
+        text = query.strip()
+        if not text:
+            return []
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                matches = {}
+                
+                def collect(kind, rows):
+                    for row in rows:
+                        matches.setdefault(row[0], kind)
+                
+                compact = re.sub(r'[\s\-()]', '', text)
+                digits = compact[1:] if compact.startswith('+') else compact
+                if digits.isdigit():
+                    if not compact.startswith('+'):
+                        cursor.execute('SELECT user_id FROM users WHERE user_id = ?', (int(digits),))
+                        collect('id', cursor.fetchall())
+                        prefixes = ['+' + digits, '+' + country_code + digits]
+                    else:
+                        prefixes = ['+' + digits]
+                    for prefix in prefixes:
+                        # Phone numbers are digits, and ':' sorts right after '9'
+                        cursor.execute('''
+                            SELECT user_id FROM users
+                            WHERE phone_number >= ? AND phone_number < ?
+                            ORDER BY phone_number LIMIT ?
+                        ''', (prefix, prefix + ':', limit))
+                        collect('phone', cursor.fetchall())
+                
+                if text.lower().startswith('ref_'):
+                    cursor.execute('''
+                        SELECT user_id FROM users
+                        WHERE referral_code >= ? AND referral_code < ?
+                        ORDER BY referral_code LIMIT ?
+                    ''', (text, text + '\x7f', limit))
+                    collect('code', cursor.fetchall())
+                
+                tokens = re.findall(r'\w+', text)
+                if tokens:
+                    # Every token is a quoted prefix term, so user input can't inject FTS syntax
+                    match = ' '.join('"' + token.replace('"', '""') + '"*' for token in tokens)
+                    # bm25 is only computed for the first few hundred hits, so a
+                    # common name costs the same as a rare one
+                    cursor.execute('''
+                        SELECT rowid FROM (
+                            SELECT rowid, rank FROM users_fts WHERE users_fts MATCH ? LIMIT ?
+                        )
+                        ORDER BY rank LIMIT ?
+                    ''', (match, SEARCH_CANDIDATES, limit))
+                    collect('name', cursor.fetchall())
+                
+                user_ids = list(matches)[:limit]
+                if not user_ids:
+                    conn.close()
+                    return []
+                
+                placeholders = ",".join("?" * len(user_ids))
+                cursor.execute(f'''
+                    SELECT user_id, username, first_name, referral_count, eligible, phone_number, referral_code
+                    FROM users WHERE user_id IN ({placeholders})
+                ''', user_ids)
+                rows = {row[0]: row for row in cursor.fetchall()}
                 conn.close()
-                logger.info(f"Phone number updated for user {user_id}")
-                return True
+                
+                return [{
+                    'user_id': user_id,
+                    'username': rows[user_id][1],
+                    'first_name': rows[user_id][2],
+                    'referral_count': rows[user_id][3],
+                    'eligible': rows[user_id][4],
+                    'phone_number': rows[user_id][5],
+                    'referral_code': rows[user_id][6],
+                    'match': matches[user_id]
+                } for user_id in user_ids if user_id in rows]
             except Exception as e:
-                logger.error(f"Error updating phone number: {e}")
-                return False
+                logger.error("Error searching users", extra={'event': 'user_search_failed', 'error': e})
+                return []
     
     def add_admin(self, admin_id: int, username: str) -> bool:
         """Add admin to database"""
@@ -302,10 +1517,10 @@ class Database:
                 
                 conn.commit()
                 conn.close()
-                logger.info(f"Admin {admin_id} added successfully")
+                logger.info("Admin added successfully", extra={'event': 'admin_added', 'admin_id': admin_id})
                 return True
             except Exception as e:
-                logger.error(f"Error adding admin: {e}")
+                logger.error("Error adding admin", extra={'event': 'admin_add_failed', 'admin_id': admin_id, 'error': e})
                 return False
     
     def is_admin(self, user_id: int) -> bool:
@@ -321,27 +1536,28 @@ class Database:
                 
                 return result
             except Exception as e:
-                logger.error(f"Error checking admin status: {e}")
+                logger.error("Error checking admin status", extra={'event': 'admin_check_failed', 'user_id': user_id, 'error': e})
                 return False
     
-    def set_quiz_date(self, quiz_date: str) -> bool:
-        """Set quiz date"""
+    def set_quiz_date(self, quiz_date: str, cutoff_ts: Optional[int] = None) -> bool:
+        """Set quiz date and its eligibility cutoff; drops any earlier snapshot"""
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
                 cursor.execute('''
-                    INSERT OR REPLACE INTO quiz_settings (id, quiz_date)
-                    VALUES (1, ?)
-                ''', (quiz_date,))
+                    UPDATE campaigns SET quiz_date = ?, cutoff_ts = ?, snapshot_ts = NULL
+                    WHERE id = ?
+                ''', (quiz_date, cutoff_ts, self.campaign_id))
+                cursor.execute('DROP TABLE IF EXISTS eligible_snapshot')
                 
                 conn.commit()
                 conn.close()
-                logger.info(f"Quiz date set to: {quiz_date}")
+                logger.info("Quiz date set", extra={'event': 'quiz_date_set', 'quiz_date': quiz_date})
                 return True
             except Exception as e:
-                logger.error(f"Error setting quiz date: {e}")
+                logger.error("Error setting quiz date", extra={'event': 'quiz_date_set_failed', 'error': e})
                 return False
     
     def get_quiz_date(self) -> Optional[str]:
@@ -351,163 +1567,853 @@ class Database:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
-                cursor.execute('SELECT quiz_date FROM quiz_settings WHERE id = 1')
+                cursor.execute('SELECT quiz_date FROM campaigns WHERE id = ?', (self.campaign_id,))
                 result = cursor.fetchone()
                 conn.close()
                 
                 return result[0] if result else None
             except Exception as e:
-                logger.error(f"Error getting quiz date: {e}")
+                logger.error("Error getting quiz date", extra={'event': 'quiz_date_get_failed', 'error': e})
                 return None
     
-    def add_winner(self, user_id: int, prize_type: str) -> bool:
-        """Add winner to database"""
+    def set_conversation_state(self, user_id: int, state: int) -> bool:
+        """Store a user's conversation state; state 0 (idle) deletes the row"""
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    INSERT INTO winners (user_id, prize_type)
-                    VALUES (?, ?)
-                ''', (user_id, prize_type))
+                if state:
+                    cursor.execute('''
+                        INSERT INTO conversation_states (user_id, state, updated_ts)
+                        VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+                        ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, updated_ts = excluded.updated_ts
+                    ''', (user_id, state))
+                else:
+                    cursor.execute('DELETE FROM conversation_states WHERE user_id = ?', (user_id,))
                 
                 conn.commit()
                 conn.close()
-                logger.info(f"Winner added: {user_id} - {prize_type}")
                 return True
             except Exception as e:
-                logger.error(f"Error adding winner: {e}")
+                logger.error("Error saving conversation state", extra={'event': 'conversation_state_failed', 'user_id': user_id, 'state': state, 'error': e})
                 return False
     
-    def get_winners(self) -> List[dict]:
-        """Get all winners"""
+    def enqueue_outbox(self, chat_id: int, text: str, kind: Optional[str] = None) -> bool:
+        """Keep a message for sending once the Bot API is reachable again"""
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
                 cursor.execute('''
-                    SELECT w.user_id, u.username, u.first_name, w.prize_type, w.selected_date
-                    FROM winners w
-                    JOIN users u ON w.user_id = u.user_id
-                    ORDER BY w.selected_date DESC
-                ''')
+                    INSERT INTO outbox (chat_id, text, kind, created_ts) VALUES (?, ?, ?, ?)
+                ''', (chat_id, text, kind, int(time.time())))
                 
-                results = cursor.fetchall()
+                conn.commit()
                 conn.close()
-                
-                winners = []
+                return True
+            except Exception as e:
+                logger.error("Error queueing outbox message", extra={'event': 'outbox_enqueue_failed', 'chat_id': chat_id, 'error': e})
+                return False
+    
+    def next_outbox_batch(self, limit: int, ttl: int) -> Optional[List[dict]]:
+        """
+        Oldest queued messages, after dropping those queued more than ttl
+        seconds ago: a "your friend joined" note a day late is noise.
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('DELETE FROM outbox WHERE created_ts < ?', (int(time.time()) - ttl,))
+                expired = cursor.rowcount
+                cursor.execute('''
+                    SELECT id, chat_id, text, kind FROM outbox ORDER BY id LIMIT ?
+                ''', (limit,))
+                rows = cursor.fetchall()
+                
+                conn.commit()
+                conn.close()
+                if expired:
+                    logger.info("Expired outbox messages dropped", extra={'event': 'outbox_expired', 'messages': expired})
+                return [{'id': row[0], 'chat_id': row[1], 'text': row[2], 'kind': row[3]} for row in rows]
+            except Exception as e:
+                logger.error("Error reading outbox", extra={'event': 'outbox_read_failed', 'error': e})
+                return None
+    
+    def delete_outbox(self, message_ids: List[int]) -> bool:
+        """Remove sent (or undeliverable) messages from the outbox"""
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.executemany('DELETE FROM outbox WHERE id = ?', [(message_id,) for message_id in message_ids])
+                
+                conn.commit()
+                conn.close()
+                return True
+            except Exception as e:
+                logger.error("Error deleting outbox messages", extra={'event': 'outbox_delete_failed', 'error': e})
+                return False
+    
+    def count_outbox(self) -> int:
+        """Number of queued messages"""
+        conn = self._read_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM outbox')
+            return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error("Error counting outbox", extra={'event': 'outbox_count_failed', 'error': e})
+            return 0
+        finally:
+            conn.close()
+    
+    def get_stats(self, hours: int = 24, days: int = 7, top: int = 10) -> Optional[dict]:
+        """
+        Read the analytics rollups of the active campaign.
+
+        Every query is a primary-key or index range scan bounded by the
+        requested window, so the cost does not depend on table sizes.
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                now = int(time.time())
+                
+                cursor.execute('''
+                    SELECT starts, phones, joins, referrals, eligible
+                    FROM stats_totals WHERE campaign_id = ?
+                ''', (self.campaign_id,))
+                result = cursor.fetchone() or (0, 0, 0, 0, 0)
+                totals = dict(zip(STATS_COLUMNS, result))
+                
+                cursor.execute('''
+                    SELECT bucket, referrals FROM stats_hourly
+                    WHERE campaign_id = ? AND bucket > ?
+                    ORDER BY bucket
+                ''', (self.campaign_id, now - hours * 3600))
+                hourly = cursor.fetchall()
+                
+                cursor.execute('''
+                    SELECT bucket, referrals FROM stats_daily
+                    WHERE campaign_id = ? AND bucket > ?
+                    ORDER BY bucket
+                ''', (self.campaign_id, now - days * 86400))
+                daily = cursor.fetchall()
+                
+                cursor.execute('''
+                    SELECT s.referrer_id, u.username, u.first_name, s.referrals
+                    FROM stats_referrers s
+                    LEFT JOIN users u ON u.user_id = s.referrer_id
+                    WHERE s.campaign_id = ?
+                    ORDER BY s.referrals DESC
+                    LIMIT ?
+                ''', (self.campaign_id, top))
+                top_referrers = [
+                    {'user_id': row[0], 'username': row[1], 'first_name': row[2], 'referrals': row[3]}
+                    for row in cursor.fetchall()
+                ]
+                
+                cursor.execute('''
+                    SELECT COUNT(*),
+                           SUM(created_date <= datetime('now', ?)),
+                           CAST(strftime('%s', 'now') - strftime('%s', MIN(created_date)) AS INTEGER)
+                    FROM pending_referrals WHERE campaign_id = ?
+                ''', (self._pending_age(), self.campaign_id))
+                count, expired, oldest_age = cursor.fetchone()
+                pending = {'count': count, 'expired': expired or 0, 'oldest_age': oldest_age}
+                
+                conn.close()
+                
+                return {
+                    'totals': totals,
+                    'hourly': hourly,
+                    'daily': daily,
+                    'top_referrers': top_referrers,
+                    'pending': pending
+                }
+            except Exception as e:
+                logger.error("Error getting stats", extra={'event': 'stats_get_failed', 'error': e})
+                return None
+    
+    def start_campaign(self, name: str) -> Optional[int]:
+        """
+        Archive the active campaign and start a new one.
+
+        In one transaction the finished campaign's per-user results,
+        referrals, winners and draw snapshots are moved to the *_archive cold
+        tables, its pending referrals and cutoff snapshot are dropped, and the
+        users counters are reset set-based. Returns the new campaign id.
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                old_campaign_id = self.campaign_id
+                
+                cursor.execute('''
+                    INSERT INTO campaign_results_archive (campaign_id, user_id, referral_count, eligible)
+                    SELECT ?, user_id, referral_count, eligible FROM users
+                    WHERE referral_count > 0 OR eligible = 1
+                ''', (old_campaign_id,))
+                
+                cursor.execute('''
+                    INSERT INTO referrals_archive (id, campaign_id, referrer_id, referred_id, date)
+                    SELECT id, campaign_id, referrer_id, referred_id, date FROM referrals
+                    WHERE campaign_id = ?
+                ''', (old_campaign_id,))
+                referral_count = cursor.rowcount
+                cursor.execute('DELETE FROM referrals WHERE campaign_id = ?', (old_campaign_id,))
+                
+                cursor.execute('''
+                    INSERT INTO winners_archive (id, campaign_id, user_id, prize_type, selected_date, draw_id)
+                    SELECT id, campaign_id, user_id, prize_type, selected_date, draw_id FROM winners
+                    WHERE campaign_id = ?
+                ''', (old_campaign_id,))
+                cursor.execute('DELETE FROM winners WHERE campaign_id = ?', (old_campaign_id,))
+                
+                cursor.execute('''
+                    INSERT INTO draw_entries_archive (draw_id, position, user_id, weight)
+                    SELECT e.draw_id, e.position, e.user_id, e.weight FROM draw_entries e
+                    WHERE e.draw_id IN (SELECT id FROM draws WHERE campaign_id = ?)
+                ''', (old_campaign_id,))
+                cursor.execute('''
+                    DELETE FROM draw_entries
+                    WHERE draw_id IN (SELECT id FROM draws WHERE campaign_id = ?)
+                ''', (old_campaign_id,))
+                
+                cursor.execute('DELETE FROM pending_referrals WHERE campaign_id = ?', (old_campaign_id,))
+                cursor.execute('DROP TABLE IF EXISTS eligible_snapshot')
+                
+                cursor.execute('SELECT COUNT(*) FROM users WHERE eligible = 1')
+                participant_count = cursor.fetchone()[0]
+                cursor.execute('''
+                    UPDATE users SET referral_count = 0, eligible = 0
+                    WHERE referral_count <> 0 OR eligible <> 0
+                ''')
+                
+                cursor.execute('''
+                    UPDATE campaigns SET status = 'archived', participant_count = ?, referral_count = ?,
+                                         archived_date = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (participant_count, referral_count, old_campaign_id))
+                cursor.execute('INSERT INTO campaigns (name, min_referrals) VALUES (?, ?)', (name, self.min_referrals))
+                new_campaign_id = cursor.lastrowid
+                cursor.execute('INSERT INTO stats_totals (campaign_id) VALUES (?)', (new_campaign_id,))
+                self._journal(cursor, journal.CAMPAIGN_STARTED, new_campaign_id)
+                
+                conn.commit()
+                conn.close()
+                self.campaign_id = new_campaign_id
+                self._publish('counters_reset', campaign_id=new_campaign_id)
+                logger.info("Campaign started", extra={'event': 'campaign_started', 'campaign_id': new_campaign_id,
+                                                       'archived_campaign_id': old_campaign_id})
+                return new_campaign_id
+            except Exception as e:
+                logger.error("Error starting campaign", extra={'event': 'campaign_start_failed', 'error': e})
+                return None
+    
+    def get_campaigns(self) -> List[dict]:
+        """Get all campaigns, newest first"""
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT id, name, quiz_date, status, participant_count, referral_count, created_date, archived_date
+                    FROM campaigns
+                    ORDER BY id DESC
+                ''')
+                
+                results = cursor.fetchall()
+                conn.close()
+                
+                campaigns = []
                 for row in results:
-                    winners.append({
-                        'user_id': row[0],
-                        'username': row[1],
-                        'first_name': row[2],
-                        'prize_type': row[3],
-                        'selected_date': row[4]
+                    campaigns.append({
+                        'campaign_id': row[0],
+                        'name': row[1],
+                        'quiz_date': row[2],
+                        'status': row[3],
+                        'participant_count': row[4],
+                        'referral_count': row[5],
+                        'created_date': row[6],
+                        'archived_date': row[7]
                     })
                 
-                return winners
+                return campaigns
             except Exception as e:
-                logger.error(f"Error getting winners: {e}")
+                logger.error("Error getting campaigns", extra={'event': 'campaigns_get_failed', 'error': e})
                 return []
     
-    def add_pending_referral(self, referral_code: str, referrer_id: int) -> bool:
-        """Add pending referral for group joins"""
+    def get_cutoff(self) -> Optional[dict]:
+        """Get the quiz cutoff timestamp and whether its snapshot was taken"""
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
-                # Check if pending referral already exists
-                cursor.execute('''
-                    SELECT COUNT(*) FROM pending_referrals 
-                    WHERE referral_code = ? AND referrer_id = ?
-                ''', (referral_code, referrer_id))
+                cursor.execute('SELECT quiz_date, cutoff_ts, snapshot_ts FROM campaigns WHERE id = ?', (self.campaign_id,))
+                result = cursor.fetchone()
+                conn.close()
+                
+                if result and result[1]:
+                    return {
+                        'quiz_date': result[0],
+                        'cutoff_ts': result[1],
+                        'snapshot_ts': result[2]
+                    }
+                return None
+            except Exception as e:
+                logger.error("Error getting cutoff", extra={'event': 'cutoff_get_failed', 'error': e})
+                return None
+    
+    def take_eligibility_snapshot(self, cutoff_ts: int) -> Optional[int]:
+        """
+        Freeze the eligible set into the read-only eligible_snapshot table.
+
+        Copies all eligible users in one INSERT ... SELECT inside a single
+        transaction. Does nothing if the cutoff was changed in the meantime or
+        the snapshot already exists. Returns the number of frozen participants.
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
                 
-                if cursor.fetchone()[0] > 0:
+                cursor.execute('SELECT cutoff_ts, snapshot_ts FROM campaigns WHERE id = ?', (self.campaign_id,))
+                result = cursor.fetchone()
+                if not result or result[0] != cutoff_ts or result[1]:
                     conn.close()
-                    logger.info(f"Pending referral already exists: {referral_code}")
-                    return True
+                    return None
                 
+                cursor.execute('DROP TABLE IF EXISTS eligible_snapshot')
                 cursor.execute('''
-                    INSERT INTO pending_referrals (referral_code, referrer_id)
-                    VALUES (?, ?)
-                ''', (referral_code, referrer_id))
+                    CREATE TABLE eligible_snapshot (
+                        user_id INTEGER PRIMARY KEY,
+                        referral_count INTEGER NOT NULL
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('''
+                    INSERT INTO eligible_snapshot (user_id, referral_count)
+                    SELECT user_id, referral_count FROM users WHERE eligible = 1
+                ''')
+                participant_count = cursor.rowcount
+                
+                cursor.execute('''
+                    CREATE INDEX idx_eligible_snapshot_count
+                    ON eligible_snapshot (referral_count DESC, user_id)
+                ''')
+                
+                # The snapshot is read-only: it is only ever replaced as a whole
+                cursor.execute('''
+                    CREATE TRIGGER eligible_snapshot_no_update BEFORE UPDATE ON eligible_snapshot
+                    BEGIN SELECT RAISE(ABORT, 'eligible_snapshot is read-only'); END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER eligible_snapshot_no_delete BEFORE DELETE ON eligible_snapshot
+                    BEGIN SELECT RAISE(ABORT, 'eligible_snapshot is read-only'); END
+                ''')
+                
+                cursor.execute('''
+                    UPDATE campaigns SET snapshot_ts = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE id = ?
+                ''', (self.campaign_id,))
                 
                 conn.commit()
                 conn.close()
-                logger.info(f"Pending referral added: {referral_code} -> {referrer_id}")
+                logger.info("Eligibility snapshot taken", extra={'event': 'snapshot_taken', 'count': participant_count})
+                return participant_count
+            except Exception as e:
+                logger.error("Error taking eligibility snapshot", extra={'event': 'snapshot_failed', 'error': e})
+                return None
+    
+    def add_winner(self, user_id: int, prize_type: str) -> bool:
+        """Add winner to database"""
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO winners (campaign_id, user_id, prize_type)
+                    VALUES (?, ?, ?)
+                ''', (self.campaign_id, user_id, prize_type))
+                self._journal(cursor, journal.WINNER_CHOSEN, user_id, info=prize_type)
+                
+                conn.commit()
+                conn.close()
+                logger.info("Winner added", extra={'event': 'winner_added', 'user_id': user_id, 'prize_type': prize_type})
                 return True
             except Exception as e:
-                logger.error(f"Error adding pending referral: {e}")
+                logger.error("Error adding winner", extra={'event': 'winner_add_failed', 'user_id': user_id, 'error': e})
                 return False
     
-    def get_pending_referral(self, referral_code: str) -> Optional[dict]:
-        """Get pending referral by code"""
+    def create_draw(self, seed: str, seed_hash: str, algorithm: str) -> Optional[dict]:
+        """
+        Create a draw and freeze its eligible set as an ordered snapshot.
+
+        The snapshot is copied set-based into draw_entries (ordered by user_id)
+        in the same transaction that creates the draw row, so later referrals
+        cannot change who takes part.
+        """
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
                 cursor.execute('''
-                    SELECT referrer_id FROM pending_referrals 
-                    WHERE referral_code = ?
-                ''', (referral_code,))
+                    INSERT INTO draws (campaign_id, seed, seed_hash, algorithm, status)
+                    VALUES (?, ?, ?, ?, 'committed')
+                ''', (self.campaign_id, seed, seed_hash, algorithm))
+                draw_id = cursor.lastrowid
                 
-                result = cursor.fetchone()
-                conn.close()
+                # At most one prize per phone: each number enters once (its account
+                # with the most referrals) and numbers that already won are left out
+                cursor.execute(f'''
+                    INSERT INTO draw_entries (draw_id, position, user_id, weight)
+                    WITH eligible AS ({self._eligible_source(cursor)}),
+                    candidates AS (
+                        SELECT e.user_id, e.referral_count,
+                               ROW_NUMBER() OVER (
+                                   PARTITION BY COALESCE(u.phone_number, '#' || e.user_id)
+                                   ORDER BY e.referral_count DESC, e.user_id
+                               ) AS phone_rank
+                        FROM eligible e
+                        JOIN users u ON u.user_id = e.user_id
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM winners w
+                            JOIN users wu ON wu.user_id = w.user_id
+                            WHERE w.campaign_id = ?
+                              AND (w.user_id = e.user_id OR wu.phone_number = u.phone_number)
+                        )
+                    )
+                    SELECT ?, ROW_NUMBER() OVER (ORDER BY user_id), user_id, referral_count
+                    FROM candidates
+                    WHERE phone_rank = 1
+                ''', (self.campaign_id, draw_id))
                 
-                if result:
-                    return {'referrer_id': result[0]}
-                return None
+                participant_count = cursor.rowcount
+                
+                cursor.execute('''
+                    UPDATE draws SET participant_count = ? WHERE id = ?
+                ''', (participant_count, draw_id))
+                
+                conn.commit()
+                conn.close()
+                logger.info("Draw created", extra={'event': 'draw_created', 'draw_id': draw_id,
+                                                   'participants': participant_count})
+                return {'draw_id': draw_id, 'participant_count': participant_count}
             except Exception as e:
-                logger.error(f"Error getting pending referral: {e}")
+                logger.error("Error creating draw", extra={'event': 'draw_create_failed', 'error': e})
                 return None
     
-    def remove_pending_referral(self, referral_code: str) -> bool:
-        """Remove processed pending referral"""
+    def iter_draw_entries(self, draw_id: int, chunk_size: int = 10000) -> Iterator[Tuple[int, int, int]]:
+        """Stream (position, user_id, weight) of a draw snapshot in position order"""
+        conn = self._read_connection()
+        try:
+            cursor = conn.cursor()
+            # Draws of archived campaigns live in the cold table
+            cursor.execute('''
+                SELECT position, user_id, weight FROM draw_entries WHERE draw_id = ?
+                UNION ALL
+                SELECT position, user_id, weight FROM draw_entries_archive WHERE draw_id = ?
+                ORDER BY position
+            ''', (draw_id, draw_id))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def set_draw_digest(self, draw_id: int, snapshot_digest: str) -> bool:
+        """Store the digest of a frozen draw snapshot"""
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
                 cursor.execute('''
-                    DELETE FROM pending_referrals WHERE referral_code = ?
-                ''', (referral_code,))
+                    UPDATE draws SET snapshot_digest = ? WHERE id = ?
+                ''', (snapshot_digest, draw_id))
                 
                 conn.commit()
                 conn.close()
                 return True
             except Exception as e:
-                logger.error(f"Error removing pending referral: {e}")
+                logger.error("Error storing draw digest", extra={'event': 'draw_digest_failed', 'draw_id': draw_id, 'error': e})
                 return False
     
-    def get_all_pending_referrals(self) -> List[dict]:
-        """Get all pending referrals ordered by newest first"""
+    def complete_draw(self, draw_id: int, winners: List[Tuple[int, str]]) -> bool:
+        """Record the winners of a draw and mark it completed in a single transaction"""
         with self.lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
                 
+                cursor.executemany('''
+                    INSERT INTO winners (campaign_id, user_id, prize_type, draw_id)
+                    VALUES (?, ?, ?, ?)
+                ''', [(self.campaign_id, user_id, prize_type, draw_id) for user_id, prize_type in winners])
+                for user_id, prize_type in winners:
+                    self._journal(cursor, journal.WINNER_CHOSEN, user_id, draw_id, prize_type)
+                
                 cursor.execute('''
-                    SELECT referral_code, referrer_id, created_date 
-                    FROM pending_referrals 
-                    ORDER BY created_date DESC
-                ''')
+                    UPDATE draws SET status = 'completed', winners = ?, completed_date = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (",".join(str(user_id) for user_id, _ in winners), draw_id))
+                
+                conn.commit()
+                conn.close()
+                logger.info("Draw completed", extra={'event': 'draw_completed', 'draw_id': draw_id, 'count': len(winners)})
+                return True
+            except Exception as e:
+                logger.error("Error completing draw", extra={'event': 'draw_complete_failed', 'draw_id': draw_id, 'error': e})
+                return False
+    
+    def cancel_draw(self, draw_id: int) -> bool:
+        """Cancel a committed draw and drop its snapshot"""
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('DELETE FROM draw_entries WHERE draw_id = ?', (draw_id,))
+                cursor.execute('''
+                    UPDATE draws SET status = 'cancelled' WHERE id = ? AND status = 'committed'
+                ''', (draw_id,))
+                
+                conn.commit()
+                conn.close()
+                return True
+            except Exception as e:
+                logger.error("Error cancelling draw", extra={'event': 'draw_cancel_failed', 'draw_id': draw_id, 'error': e})
+                return False
+    
+    def get_draw(self, draw_id: int) -> Optional[dict]:
+        """Get a draw record by id"""
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT id, seed, seed_hash, snapshot_digest, algorithm, participant_count,
+                           winners, status, created_date, completed_date
+                    FROM draws WHERE id = ?
+                ''', (draw_id,))
+                
+                result = cursor.fetchone()
+                conn.close()
+                
+                if result:
+                    return {
+                        'draw_id': result[0],
+                        'seed': result[1],
+                        'seed_hash': result[2],
+                        'snapshot_digest': result[3],
+                        'algorithm': result[4],
+                        'participant_count': result[5],
+                        'winners': [int(user_id) for user_id in result[6].split(",")] if result[6] else [],
+                        'status': result[7],
+                        'created_date': result[8],
+                        'completed_date': result[9]
+                    }
+                return None
+            except Exception as e:
+                logger.error("Error getting draw", extra={'event': 'draw_get_failed', 'draw_id': draw_id, 'error': e})
+                return None
+    
+    def iter_referral_counts(self, chunk_size: int = 10000) -> Iterator[Tuple[int, int]]:
+        """Stream (user_id, referral_count) of all users"""
+        conn = self._read_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT user_id, referral_count FROM users')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def iter_conversation_states(self, chunk_size: int = 10000) -> Iterator[Tuple[int, int]]:
+        """Stream (user_id, state) of users who are not idle"""
+        conn = self._read_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT user_id, state FROM conversation_states')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def iter_referral_edges(self, chunk_size: int = 10000) -> Iterator[Tuple[int, int, Optional[int]]]:
+        """Stream (referrer_id, referred_id, referred user's join time) for the current campaign"""
+        conn = self._read_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT r.referrer_id, r.referred_id,
+                       CAST(strftime('%s', COALESCE(u.join_date, r.date)) AS INTEGER)
+                FROM referrals r
+                LEFT JOIN users u ON u.user_id = r.referred_id
+                WHERE r.campaign_id = ?
+            ''', (self.campaign_id,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def _export_query(self, cursor, kind: str) -> Tuple[str, tuple]:
+        """SQL and parameters for one /export kind"""
+        if kind == 'users':
+            return '''
+                SELECT user_id, username, first_name, phone_number, referral_code,
+                       referral_count, eligible, join_date
+                FROM users ORDER BY user_id
+            ''', ()
+        if kind == 'referrals':
+            return '''
+                SELECT referrer_id, referred_id, date
+                FROM referrals WHERE campaign_id = ? ORDER BY id
+            ''', (self.campaign_id,)
+        if kind == 'participants':
+            return f'''
+                WITH eligible AS ({self._eligible_source(cursor)})
+                SELECT u.user_id, u.username, u.first_name, u.phone_number, e.referral_count
+                FROM eligible e
+                JOIN users u ON u.user_id = e.user_id
+                ORDER BY u.user_id
+            ''', ()
+        if kind == 'winners':
+            return '''
+                SELECT w.draw_id, w.prize_type, w.user_id, u.username, u.first_name,
+                       u.phone_number, u.referral_count, w.selected_date
+                FROM winners w
+                LEFT JOIN users u ON u.user_id = w.user_id
+                WHERE w.campaign_id = ?
+                ORDER BY w.id
+            ''', (self.campaign_id,)
+        raise ValueError(f"Unknown export kind: {kind}")
+    
+    def count_export_rows(self, kind: str) -> Optional[int]:
+        """Number of rows iter_export will stream, for progress reporting"""
+        conn = self._read_connection()
+        try:
+            cursor = conn.cursor()
+            sql, params = self._export_query(cursor, kind)
+            cursor.execute(f'SELECT COUNT(*) FROM ({sql})', params)
+            return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error("Error counting export rows", extra={'event': 'export_count_failed', 'kind': kind, 'error': e})
+            return None
+        finally:
+            conn.close()
+    
+    def iter_export(self, kind: str, chunk_size: int = 5000) -> Iterator[tuple]:
+        """
+        Stream an export from a read-only cursor: the column names first,
+        then the rows, fetched chunk_size at a time.
+        """
+        conn = self._read_connection()
+        try:
+            cursor = conn.cursor()
+            sql, params = self._export_query(cursor, kind)
+            cursor.execute(sql, params)
+            yield tuple(column[0] for column in cursor.description)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def get_users_by_ids(self, user_ids: List[int]) -> List[dict]:
+        """Get participant details for the given users, preserving the given order"""
+        if not user_ids:
+            return []
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                placeholders = ",".join("?" * len(user_ids))
+                cursor.execute(f'''
+                    SELECT user_id, username, first_name, referral_count, phone_number
+                    FROM users WHERE user_id IN ({placeholders})
+                ''', user_ids)
+                
+                results = cursor.fetchall()
+                conn.close()
+                
+                users = {}
+                for row in results:
+                    users[row[0]] = {
+                        'user_id': row[0],
+                        'username': row[1],
+                        'first_name': row[2],
+                        'referral_count': row[3],
+                        'phone_number': row[4]
+                    }
+                
+                return [users[user_id] for user_id in user_ids if user_id in users]
+            except Exception as e:
+                logger.error("Error getting users by ids", extra={'event': 'users_by_ids_failed', 'error': e})
+                return []
+    
+    def get_winners(self) -> List[dict]:
+        """Get all winners"""
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT w.user_id, u.username, u.first_name, w.prize_type, w.selected_date
+                    FROM winners w
+                    JOIN users u ON w.user_id = u.user_id
+                    WHERE w.campaign_id = ?
+                    ORDER BY w.selected_date DESC
+                ''', (self.campaign_id,))
                 
                 results = cursor.fetchall()
                 conn.close()
                 
-                pending_referrals = []
+                winners = []
                 for row in results:
-                    pending_referrals.append({
-                        'referral_code': row[0],
-                        'referrer_id': row[1],
-                        'created_date': row[2]
+                    winners.append({
+                        'user_id': row[0],
+                        'username': row[1],
+                        'first_name': row[2],
+                        'prize_type': row[3],
+                        'selected_date': row[4]
                     })
                 
-                return pending_referrals
+                return winners
             except Exception as e:
-                logger.error(f"Error getting pending referrals: {e}")
+                logger.error("Error getting winners", extra={'event': 'winners_get_failed', 'error': e})
                 return []
+    
+    def _pending_age(self) -> str:
+        """SQLite datetime() modifier for the oldest unexpired pending referral"""
+        return f'-{int(self.pending_ttl)} seconds'
+    
+    def add_pending_referral(self, referral_code: str, referrer_id: int) -> bool:
+        """
+        Add pending referral for group joins.
+
+        Opening the invite screen again refreshes the entry, so it expires
+        pending_ttl seconds after the user last shared their link.
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    UPDATE pending_referrals SET created_date = CURRENT_TIMESTAMP
+                    WHERE campaign_id = ? AND referral_code = ? AND referrer_id = ?
+                ''', (self.campaign_id, referral_code, referrer_id))
+                
+                if cursor.rowcount == 0:
+                    cursor.execute('''
+                        INSERT INTO pending_referrals (campaign_id, referral_code, referrer_id)
+                        VALUES (?, ?, ?)
+                    ''', (self.campaign_id, referral_code, referrer_id))
+                    logger.info("Pending referral added", extra={'event': 'pending_referral_added', 'referral_code': referral_code, 'referrer_id': referrer_id})
+                
+                conn.commit()
+                conn.close()
+                return True
+            except Exception as e:
+                logger.error("Error adding pending referral", extra={'event': 'pending_referral_add_failed', 'referral_code': referral_code, 'error': e})
+                return False
+    
+    def get_pending_referral(self, referral_code: str) -> Optional[dict]:
+        """Get unexpired pending referral by code"""
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT referrer_id FROM pending_referrals 
+                    WHERE campaign_id = ? AND referral_code = ? AND created_date > datetime('now', ?)
+                ''', (self.campaign_id, referral_code, self._pending_age()))
+                
+                result = cursor.fetchone()
+                conn.close()
+                
+                if result:
+                    return {'referrer_id': result[0]}
+                return None
+            except Exception as e:
+                logger.error("Error getting pending referral", extra={'event': 'pending_referral_get_failed', 'referral_code': referral_code, 'error': e})
+                return None
+    
+    def compact_pending_referrals(self, batch_size: int = 1000, max_batches: int = 50) -> Optional[dict]:
+        """
+        Delete expired pending referrals in bounded batches, then reclaim pages.
+
+        Every batch is its own short transaction under the lock, so joins and
+        invite screens interleave with a large cleanup. Freed pages are given
+        back with PRAGMA incremental_vacuum. Returns the rows deleted, whether
+        expired rows are left over for the next run and the pages freed.
+        """
+        deleted = 0
+        remaining = False
+        try:
+            for _ in range(max_batches):
+                with self.lock:
+                    conn = sqlite3.connect(self.db_path)
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        DELETE FROM pending_referrals WHERE id IN (
+                            SELECT id FROM pending_referrals
+                            WHERE created_date <= datetime('now', ?)
+                            LIMIT ?
+                        )
+                    ''', (self._pending_age(), batch_size))
+                    batch = cursor.rowcount
+                    conn.commit()
+                    conn.close()
+                deleted += batch
+                if batch < batch_size:
+                    break
+            else:
+                remaining = True
+            
+            freed_pages = 0
+            if deleted:
+                with self.lock:
+                    conn = sqlite3.connect(self.db_path)
+                    cursor = conn.cursor()
+                    cursor.execute('PRAGMA freelist_count')
+                    freed_pages = cursor.fetchone()[0]
+                    # executescript steps the pragma to completion; execute() frees one page
+                    conn.executescript('PRAGMA incremental_vacuum')
+                    conn.close()
+                logger.info("Expired pending referrals compacted", extra={'event': 'pending_referrals_compacted',
+                                                                          'deleted': deleted, 'freed_pages': freed_pages})
+            
+            return {'deleted': deleted, 'remaining': remaining, 'freed_pages': freed_pages}
+        except Exception as e:
+            logger.error("Error compacting pending referrals", extra={'event': 'pending_referrals_compact_failed', 'error': e})
+            return None
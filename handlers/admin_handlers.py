@@ -3,18 +3,42 @@ Admin handlers for the Quiz Bot
 Handles admin commands and functionality
 """
 
+import asyncio
 import logging
-import random
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
 from utils.messages import Messages
+from utils.draw_utils import DrawEngine, PRIZES
+from utils.date_utils import parse_quiz_date
+from utils.referral_graph import report_user_ids
+from utils.callback_router import callback_data
+from utils.conversation import IDLE
+from utils.http_pools import bulk_traffic
+from utils.export_utils import EXPORT_FORMATS, EXPORT_KINDS, ExportProgress, gzip_file, write_csv, write_xlsx, xlsx_available
+from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Seconds between progress edits while an export is being written
+EXPORT_PROGRESS_INTERVAL = 3
+EXPORT_UPLOAD_LIMIT = 45 * 1024 * 1024
+
 class AdminHandlers:
-    def __init__(self, database):
+    def __init__(self, database, job_handlers, referral_graph, conversations,
+                 callback_metrics=None, flood_guard=None):
         self.db = database
-        self.messages = Messages()
+        self.job_handlers = job_handlers
+        self.referral_graph = referral_graph
+        self.conversations = conversations
+        self.callback_metrics = callback_metrics
+        self.flood_guard = flood_guard
+        self.config = Config()
+        self.messages = Messages(min_referrals=self.config.min_referrals)
+        self.draw_engine = DrawEngine(database)
     
     def _is_admin(self, user_id: int) -> bool:
         """Check if user is an admin"""
@@ -69,6 +93,170 @@ class AdminHandlers:
         
         await update.message.reply_text(message, parse_mode='Markdown')
     
+    def suspicious_report(self, flagged_only: bool = False) -> str:
+        """Referral abuse report text, or None if flagged_only and nothing was found"""
+        report = self.referral_graph.report(self.config.referral_burst_window, self.config.referral_burst_size)
+        if flagged_only and not report['ring_count'] and not report['burst_count']:
+            return None
+        
+        users = {user['user_id']: user for user in self.db.get_users_by_ids(report_user_ids(report))}
+        return self.messages.suspicious_report_message(report, users, self.config.referral_burst_window)
+    
+    async def show_suspicious(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show referral rings and signup bursts"""
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
+            return
+        
+        await update.message.reply_text(self.suspicious_report(), parse_mode='Markdown')
+    
+    async def find_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Search users by name, username, phone prefix, referral code or user_id"""
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
+            return
+        
+        if not context.args:
+            await update.message.reply_text(
+                "🔍 Foydalanuvchini qidirish:\n"
+                "`/find ISM | @username | +99890... | ref_... | USER_ID`\n\n"
+                "Masalan: `/find Ali` yoki `/find 90123`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        query = " ".join(context.args)
+        users = self.db.search_users(query, self.config.phone_country_code)
+        
+        if not users:
+            await update.message.reply_text("🔍 Hech narsa topilmadi.")
+            return
+        
+        keyboard = []
+        for user in users:
+            username = f" (@{user['username']})" if user['username'] else ""
+            keyboard.append([InlineKeyboardButton(
+                f"👤 {user['first_name'] or user['user_id']}{username} - {user['referral_count']}",
+                callback_data=callback_data("admin_user", user['user_id'])
+            )])
+        
+        await update.message.reply_text(
+            self.messages.user_search_message(users),
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    
+    async def export_data(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Export participants, winners, referrals or users as a CSV/XLSX document.
+
+        The file is written from a streaming cursor in a worker thread, and
+        the handler is registered non-blocking, so other updates keep being
+        served during a large export.
+        """
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
+            return
+        
+        kind = context.args[0].lower() if context.args else None
+        file_format = context.args[1].lower() if len(context.args) > 1 else 'csv'
+        if kind not in EXPORT_KINDS or file_format not in EXPORT_FORMATS:
+            await update.message.reply_text(
+                "📤 Eksport qilish uchun:\n"
+                f"`/export {'|'.join(EXPORT_KINDS)} [csv|xlsx]`\n\n"
+                "Masalan: `/export winners xlsx`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        if file_format == 'xlsx' and not xlsx_available():
+            await update.message.reply_text("❌ XLSX uchun openpyxl o'rnatilmagan. CSV formatidan foydalaning.")
+            return
+        
+        status = await update.message.reply_text(f"⏳ Eksport tayyorlanmoqda: {kind}...")
+        # COUNT(*) over a large table takes a while too; keep it off the event loop
+        progress = ExportProgress(await asyncio.to_thread(self.db.count_export_rows, kind))
+        
+        fd, path = tempfile.mkstemp(suffix=f".{file_format}", prefix=f"export_{kind}_")
+        os.close(fd)
+        try:
+            writer = write_xlsx if file_format == 'xlsx' else write_csv
+            task = asyncio.ensure_future(asyncio.to_thread(writer, self.db.iter_export(kind), path, progress))
+            
+            while not task.done():
+                await asyncio.wait({task}, timeout=EXPORT_PROGRESS_INTERVAL)
+                if not task.done() and progress.total:
+                    try:
+                        await status.edit_text(
+                            f"⏳ Eksport: {progress.rows}/{progress.total} "
+                            f"({progress.rows * 100 // progress.total}%)"
+                        )
+                    except Exception:
+                        # Progress edits are best effort (e.g. flood limits)
+                        pass
+            task.result()
+            
+            filename = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M')}.{file_format}"
+            if os.path.getsize(path) > EXPORT_UPLOAD_LIMIT:
+                # Bots can upload at most 50 MB; CSV compresses well
+                path = await asyncio.to_thread(gzip_file, path)
+                filename += ".gz"
+            # A long upload must not hold an interactive connection
+            with open(path, 'rb') as f, bulk_traffic():
+                await update.message.reply_document(
+                    document=f,
+                    filename=filename,
+                    caption=f"📤 {kind}: {progress.rows} qator",
+                    write_timeout=120
+                )
+            await status.delete()
+            logger.info("Export sent", extra={'event': 'export_sent', 'kind': kind, 'format': file_format, 'rows': progress.rows})
+        except Exception as e:
+            logger.error("Error exporting data", extra={'event': 'export_failed', 'kind': kind, 'error': e})
+            await status.edit_text("❌ Eksportda xatolik yuz berdi.")
+        finally:
+            os.remove(path)
+    
+    async def backup_database(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Take a database snapshot now, e.g. right before /setwinner.
+
+        Registered non-blocking: the online backup runs in a worker thread in
+        small page steps while the bot keeps answering users.
+        """
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
+            return
+        
+        label = context.args[0] if context.args else "manual"
+        if self.job_handlers.backup_lock.locked():
+            await update.message.reply_text("⏳ Zaxira nusxa allaqachon olinmoqda, biroz kuting.")
+            return
+        status = await update.message.reply_text("⏳ Zaxira nusxa olinmoqda...")
+        
+        try:
+            result = await self.job_handlers.run_backup(label)
+        except Exception as e:
+            logger.error("Error taking backup", extra={'event': 'backup_command_failed', 'error': e})
+            await status.edit_text("❌ Zaxira nusxa olishda xatolik yuz berdi.")
+            return
+        
+        await status.edit_text(
+            "💾 Zaxira nusxa tayyor\n\n"
+            f"Fayl: {os.path.basename(result['path'])}\n"
+            f"Hajmi: {result['bytes'] / 1024 / 1024:.1f} MB "
+            f"(baza: {result['db_bytes'] / 1024 / 1024:.1f} MB)\n"
+            f"SHA-256: {result['sha256'][:16]}…\n"
+            f"Vaqt: {result['seconds']} s"
+        )
+    
     async def select_winner(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Select random winners"""
         user_id = update.effective_user.id
@@ -77,27 +265,39 @@ class AdminHandlers:
             await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
             return
         
-        participants = self.db.get_all_participants()
+        # Flag referral abuse before the draw so the admin sees it with the result
+        warning = self.suspicious_report(flagged_only=True)
+        if warning:
+            try:
+                await update.message.reply_text(warning, parse_mode='Markdown')
+            except Exception as e:
+                # The warning is advisory; it must never stop the draw
+                logger.error("Failed to send abuse warning", extra={'event': 'abuse_warning_failed', 'error': e})
         
-        if not participants:
+        draw = self.draw_engine.prepare()
+        
+        if not draw:
+            await update.message.reply_text("❌ Qur'a yaratishda xatolik yuz berdi.")
+            return
+        
+        if draw['participant_count'] == 0:
             await update.message.reply_text("❌ Qatnashuvchilar yo'q.")
             return
         
-        if len(participants) < 6:
-            await update.message.reply_text("❌ Minimum 6 qatnashuvchi bo'lishi kerak.")
+        if draw['participant_count'] < len(PRIZES):
+            await update.message.reply_text(f"❌ Minimum {len(PRIZES)} qatnashuvchi bo'lishi kerak.")
             return
         
-        # Select winners
-        winners = random.sample(participants, min(6, len(participants)))
+        # Publish the commitment before any winner is chosen
+        await update.message.reply_text(self.messages.draw_commitment_message(draw), parse_mode='Markdown')
         
-        # First place - blender
-        first_place = winners[0]
-        self.db.add_winner(first_place['user_id'], "Blender (1-o'rin)")
+        winners = self.draw_engine.execute(draw['draw_id'])
+        if not winners:
+            await update.message.reply_text("❌ G'oliblarni saqlashda xatolik yuz berdi.")
+            return
         
-        # Next 5 - vouchers
-        voucher_winners = winners[1:6]
-        for winner in voucher_winners:
-            self.db.add_winner(winner['user_id'], "100,000 so'm vaucher")
+        first_place = winners[0]
+        voucher_winners = winners[1:]
         
         # Format winner message
         message = "🎉 **G'oliblar tanlandi!**\n\n"
@@ -114,10 +314,13 @@ class AdminHandlers:
                 message += f" (@{winner['username']})"
             message += f" - {winner['referral_count']} referal\n"
         
+        message += self.messages.draw_seed_message(draw['draw_id'], self.db.get_draw(draw['draw_id'])['seed'])
+        
         await update.message.reply_text(message, parse_mode='Markdown')
         
         # Notify winners
-        await self._notify_winners(context, first_place, voucher_winners)
+        with bulk_traffic():
+            await self._notify_winners(context, first_place, voucher_winners)
     
     async def _notify_winners(self, context: ContextTypes.DEFAULT_TYPE, first_place: dict, voucher_winners: list):
         """Notify winners about their prizes"""
@@ -129,7 +332,7 @@ class AdminHandlers:
                 parse_mode='Markdown'
             )
         except Exception as e:
-            logger.error(f"Failed to notify first place winner: {e}")
+            logger.error("Failed to notify first place winner", extra={'event': 'winner_notify_failed', 'user_id': first_place['user_id'], 'error': e})
         
         # Notify voucher winners
         for winner in voucher_winners:
@@ -140,7 +343,183 @@ class AdminHandlers:
                     parse_mode='Markdown'
                 )
             except Exception as e:
-                logger.error(f"Failed to notify voucher winner: {e}")
+                logger.error("Failed to notify voucher winner", extra={'event': 'winner_notify_failed', 'user_id': winner['user_id'], 'error': e})
+    
+    async def verify_draw(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Re-run a recorded draw from its frozen snapshot"""
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
+            return
+        
+        if not context.args:
+            await update.message.reply_text(
+                "🔎 Qur'ani tekshirish uchun:\n"
+                "`/verifydraw DRAW_ID`\n\n"
+                "Masalan: `/verifydraw 1`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        try:
+            draw_id = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("❌ Noto'g'ri DRAW_ID formati.")
+            return
+        
+        result = self.draw_engine.verify(draw_id)
+        if not result:
+            await update.message.reply_text(f"❌ Yakunlangan qur'a #{draw_id} topilmadi.")
+            return
+        
+        await update.message.reply_text(self.messages.draw_verification_message(result), parse_mode='Markdown')
+    
+    async def new_campaign(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Archive the current campaign and start a new one"""
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
+            return
+        
+        if not context.args:
+            await update.message.reply_text(
+                "🆕 Yangi viktorina boshlash uchun:\n"
+                "`/newcampaign NOMI`\n\n"
+                "Masalan: `/newcampaign Yangi yil viktorinasi`\n\n"
+                "⚠️ Joriy viktorina arxivlanadi va referal hisoblari noldan boshlanadi.",
+                parse_mode='Markdown'
+            )
+            return
+        
+        name = " ".join(context.args)
+        campaign_id = self.db.start_campaign(name)
+        
+        if campaign_id:
+            self.job_handlers.schedule_cutoff(context.job_queue)
+            await update.message.reply_text(
+                f"✅ Yangi viktorina boshlandi: **{name}** (#{campaign_id})\n\n"
+                f"Oldingi viktorina arxivlandi. Sanani `/setdate` orqali belgilang.",
+                parse_mode='Markdown'
+            )
+        else:
+            await update.message.reply_text("❌ Yangi viktorina boshlashda xatolik yuz berdi.")
+    
+    async def show_campaigns(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show all campaigns"""
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
+            return
+        
+        campaigns = self.db.get_campaigns()
+        
+        message = "🗂 **Viktorinalar:**\n\n"
+        for campaign in campaigns:
+            status = "🟢 Faol" if campaign['status'] == 'active' else "📦 Arxivlangan"
+            message += f"#{campaign['campaign_id']} {campaign['name']} - {status}\n"
+            if campaign['quiz_date']:
+                message += f"   📅 {campaign['quiz_date']}\n"
+            if campaign['status'] != 'active':
+                message += f"   👥 Qatnashuvchilar: {campaign['participant_count']}, 🔗 Referallar: {campaign['referral_count']}\n"
+            message += "\n"
+        
+        await update.message.reply_text(message, parse_mode='Markdown')
+    
+    async def show_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show referral funnel, hourly activity and top referrers"""
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            await update.message.reply_text("❌ Sizda admin huquqlari yo'q.")
+            return
+        
+        stats = self.db.get_stats()
+        if not stats:
+            await update.message.reply_text("❌ Statistikani olishda xatolik yuz berdi.")
+            return
+        
+        totals = stats['totals']
+        
+        def share(value):
+            return f" ({value * 100 // totals['starts']}%)" if totals['starts'] else ""
+        
+        message = "📊 **Statistika**\n\n"
+        message += "**Voronka:**\n"
+        message += f"▶️ Botni boshlaganlar: {totals['starts']}\n"
+        message += f"📱 Telefon yuborganlar: {totals['phones']}{share(totals['phones'])}\n"
+        message += f"👥 Guruhga qo'shilganlar: {totals['joins']}{share(totals['joins'])}\n"
+        message += f"✅ Qatnashish huquqini olganlar: {totals['eligible']}{share(totals['eligible'])}\n"
+        message += f"🔗 Jami referallar: {totals['referrals']}\n\n"
+        
+        pending = stats['pending']
+        message += f"⏳ Kutilayotgan takliflar: {pending['count']}"
+        if pending['count']:
+            message += f" (muddati o'tgan: {pending['expired']}, eng eskisi: {pending['oldest_age'] // 3600} soat)"
+        message += "\n\n"
+        
+        tz = timezone(timedelta(hours=self.config.quiz_utc_offset))
+        if stats['hourly']:
+            message += "**Oxirgi 24 soat (referallar):**\n"
+            for bucket, referrals in stats['hourly']:
+                if referrals:
+                    hour = datetime.fromtimestamp(bucket, tz).strftime('%d.%m %H:00')
+                    message += f"🕐 {hour} - {referrals}\n"
+            message += "\n"
+        
+        if stats['daily']:
+            message += "**Oxirgi 7 kun (referallar):**\n"
+            for bucket, referrals in stats['daily']:
+                day = datetime.fromtimestamp(bucket, timezone.utc).strftime('%d.%m.%Y')
+                message += f"📅 {day} - {referrals}\n"
+            message += "\n"
+        
+        if stats['top_referrers']:
+            message += "**🏆 Eng faol taklif qiluvchilar:**\n"
+            for i, referrer in enumerate(stats['top_referrers'], 1):
+                username = f" (@{escape_markdown(referrer['username'])})" if referrer['username'] else ""
+                name = escape_markdown(referrer['first_name']) if referrer['first_name'] else referrer['user_id']
+                message += f"{i}. {name}{username} - {referrer['referrals']}\n"
+        
+        routes = self.callback_metrics.snapshot()[:8] if self.callback_metrics else []
+        if routes:
+            message += "\n**Tugmalar (ishga tushgandan beri):**\n"
+            for prefix, route in routes:
+                average_ms = route['seconds'] * 1000 / route['calls']
+                message += f"🔘 {prefix.replace('_', ' ')} - {route['calls']} marta, o'rtacha {average_ms:.0f} ms"
+                if route['errors']:
+                    message += f", xato: {route['errors']}"
+                message += "\n"
+        
+        if self.flood_guard and self.flood_guard.dropped:
+            dropped = ", ".join(f"{kind} {count}" for kind, count in self.flood_guard.dropped.most_common(6))
+            message += f"\n🚫 Cheklangan so'rovlar: {dropped}\n"
+        
+        pools = context.bot_data.get('http_pools')
+        if pools:
+            message += "\n**Bot API ulanishlari:**\n"
+            for name, pool in pools.items():
+                metrics = pool.metrics()
+                message += (
+                    f"🔌 {name} - {metrics['in_flight']}/{metrics['size']} band, eng ko'pi {metrics['peak']}, "
+                    f"{metrics['requests']} so'rov, o'rtacha {metrics['avg_ms']} ms"
+                )
+                if metrics['errors']:
+                    message += f", xato: {metrics['errors']}"
+                message += "\n"
+        
+        outbox = context.bot_data.get('outbox')
+        if outbox:
+            breaker = outbox.breaker.metrics()
+            message += (
+                f"⚡️ Bot API holati: {breaker['state'].replace('_', ' ')}, uzilishlar: {breaker['trips']}, "
+                f"rad etilgan so'rovlar: {breaker['rejected']}\n"
+                f"📮 Navbatdagi xabarlar: {outbox.pending}, yuborilgan: {outbox.sent}\n"
+            )
+        
+        await update.message.reply_text(message, parse_mode='Markdown')
     
     async def set_quiz_date(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Set quiz date"""
@@ -153,16 +532,40 @@ class AdminHandlers:
         if not context.args:
             await update.message.reply_text(
                 "📅 Viktorina sanasini belgilash uchun:\n"
-                "`/setdate DD.MM.YYYY`\n\n"
-                "Masalan: `/setdate 25.12.2024`",
+                "`/setdate DD.MM.YYYY [HH:MM]`\n\n"
+                "Masalan: `/setdate 25.12.2024` yoki `/setdate 25.12.2024 20:00`",
                 parse_mode='Markdown'
             )
             return
         
-        quiz_date = " ".join(context.args)
+        await self._apply_quiz_date(update, context, " ".join(context.args))
+    
+    async def receive_quiz_date(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Text from an admin who pressed "Sana belgilash" in the admin menu"""
+        user_id = update.effective_user.id
+        
+        if not self._is_admin(user_id):
+            self.conversations.set(user_id, IDLE)
+            return
+        
+        await self._apply_quiz_date(update, context, update.message.text.strip())
+    
+    async def _apply_quiz_date(self, update: Update, context: ContextTypes.DEFAULT_TYPE, quiz_date: str):
+        """Parse and store the quiz date, then schedule the participant cutoff"""
+        cutoff = parse_quiz_date(quiz_date, self.config.quiz_utc_offset)
         
-        if self.db.set_quiz_date(quiz_date):
-            await update.message.reply_text(f"✅ Viktorina sanasi belgilandi: **{quiz_date}**", parse_mode='Markdown')
+        if not cutoff:
+            await update.message.reply_text("❌ Noto'g'ri sana formati. Masalan: `/setdate 25.12.2024 20:00`", parse_mode='Markdown')
+            return
+        
+        if self.db.set_quiz_date(quiz_date, int(cutoff.timestamp())):
+            self.conversations.set(update.effective_user.id, IDLE)
+            self.job_handlers.schedule_cutoff(context.job_queue)
+            await update.message.reply_text(
+                f"✅ Viktorina sanasi belgilandi: **{quiz_date}**\n\n"
+                f"🔒 Shu vaqtda qatnashuvchilar ro'yxati muzlatiladi.",
+                parse_mode='Markdown'
+            )
         else:
             await update.message.reply_text("❌ Sana belgilashda xatolik yuz berdi.")
     
@@ -270,5 +673,5 @@ class AdminHandlers:
         except ValueError:
             await update.message.reply_text("❌ Noto'g'ri ID formati.")
         except Exception as e:
-            logger.error(f"Error adding manual referral: {e}")
+            logger.error("Error adding manual referral", extra={'event': 'manual_referral_failed', 'error': e})
             await update.message.reply_text("❌ Xatolik yuz berdi.")
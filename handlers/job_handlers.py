@@ -0,0 +1,193 @@
+"""
+Scheduled job handlers for the Quiz Bot
+Handles background jobs run by the application's job queue
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from functools import partial
+from telegram.ext import ContextTypes, JobQueue
+from config import Config
+from utils.backup_utils import create_snapshot
+from utils.http_pools import bulk_traffic
+from utils.phone_utils import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_JOB_NAME = "eligibility_snapshot"
+PHONE_BACKFILL_JOB_NAME = "phone_backfill"
+RECONCILE_JOB_NAME = "referral_reconcile"
+PENDING_COMPACT_JOB_NAME = "pending_compaction"
+BACKUP_JOB_NAME = "database_backup"
+OUTBOX_JOB_NAME = "outbox_drain"
+
+class JobHandlers:
+    def __init__(self, database, outbox):
+        self.db = database
+        self.outbox = outbox
+        self.config = Config()
+        # Keyset position of the running reconciliation pass
+        self.reconcile_after = -1
+        self.reconcile_repaired = 0
+        self.next_pass_at = 0.0
+        # Scheduled and /backup snapshots never run at the same time
+        self.backup_lock = asyncio.Lock()
+    
+    def schedule_cutoff(self, job_queue: JobQueue):
+        """(Re)schedule the eligibility snapshot for the current quiz cutoff"""
+        for job in job_queue.get_jobs_by_name(SNAPSHOT_JOB_NAME):
+            job.schedule_removal()
+        
+        cutoff = self.db.get_cutoff()
+        if not cutoff or cutoff['snapshot_ts']:
+            return
+        
+        cutoff_at = datetime.fromtimestamp(cutoff['cutoff_ts'], tz=timezone.utc)
+        # A cutoff that passed while the bot was down is snapshotted right away
+        when = max(cutoff_at, datetime.now(timezone.utc))
+        job_queue.run_once(self.take_snapshot, when=when, data=cutoff['cutoff_ts'], name=SNAPSHOT_JOB_NAME)
+        logger.info("Eligibility snapshot scheduled", extra={'event': 'snapshot_scheduled', 'cutoff_ts': cutoff['cutoff_ts']})
+    
+    async def take_snapshot(self, context: ContextTypes.DEFAULT_TYPE):
+        """Freeze the eligible set at the quiz cutoff"""
+        participant_count = self.db.take_eligibility_snapshot(context.job.data)
+        if participant_count is None:
+            return
+        
+        with bulk_traffic():
+            for admin_id in self.config.admin_ids:
+                try:
+                    await context.bot.send_message(
+                        chat_id=admin_id,
+                        text=f"🔒 Qatnashuvchilar ro'yxati muzlatildi.\n\nQatnashuvchilar: {participant_count}"
+                    )
+                except Exception as e:
+                    logger.error("Failed to notify admin about snapshot", extra={'event': 'snapshot_notify_failed', 'admin_id': admin_id, 'error': e})
+    
+    def schedule_phone_backfill(self, job_queue: JobQueue):
+        """Normalize phone numbers stored before E.164 normalization, once at startup"""
+        job_queue.run_once(self.backfill_phones, when=0, name=PHONE_BACKFILL_JOB_NAME)
+    
+    async def backfill_phones(self, context: ContextTypes.DEFAULT_TYPE):
+        """Run the chunked phone backfill off the event loop"""
+        normalize = partial(
+            normalize_phone,
+            country_code=self.config.phone_country_code,
+            national_length=self.config.phone_national_length
+        )
+        counts = await asyncio.to_thread(self.db.backfill_phone_numbers, normalize)
+        if counts and counts['duplicates']:
+            logger.warning("Accounts share a phone number", extra={'event': 'phone_duplicates_found', **counts})
+    
+    def schedule_reconciliation(self, job_queue: JobQueue):
+        """Check referral_count against the referrals table, one small chunk at a time"""
+        job_queue.run_repeating(
+            self.reconcile_counts,
+            interval=self.config.reconcile_interval,
+            first=60,
+            name=RECONCILE_JOB_NAME
+        )
+    
+    async def reconcile_counts(self, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Reconcile the next chunk of users.
+
+        Each tick holds the database lock for one chunk only, so normal
+        updates interleave with the pass; after a full pass the job idles
+        until the next pass is due.
+        """
+        if time.monotonic() < self.next_pass_at:
+            return
+        
+        result = await asyncio.to_thread(
+            self.db.reconcile_referral_counts, self.reconcile_after, self.config.reconcile_chunk_size
+        )
+        if result is None:
+            return
+        
+        self.reconcile_repaired += result['repaired']
+        if result['last_user_id'] is not None:
+            self.reconcile_after = result['last_user_id']
+            return
+        
+        logger.info("Referral count reconciliation pass finished", extra={'event': 'reconcile_pass_done',
+                                                                          'repaired': self.reconcile_repaired})
+        self.reconcile_after = -1
+        self.reconcile_repaired = 0
+        self.next_pass_at = time.monotonic() + self.config.reconcile_pass_interval
+    
+    def schedule_pending_compaction(self, job_queue: JobQueue):
+        """Delete expired pending referrals periodically"""
+        job_queue.run_repeating(
+            self.compact_pending,
+            interval=self.config.pending_compact_interval,
+            first=120,
+            name=PENDING_COMPACT_JOB_NAME
+        )
+    
+    async def compact_pending(self, context: ContextTypes.DEFAULT_TYPE):
+        """Run the batched pending-referral compaction off the event loop"""
+        result = await asyncio.to_thread(
+            self.db.compact_pending_referrals, self.config.pending_compact_batch
+        )
+        if result and result['remaining']:
+            # A backlog is left (first run on a large table): continue on the next tick
+            logger.info("Pending referral backlog remains", extra={'event': 'pending_compact_backlog',
+                                                                  'deleted': result['deleted']})
+    
+    def schedule_backups(self, job_queue: JobQueue):
+        """Take a compressed online snapshot every backup interval"""
+        job_queue.run_repeating(
+            self.scheduled_backup,
+            interval=self.config.backup_interval,
+            first=self.config.backup_interval,
+            name=BACKUP_JOB_NAME
+        )
+    
+    async def scheduled_backup(self, context: ContextTypes.DEFAULT_TYPE):
+        """Periodic snapshot; skipped if a /backup is still running"""
+        if self.backup_lock.locked():
+            return
+        try:
+            await self.run_backup("auto")
+        except Exception as e:
+            logger.error("Scheduled backup failed", extra={'event': 'backup_job_failed', 'error': e})
+    
+    async def run_backup(self, label: str) -> dict:
+        """
+        Snapshot the database off the event loop.
+
+        The backup copies a bounded number of pages per step and never takes
+        the database lock, so updates keep being served while it runs.
+        """
+        async with self.backup_lock:
+            result = await asyncio.to_thread(
+                create_snapshot,
+                self.db,
+                self.config.backup_dir,
+                label,
+                self.config.backup_keep,
+                self.config.backup_pages,
+                self.config.backup_step_sleep
+            )
+        logger.info("Database snapshot written", extra={'event': 'backup_done', 'label': label, **result})
+        return result
+    
+    def schedule_outbox_drain(self, job_queue: JobQueue):
+        """
+        Send deferred notifications periodically, and right away whenever the
+        Bot API circuit closes again after an outage.
+        """
+        job_queue.run_repeating(
+            self.drain_outbox,
+            interval=self.config.outbox_drain_interval,
+            first=30,
+            name=OUTBOX_JOB_NAME
+        )
+        self.outbox.breaker.on_close = lambda: job_queue.run_once(self.drain_outbox, when=0)
+    
+    async def drain_outbox(self, context: ContextTypes.DEFAULT_TYPE):
+        """While the circuit is open the first send fails fast, or is the probe once the cooldown is over"""
+        await self.outbox.drain(context.bot)
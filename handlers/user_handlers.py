@@ -4,20 +4,64 @@ Handles all user interactions and commands
 """
 
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes
 from utils.referral_utils import ReferralUtils
 from utils.messages import Messages
+from utils.catalog import MessageCatalog
+from utils.callback_router import AdminOnly, CallbackRouter, RateLimit, RouteMetrics
+from utils.flood_control import FloodGuard
+from utils.conversation import IDLE, AWAITING_PHONE, ADMIN_SET_DATE
+from utils.draw_utils import DrawEngine, PRIZES
+from utils.phone_utils import normalize_phone
+from utils.referral_graph import report_user_ids
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Idle users' stray texts get the main menu again at most this often (seconds)
+MENU_RESEND_INTERVAL = 30
+
 class UserHandlers:
-    def __init__(self, database):
+    def __init__(self, database, leaderboard, referral_graph, conversations, processed_updates, outbox):
         self.db = database
+        self.leaderboard = leaderboard
+        self.referral_graph = referral_graph
+        self.conversations = conversations
+        self.processed_updates = processed_updates
+        # Notifications nobody waits on; queued while the Bot API is down
+        self.outbox = outbox
         self.referral_utils = ReferralUtils(database)
         self.config = Config()
-        self.messages = Messages(self.config.bot_username)
+        self.messages = Messages(self.config.bot_username, self.config.min_referrals)
+        self.catalog = MessageCatalog(self.config.bot_username, self.config.min_referrals, self.config.group_username)
+        self.draw_engine = DrawEngine(database)
+        self.flood_guard = FloodGuard(self.config.flood_limits, lambda code: self.catalog.locale(code).text('callback_too_fast'))
+        self.router = self._build_router()
+        # Text messages are routed by the sender's conversation state
+        self.text_handlers = {IDLE: self._receive_idle_text, AWAITING_PHONE: self._receive_phone}
+    
+    def _build_router(self) -> CallbackRouter:
+        """Inline-button routes; rate is the minimum seconds between taps per user"""
+        router = CallbackRouter()
+        self.callback_metrics = RouteMetrics()
+        router.use(self.callback_metrics)
+        router.use(RateLimit(lambda call: self.catalog.locale(call.language_code).text('callback_too_fast'),
+                             self.flood_guard.buckets))
+        router.use(AdminOnly(self.db.is_admin, "❌ Sizda admin huquqlari yo'q."))
+        router.set_fallback(self._answer_stale_callback)
+        
+        router.route("my_results", self._show_my_results, rate=1)
+        router.route("invite_friends", self._show_invite_friends, rate=2)
+        router.route("leaderboard", self._show_leaderboard, rate=1)
+        router.route("rules", self._show_rules, rate=1)
+        router.route("back_to_menu", self._show_main_menu_callback)
+        router.route("admin_participants", self._handle_admin_participants, admin=True, rate=5)
+        router.route("admin_select_winner", self._handle_admin_select_winner, admin=True, rate=10)
+        router.route("admin_set_date", self._handle_admin_set_date, admin=True)
+        router.route("admin_winners", self._handle_admin_winners, admin=True, rate=2)
+        router.route("admin_user", self._handle_admin_user, params=(int,), admin=True)
+        return router
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -30,36 +74,37 @@ class UserHandlers:
         referral_code = None
         if context.args:
             referral_code = context.args[0]
-            logger.info(f"User {user_id} started with referral code: {referral_code}")
+            logger.info("User started with referral code", extra={'event': 'start_with_referral', 'user_id': user_id, 'referral_code': referral_code})
         
-        # Check if user already exists
-        existing_user = self.db.get_user(user_id)
-        
-        if not existing_user:
-            # Generate unique referral code for new user
-            user_referral_code = self.referral_utils.generate_referral_code(user_id)
-            # Add new user to database
-            self.db.add_user(user_id, username, first_name, user_referral_code)
-        else:
-            # Update existing user's username and first_name if changed
-            if existing_user['username'] != username or existing_user['first_name'] != first_name:
-                self.db.update_user_info(user_id, username, first_name)
+        # Add new user, or refresh username/first_name/language of an existing one
+        self.db.add_user(user_id, username, first_name, self.referral_utils.generate_referral_code,
+                         language_code=user.language_code)
         
         # Process referral if provided
         if referral_code:
             await self._process_referral(update, context, referral_code, user_id)
         
-        # Check if user has phone number
+        # Check if user has phone number; /start also cancels any pending admin input
         current_user = self.db.get_user(user_id)
         if current_user and not current_user.get('phone_number'):
             # Request phone number
+            self.conversations.set(user_id, AWAITING_PHONE)
             await self._request_phone_number(update, context)
         else:
             # Send welcome message with main menu
+            self.conversations.set(user_id, IDLE)
             await self._send_main_menu(update, context)
     
+    def on_text(self, state: int, handler):
+        """Route text messages of users in state to handler(update, context)"""
+        self.text_handlers[state] = handler
+    
     async def _process_referral(self, update: Update, context: ContextTypes.DEFAULT_TYPE, referral_code: str, referred_user_id: int):
         """Process referral link"""
+        # Redelivered after a restart and already credited: skip before any lookup
+        if (update.update_id, referred_user_id) in self.processed_updates:
+            return
+        
         referrer = self.db.get_user_by_referral_code(referral_code)
         
         if referrer and referrer['user_id'] != referred_user_id:
@@ -67,182 +112,149 @@ class UserHandlers:
             is_group_member = await self._check_group_membership(context, referred_user_id)
             
             if is_group_member:
-                success = self.db.add_referral(referrer['user_id'], referred_user_id)
+                success = self.db.add_referral(referrer['user_id'], referred_user_id, update_id=update.update_id)
                 if success:
-                    # Notify referrer
-                    try:
-                        await context.bot.send_message(
-                            chat_id=referrer['user_id'],
-                            text=self.messages.referral_success(update.effective_user.first_name)
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to notify referrer: {e}")
+                    self.processed_updates.add(update.update_id, referred_user_id)
+                    # Notify referrer in their own language
+                    await self.outbox.send(
+                        context.bot,
+                        referrer['user_id'],
+                        self.catalog.locale(referrer['language_code']).text(
+                            'referral_success', name=update.effective_user.first_name
+                        ),
+                        kind='referral_success'
+                    )
             else:
                 # Send message to user to join the group first
-                group_link = f"https://t.me/{self.config.group_username}"
-                await update.message.reply_text(
-                    f"📢 Viktorinaga qatnashish uchun avval @{self.config.group_username} guruhiga qo'shiling!\n\n"
-                    f"🔗 Guruh havola: {group_link}\n\n"
-                    f"Guruhga qo'shilganingizdan so'ng, /start buyrug'ini qayta yuboring."
-                )
+                locale = self.catalog.locale(update.effective_user.language_code)
+                await update.message.reply_text(locale.text('join_group_first'))
     
     async def _send_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Send main menu with inline keyboard"""
-        keyboard = [
-            [InlineKeyboardButton("📊 Mening natijalarim", callback_data="my_results")],
-            [InlineKeyboardButton("👥 Do'stlarni taklif qilish", callback_data="invite_friends")],
-            [InlineKeyboardButton("📋 Qoidalar", callback_data="rules")]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
-            self.messages.welcome_message(),
-            reply_markup=reply_markup
-        )
+        locale = self.catalog.locale(update.effective_user.language_code)
+        await update.message.reply_text(locale.text('welcome'), reply_markup=locale.main_menu)
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle callback queries from inline keyboards"""
-        query = update.callback_query
-        await query.answer()
-        
-        user_id = query.from_user.id
-        data = query.data
-        
-        if data == "my_results":
-            await self._show_my_results(query, context, user_id)
-        elif data == "invite_friends":
-            await self._show_invite_friends(query, context, user_id)
-        elif data == "rules":
-            await self._show_rules(query, context)
-        elif data == "back_to_menu":
-            await self._show_main_menu_callback(query, context)
-        elif data == "admin_participants":
-            await self._handle_admin_participants(query, context, user_id)
-        elif data == "admin_select_winner":
-            await self._handle_admin_select_winner(query, context, user_id)
-        elif data == "admin_set_date":
-            await self._handle_admin_set_date(query, context, user_id)
-        elif data == "admin_winners":
-            await self._handle_admin_winners(query, context, user_id)
+        await self.router.dispatch(update, context)
+    
+    async def _answer_stale_callback(self, query, context: ContextTypes.DEFAULT_TYPE):
+        """Buttons from an older version of the bot or with broken data"""
+        await query.answer(self.catalog.locale(query.from_user.language_code).text('callback_stale'), show_alert=True)
     
-    async def _show_my_results(self, query, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    async def _show_my_results(self, call):
         """Show user's referral results"""
+        query, user_id = call.query, call.user_id
+        locale = self.catalog.locale(call.language_code)
         user = self.db.get_user(user_id)
         
         if not user:
-            await query.edit_message_text("❌ Xatolik yuz berdi. Iltimos, qayta urinib ko'ring.")
+            await query.edit_message_text(locale.text('error'))
             return
         
-        referral_count = user['referral_count']
-        eligible = user['eligible']
-        
-        keyboard = [[InlineKeyboardButton("🔙 Asosiy menyu", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.edit_message_text(
+            locale.my_results(user['referral_count'], user['eligible'], self.leaderboard.rank(user_id)),
+            reply_markup=locale.back_menu
+        )
+    
+    async def _show_leaderboard(self, call):
+        """Show top referrers and the user's own rank"""
+        query, user_id = call.query, call.user_id
+        locale = self.catalog.locale(call.language_code)
+        top = self.leaderboard.top(20)
+        users = {user['user_id']: user for user in self.db.get_users_by_ids([user_id for _, user_id, _ in top])}
+        
+        entries = []
+        for rank, top_user_id, referral_count in top:
+            user = users.get(top_user_id)
+            entries.append({
+                'rank': rank,
+                'first_name': user['first_name'] if user else None,
+                'referral_count': referral_count
+            })
         
         await query.edit_message_text(
-            self.messages.my_results_message(referral_count, eligible),
-            reply_markup=reply_markup
+            locale.leaderboard(entries, self.leaderboard.rank(user_id)),
+            reply_markup=locale.back_menu
         )
     
-    async def _show_invite_friends(self, query, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    async def _show_invite_friends(self, call):
         """Show invite friends with referral link"""
+        query, user_id = call.query, call.user_id
+        locale = self.catalog.locale(call.language_code)
         user = self.db.get_user(user_id)
         
         if not user:
-            await query.edit_message_text("❌ Xatolik yuz berdi. Iltimos, qayta urinib ko'ring.")
+            await query.edit_message_text(locale.text('error'))
             return
         
-        # Create pending referral for tracking group joins (only if not exists)
-        existing_pending = self.db.get_pending_referral(user['referral_code'])
-        if not existing_pending:
-            self.db.add_pending_referral(user['referral_code'], user_id)
+        # Create or refresh the pending referral for tracking group joins
+        self.db.add_pending_referral(user['referral_code'], user_id)
         
         referral_link = self.referral_utils.generate_referral_link(user['referral_code'])
         
-        keyboard = [
-            [InlineKeyboardButton("📤 Havola ulashish", url=f"https://t.me/share/url?url={referral_link}")],
-            [InlineKeyboardButton("🔙 Asosiy menyu", callback_data="back_to_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await query.edit_message_text(
-            self.messages.invite_friends_message(referral_link),
-            reply_markup=reply_markup
+            locale.text('invite_friends', referral_link=referral_link),
+            reply_markup=locale.invite_keyboard(referral_link)
         )
     
-    async def _show_rules(self, query, context: ContextTypes.DEFAULT_TYPE):
+    async def _show_rules(self, call):
         """Show quiz rules"""
-        quiz_date = self.db.get_quiz_date()
-        
-        keyboard = [[InlineKeyboardButton("🔙 Asosiy menyu", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            self.messages.rules_message(quiz_date),
-            reply_markup=reply_markup
-        )
+        locale = self.catalog.locale(call.language_code)
+        await call.query.edit_message_text(locale.rules(self.db.get_quiz_date()), reply_markup=locale.back_menu)
     
-    async def _show_main_menu_callback(self, query, context: ContextTypes.DEFAULT_TYPE):
+    async def _show_main_menu_callback(self, call):
         """Show main menu from callback"""
-        keyboard = [
-            [InlineKeyboardButton("📊 Mening natijam", callback_data="my_results")],
-            [InlineKeyboardButton("👥 Do'stlarni taklif qilish", callback_data="invite_friends")],
-            [InlineKeyboardButton("📋 Qoidalar", callback_data="rules")]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            self.messages.welcome_message(),
-            reply_markup=reply_markup
-        )
+        locale = self.catalog.locale(call.language_code)
+        await call.query.edit_message_text(locale.text('welcome'), reply_markup=locale.main_menu)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle text messages"""
-        user_id = update.effective_user.id
-        message_text = update.message.text
-        
-        # Check if user is providing phone number
-        if message_text and (message_text.startswith('+') or message_text.isdigit()):
-            # Validate phone number format
-            if len(message_text) >= 9 and len(message_text) <= 15:
-                # Update user's phone number
-                success = self.db.update_user_phone(user_id, message_text)
-                if success:
-                    await update.message.reply_text(
-                        "✅ Telefon raqamingiz muvaffaqiyatli saqlandi!\n\n"
-                        "Endi viktorinada g'olib bo'lganingizda shu raqam orqali aniqlanasiz."
-                    )
-                    # Now send main menu
-                    await self._send_main_menu(update, context)
-                else:
-                    await update.message.reply_text("❌ Xatolik yuz berdi. Qayta urinib ko'ring.")
-            else:
-                await update.message.reply_text("❌ Noto'g'ri raqam formati. Qayta urinib ko'ring.")
+        """Handle text messages according to the sender's conversation state"""
+        state = self.conversations.get(update.effective_user.id)
+        handler = self.text_handlers.get(state, self._receive_idle_text)
+        await handler(update, context)
+    
+    async def _receive_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Text from a user who was asked for their phone number"""
+        phone_number = normalize_phone(update.message.text, self.config.phone_country_code, self.config.phone_national_length)
+        if phone_number:
+            await self._save_phone(update, context, update.effective_user.id, phone_number)
         else:
-            # For other messages, redirect to main menu
+            locale = self.catalog.locale(update.effective_user.language_code)
+            await update.message.reply_text(locale.text('phone_invalid'))
+    
+    async def _receive_idle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Text nobody asked for: point back to the main menu, without repeating it on every message"""
+        if self.conversations.menu_due(update.effective_user.id, MENU_RESEND_INTERVAL):
             await self._send_main_menu(update, context)
     
     async def _request_phone_number(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Request phone number from user"""
-        from telegram import KeyboardButton, ReplyKeyboardMarkup
-        
-        # Create keyboard with phone number request button
-        keyboard = [
-            [KeyboardButton("📱 Raqamni yuborish", request_contact=True)]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        
+        locale = self.catalog.locale(update.effective_user.language_code)
         await update.message.reply_text(
-            "📱 **Telefon raqamingizni kiriting**\n\n"
-            "Viktorinada g'olib bo'lganingizda shu raqam orqali aniqlanasiz.\n\n"
-            "Raqamni quyidagi tugma orqali yuboring yoki qo'lda kiriting:\n"
-            "Masalan: +998901234567",
-            reply_markup=reply_markup,
+            locale.text('phone_request'),
+            reply_markup=locale.phone_keyboard,
             parse_mode='Markdown'
         )
     
+    async def _save_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, phone_number: str):
+        """Store a normalized phone number unless another account already uses it"""
+        locale = self.catalog.locale(update.effective_user.language_code)
+        
+        owner_id = self.db.get_user_id_by_phone(phone_number)
+        if owner_id is not None and owner_id != user_id:
+            await update.message.reply_text(locale.text('phone_taken'))
+            return
+        
+        success = self.db.update_user_phone(user_id, phone_number)
+        if success:
+            self.conversations.set(user_id, IDLE)
+            await update.message.reply_text(locale.text('phone_saved'), reply_markup=ReplyKeyboardRemove())
+            # Now send main menu
+            await self._send_main_menu(update, context)
+        else:
+            await update.message.reply_text(locale.text('error'))
+    
     async def handle_new_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle new members joining the group via referral links"""
         
@@ -255,55 +267,47 @@ class UserHandlers:
             username = member.username or ""
             first_name = member.first_name or ""
             
-            logger.info(f"New member joined group: {user_id}")
+            # A join redelivered after a restart was fully handled, notifications included
+            if (update.update_id, user_id) in self.processed_updates:
+                logger.info("Redelivered join skipped", extra={'event': 'update_duplicate', 'update_id': update.update_id, 'user_id': user_id})
+                continue
             
-            # Generate referral code for new user
-            user_referral_code = self.referral_utils.generate_referral_code(user_id)
+            logger.info("New member joined group", extra={'event': 'group_member_joined', 'user_id': user_id})
             
-            # Add user to database if not exists
-            existing_user = self.db.get_user(user_id)
-            if not existing_user:
-                self.db.add_user(user_id, username, first_name, user_referral_code)
+            # Add user to database, or refresh their names if they already started the bot
+            self.db.add_user(user_id, username, first_name, self.referral_utils.generate_referral_code,
+                             source='group', language_code=member.language_code)
             
-            # Try to find if this user joined via a referral link
-            # Check pending referrals and match with timing
-            pending_referrals = self.db.get_all_pending_referrals()
+            # Funnel count plus crediting and consuming the newest pending referral, in one
+            # transaction with the processed-update mark
+            join = self.db.process_group_join(user_id, update.update_id)
+            if join is None:
+                continue
+            self.processed_updates.add(update.update_id, user_id)
+            if join['duplicate']:
+                continue
             
-            # If there are pending referrals, we can try to match them
-            # For now, we'll use the most recent pending referral as a heuristic
-            if pending_referrals:
-                most_recent = pending_referrals[0]  # Assuming ordered by newest first
-                referrer_id = most_recent['referrer_id']
-                referral_code = most_recent['referral_code']
-                
-                # Add the referral connection
-                success = self.db.add_referral(referrer_id, user_id)
-                if success:
-                    # Remove the processed pending referral
-                    self.db.remove_pending_referral(referral_code)
-                    
-                    # Notify the referrer
-                    try:
-                        referrer = self.db.get_user(referrer_id)
-                        await context.bot.send_message(
-                            chat_id=referrer_id,
-                            text=f"🎉 Tabriklaymiz!\n\n"
-                                 f"Sizning referalingiz orqali {first_name} guruhga qo'shildi!\n"
-                                 f"Sizning referal soningiz: {referrer['referral_count'] + 1}\n"
-                                 f"Viktorinaga qatnashish huquqi: {'✅ Bor' if referrer['referral_count'] >= 0 else '❌ Yo`q'}"
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to notify referrer: {e}")
+            if join['credited']:
+                referrer_id = join['referrer_id']
+                # Notify the referrer in their own language
+                referrer = self.db.get_user(referrer_id)
+                if referrer:
+                    referrer_locale = self.catalog.locale(referrer['language_code'])
+                    await self.outbox.send(
+                        context.bot,
+                        referrer_id,
+                        referrer_locale.text(
+                            'referral_joined_group',
+                            name=first_name,
+                            referral_count=referrer['referral_count'],
+                            eligible=referrer_locale.text('eligible_yes' if referrer['eligible'] else 'eligible_no')
+                        ),
+                        kind='referral_joined_group'
+                    )
             
             # Welcome message to new group member
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text="🎉 @testforviktorina guruhiga xush kelibsiz!\n\n"
-                         "Viktorinaga qatnashish uchun botni ishga tushiring: /start"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send welcome message to new member: {e}")
+            await self.outbox.send(context.bot, user_id, self.catalog.locale(member.language_code).text('group_welcome'),
+                                   kind='group_welcome')
     
     async def _check_group_membership(self, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
         """Check if user is a member of the target group"""
@@ -319,39 +323,34 @@ class UserHandlers:
                 return True
             return False
         except Exception as e:
-            logger.error(f"Error checking group membership for user {user_id}: {e}")
+            logger.error("Error checking group membership", extra={'event': 'membership_check_failed', 'user_id': user_id, 'error': e})
             # If we can't check, assume they're not a member
             return False
-
+    
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
-        await update.message.reply_text(self.messages.help_message())
+        await update.message.reply_text(self.catalog.locale(update.effective_user.language_code).text('help'))
     
     async def handle_contact(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle contact (phone number) sharing"""
         if update.message.contact:
             user_id = update.effective_user.id
-            phone_number = update.message.contact.phone_number
+            phone_number = normalize_phone(
+                update.message.contact.phone_number,
+                self.config.phone_country_code,
+                self.config.phone_national_length
+            )
             
-            # Update user's phone number
-            success = self.db.update_user_phone(user_id, phone_number)
-            if success:
-                from telegram import ReplyKeyboardRemove
-                await update.message.reply_text(
-                    "✅ Telefon raqamingiz muvaffaqiyatli saqlandi!\n\n"
-                    "Endi viktorinada g'olib bo'lganingizda shu raqam orqali aniqlanasiz.",
-                    reply_markup=ReplyKeyboardRemove()
-                )
-                # Now send main menu
-                await self._send_main_menu(update, context)
-            else:
-                await update.message.reply_text("❌ Xatolik yuz berdi. Qayta urinib ko'ring.")
+            if not phone_number:
+                locale = self.catalog.locale(update.effective_user.language_code)
+                await update.message.reply_text(locale.text('phone_invalid'))
+                return
+            
+            await self._save_phone(update, context, user_id, phone_number)
     
-    async def _handle_admin_participants(self, query, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    async def _handle_admin_participants(self, call):
         """Handle admin participants callback"""
-        if not self.db.is_admin(user_id):
-            await query.edit_message_text("❌ Sizda admin huquqlari yo'q.")
-            return
+        query = call.query
         
         participants = self.db.get_all_participants()
         if not participants:
@@ -369,33 +368,47 @@ class UserHandlers:
         message += f"**Jami qatnashuvchilar: {len(participants)}**"
         await query.edit_message_text(message, parse_mode='Markdown')
     
-    async def _handle_admin_select_winner(self, query, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    async def _handle_admin_select_winner(self, call):
         """Handle admin select winner callback"""
-        if not self.db.is_admin(user_id):
-            await query.edit_message_text("❌ Sizda admin huquqlari yo'q.")
+        query = call.query
+        
+        # Flag referral abuse before the draw so the admin sees it with the result
+        report = self.referral_graph.report(self.config.referral_burst_window, self.config.referral_burst_size)
+        if report['ring_count'] or report['burst_count']:
+            users = {user['user_id']: user for user in self.db.get_users_by_ids(report_user_ids(report))}
+            try:
+                await query.message.reply_text(
+                    self.messages.suspicious_report_message(report, users, self.config.referral_burst_window),
+                    parse_mode='Markdown'
+                )
+            except Exception as e:
+                # The warning is advisory; it must never stop the draw
+                logger.error("Failed to send abuse warning", extra={'event': 'abuse_warning_failed', 'error': e})
+        
+        draw = self.draw_engine.prepare()
+        
+        if not draw:
+            await query.edit_message_text("❌ Qur'a yaratishda xatolik yuz berdi.")
             return
         
-        participants = self.db.get_all_participants()
-        if not participants:
+        if draw['participant_count'] == 0:
             await query.edit_message_text("❌ Qatnashuvchilar yo'q.")
             return
         
-        if len(participants) < 6:
-            await query.edit_message_text("❌ Minimum 6 qatnashuvchi bo'lishi kerak.")
+        if draw['participant_count'] < len(PRIZES):
+            await query.edit_message_text(f"❌ Minimum {len(PRIZES)} qatnashuvchi bo'lishi kerak.")
             return
         
-        import random
-        # Select winners
-        winners = random.sample(participants, min(6, len(participants)))
+        # Publish the commitment before any winner is chosen
+        await query.edit_message_text(self.messages.draw_commitment_message(draw), parse_mode='Markdown')
         
-        # First place - blender
-        first_place = winners[0]
-        self.db.add_winner(first_place['user_id'], "Blender (1-o'rin)")
+        winners = self.draw_engine.execute(draw['draw_id'])
+        if not winners:
+            await query.message.reply_text("❌ G'oliblarni saqlashda xatolik yuz berdi.")
+            return
         
-        # Next 5 - vouchers
-        voucher_winners = winners[1:6]
-        for winner in voucher_winners:
-            self.db.add_winner(winner['user_id'], "100,000 so'm vaucher")
+        first_place = winners[0]
+        voucher_winners = winners[1:]
         
         # Format winner message
         message = "🎉 **G'oliblar tanlandi!**\n\n"
@@ -416,27 +429,43 @@ class UserHandlers:
                 message += f" - 📱 {winner['phone_number']}"
             message += f" - {winner['referral_count']} referal\n"
         
-        await query.edit_message_text(message, parse_mode='Markdown')
+        message += self.messages.draw_seed_message(draw['draw_id'], self.db.get_draw(draw['draw_id'])['seed'])
+        
+        await query.message.reply_text(message, parse_mode='Markdown')
     
-    async def _handle_admin_set_date(self, query, context: ContextTypes.DEFAULT_TYPE, user_id: int):
-        """Handle admin set date callback"""
-        if not self.db.is_admin(user_id):
-            await query.edit_message_text("❌ Sizda admin huquqlari yo'q.")
+    async def _handle_admin_user(self, call):
+        """Handle admin user card callback from /find results"""
+        query = call.query
+        
+        target_id, = call.params
+        
+        user = self.db.get_user(target_id)
+        if not user:
+            await query.message.reply_text("❌ Foydalanuvchi topilmadi.")
             return
         
-        await query.edit_message_text(
+        # Sent as a new message so the search results stay usable
+        await query.message.reply_text(self.messages.user_card_message(
+            user,
+            self.leaderboard.rank(user['user_id']),
+            self.referral_graph.subtree_size(user['user_id']),
+            self.referral_graph.depth(user['user_id'])
+        ))
+    
+    async def _handle_admin_set_date(self, call):
+        """Handle admin set date callback: the admin's next text is the date"""
+        self.conversations.set(call.user_id, ADMIN_SET_DATE)
+        await call.query.edit_message_text(
             "📅 **Viktorina sanasini belgilash**\n\n"
-            "Sanani belgilash uchun quyidagi buyruqni ishlating:\n"
-            "`/setdate DD.MM.YYYY`\n\n"
-            "Masalan: `/setdate 25.12.2024`",
+            "Sanani `DD.MM.YYYY [HH:MM]` ko'rinishida yuboring.\n"
+            "Masalan: `25.12.2024 20:00`\n\n"
+            "Bekor qilish uchun /start buyrug'ini yuboring.",
             parse_mode='Markdown'
         )
     
-    async def _handle_admin_winners(self, query, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    async def _handle_admin_winners(self, call):
         """Handle admin winners callback"""
-        if not self.db.is_admin(user_id):
-            await query.edit_message_text("❌ Sizda admin huquqlari yo'q.")
-            return
+        query = call.query
         
         winners = self.db.get_winners()
         if not winners:
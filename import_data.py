@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Bulk import of existing group members and historical referrals
+
+Usage:
+    python import_data.py users members.csv
+    python import_data.py referrals referrals.jsonl
+
+users files need a user_id column (username, first_name, phone_number are
+optional); referrals files need referrer_id and referred_id (date is
+optional). Referral counts and eligibility are recomputed once at the end.
+Restart the bot afterwards so its in-memory leaderboard and referral graph
+pick up the imported data.
+"""
+
+import argparse
+import logging
+import time
+
+from config import Config
+from database import Database
+from utils.import_utils import ImportErrors, iter_referrals, iter_users
+from utils.logging_utils import setup_logging
+from utils.referral_utils import ReferralUtils
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import users or referrals into the quiz bot database")
+    parser.add_argument("kind", choices=["users", "referrals"])
+    parser.add_argument("path", help="CSV (with header) or JSONL file")
+    parser.add_argument("--db", default="quiz_bot.db", help="SQLite database path")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per transaction")
+    args = parser.parse_args()
+    
+    config = Config()
+    setup_logging(level=getattr(logging, config.log_level, logging.INFO))
+    
+    db = Database(args.db, config.min_referrals)
+    errors = ImportErrors()
+    started = time.monotonic()
+    
+    if args.kind == "users":
+        rows = iter_users(args.path, errors, config.phone_country_code, config.phone_national_length)
+        result = db.import_users(rows, ReferralUtils(db).generate_referral_code, args.chunk_size)
+    else:
+        result = db.import_referrals(iter_referrals(args.path, errors), args.chunk_size)
+    
+    if result is None:
+        print("Import failed, see the log")
+        return 1
+    
+    recompute = db.recompute_referral_counts()
+    
+    print(f"{args.kind}: {result} in {time.monotonic() - started:.1f}s")
+    print(f"recompute: {recompute}")
+    if errors.count:
+        print(f"rejected rows: {errors.count}")
+        for sample in errors.samples:
+            print(f"  {sample}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,28 +6,63 @@ Main application entry point
 
 import logging
 import os
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from telegram import Update
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters
 from database import Database
 from handlers.user_handlers import UserHandlers
 from handlers.admin_handlers import AdminHandlers
+from handlers.job_handlers import JobHandlers
 from config import Config
+from utils.leaderboard import Leaderboard
+from utils.referral_graph import ReferralGraph
+from utils.conversation import ConversationStates, ADMIN_SET_DATE
+from utils.processed_updates import ProcessedUpdates
+from utils.logging_utils import setup_logging
+from utils.http_pools import build_pools
+from utils.circuit_breaker import CircuitBreaker, CircuitOpen
+from utils.outbox import Outbox
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+# Configure logging: records are queued and written by a background thread
+_log_config = Config()
+setup_logging(
+    level=getattr(logging, _log_config.log_level, logging.INFO),
+    burst=_log_config.log_sample_burst,
+    interval=_log_config.log_sample_interval,
+    sample_every=_log_config.log_sample_every
 )
 logger = logging.getLogger(__name__)
 
 class QuizBot:
     def __init__(self):
         self.config = Config()
-        self.db = Database()
-        self.user_handlers = UserHandlers(self.db)
-        self.admin_handlers = AdminHandlers(self.db)
+        self.db = Database(min_referrals=self.config.min_referrals, pending_ttl=self.config.pending_referral_ttl,
+                           update_window=self.config.processed_update_window)
+        self.leaderboard = Leaderboard()
+        self.leaderboard.load(self.db.iter_referral_counts())
+        self.db.subscribe(self.leaderboard.handle_event)
+        self.referral_graph = ReferralGraph()
+        self.referral_graph.load(self.db.iter_referral_edges())
+        self.db.subscribe(self.referral_graph.handle_event)
+        self.conversations = ConversationStates(self.db.set_conversation_state)
+        self.conversations.load(self.db.iter_conversation_states())
+        self.processed_updates = ProcessedUpdates(self.config.processed_update_window)
+        self.processed_updates.load(self.db.iter_processed_updates())
+        self.breaker = CircuitBreaker(self.config.circuit_failure_rate, self.config.circuit_window,
+                                      self.config.circuit_min_calls, self.config.circuit_cooldown)
+        self.outbox = Outbox(self.db, self.breaker, self.config.outbox_batch, self.config.outbox_ttl)
+        self.user_handlers = UserHandlers(self.db, self.leaderboard, self.referral_graph, self.conversations,
+                                          self.processed_updates, self.outbox)
+        
+        self.job_handlers = JobHandlers(self.db, self.outbox)
+        self.admin_handlers = AdminHandlers(self.db, self.job_handlers, self.referral_graph, self.conversations,
+                                            self.user_handlers.callback_metrics, self.user_handlers.flood_guard)
+        self.user_handlers.on_text(ADMIN_SET_DATE, self.admin_handlers.receive_quiz_date)
         
     def setup_handlers(self, application):
         """Setup all bot handlers"""
+        # Flood control runs first (group -1) and stops over-limit updates before any handler
+        application.add_handler(TypeHandler(Update, self.user_handlers.flood_guard.check), group=-1)
+        
         # User command handlers
         application.add_handler(CommandHandler("start", self.user_handlers.start))
         application.add_handler(CommandHandler("help", self.user_handlers.help))
@@ -36,9 +71,18 @@ class QuizBot:
         application.add_handler(CommandHandler("admin", self.admin_handlers.admin_menu))
         application.add_handler(CommandHandler("participants", self.admin_handlers.show_participants))
         application.add_handler(CommandHandler("setwinner", self.admin_handlers.select_winner))
+        application.add_handler(CommandHandler("verifydraw", self.admin_handlers.verify_draw))
         application.add_handler(CommandHandler("setdate", self.admin_handlers.set_quiz_date))
         application.add_handler(CommandHandler("addadmin", self.admin_handlers.add_admin))
         application.add_handler(CommandHandler("addref", self.admin_handlers.add_manual_referral))
+        application.add_handler(CommandHandler("newcampaign", self.admin_handlers.new_campaign))
+        application.add_handler(CommandHandler("campaigns", self.admin_handlers.show_campaigns))
+        application.add_handler(CommandHandler("stats", self.admin_handlers.show_stats))
+        application.add_handler(CommandHandler("suspicious", self.admin_handlers.show_suspicious))
+        application.add_handler(CommandHandler("find", self.admin_handlers.find_user))
+        # Exports run for a while; block=False keeps other updates flowing meanwhile
+        application.add_handler(CommandHandler("export", self.admin_handlers.export_data, block=False))
+        application.add_handler(CommandHandler("backup", self.admin_handlers.backup_database, block=False))
         
         # Callback query handlers
         application.add_handler(CallbackQueryHandler(self.user_handlers.handle_callback))
@@ -51,9 +95,23 @@ class QuizBot:
         # Error handler
         application.add_error_handler(self.error_handler)
     
+    def setup_jobs(self, application):
+        """Schedule background jobs"""
+        self.job_handlers.schedule_cutoff(application.job_queue)
+        self.job_handlers.schedule_phone_backfill(application.job_queue)
+        self.job_handlers.schedule_reconciliation(application.job_queue)
+        self.job_handlers.schedule_pending_compaction(application.job_queue)
+        self.job_handlers.schedule_backups(application.job_queue)
+        self.job_handlers.schedule_outbox_drain(application.job_queue)
+    
     async def error_handler(self, update, context):
         """Handle errors"""
-        logger.error(f"Update {update} caused error {context.error}")
+        if isinstance(context.error, CircuitOpen):
+            # Failed fast during a Bot API outage; the breaker logged the outage once
+            logger.warning("Update not answered, Bot API circuit open", extra={'event': 'update_circuit_open',
+                                                                                 'update_id': getattr(update, 'update_id', None)})
+            return
+        logger.error("Update caused error", extra={'event': 'update_error', 'update': update, 'error': context.error})
         
     def run(self):
         """Start the bot"""
@@ -62,8 +120,19 @@ class QuizBot:
             logger.error("TELEGRAM_BOT_TOKEN environment variable is required")
             return
             
-        application = Application.builder().token(token).build()
+        updates_request, request, pools = build_pools(self.config, self.breaker)
+        application = (
+            Application.builder()
+            .token(token)
+            .get_updates_request(updates_request)
+            .request(request)
+            .build()
+        )
+        # /stats reads pool occupancy, breaker state and the outbox from here
+        application.bot_data['http_pools'] = pools
+        application.bot_data['outbox'] = self.outbox
         self.setup_handlers(application)
+        self.setup_jobs(application)
         
         logger.info("Starting Quiz Bot...")
         application.run_polling(allowed_updates=["message", "callback_query", "chat_member"])
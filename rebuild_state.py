@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Replay the event journal to check or rebuild referral counters and winners
+
+Usage:
+    python rebuild_state.py verify       # replay and report drift, no writes
+    python rebuild_state.py apply        # replay and overwrite counters and winners
+    python rebuild_state.py checkpoint   # replay and store a checkpoint for later replays
+
+Replays start from the latest checkpoint unless --from-scratch is given.
+Stop the bot before apply (or restart it afterwards) so its in-memory
+leaderboard and referral graph pick up the rebuilt data.
+"""
+
+import argparse
+import logging
+import time
+from collections import Counter
+
+from config import Config
+from database import Database
+from utils.logging_utils import setup_logging
+
+
+def counter_drift(db: Database, counts: Counter) -> dict:
+    """Users whose stored referral_count differs from the replayed one"""
+    drift = {'users': 0, 'samples': []}
+    for user_id, referral_count in db.iter_referral_counts():
+        expected = counts.get(user_id, 0)
+        if referral_count != expected:
+            drift['users'] += 1
+            if len(drift['samples']) < 10:
+                drift['samples'].append((user_id, referral_count, expected))
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the event journal into referral counters and winners")
+    parser.add_argument("command", choices=["verify", "apply", "checkpoint"])
+    parser.add_argument("--db", default="quiz_bot.db", help="SQLite database path")
+    parser.add_argument("--from-scratch", action="store_true", help="ignore checkpoints and replay every event")
+    args = parser.parse_args()
+    
+    config = Config()
+    setup_logging(level=getattr(logging, config.log_level, logging.INFO))
+    db = Database(args.db, config.min_referrals)
+    
+    state = None if args.from_scratch else db.get_journal_checkpoint()
+    start_id = state.event_id if state else 0
+    started = time.monotonic()
+    state = db.replay_journal(state)
+    if state is None:
+        print("Replay failed, see the log")
+        return 1
+    elapsed = time.monotonic() - started
+    events = state.event_id - start_id
+    rate = events / elapsed if elapsed else 0
+    if events:
+        print(f"replayed events {start_id + 1}..{state.event_id} ({events}) in {elapsed:.2f}s, {rate:,.0f} events/s")
+    else:
+        print(f"no events after checkpoint {start_id}")
+    print(f"referrers: {len(state.counts)}, referrals: {sum(state.counts.values())}, winners: {len(state.winners)}")
+    
+    if args.command == "checkpoint":
+        return 0 if db.save_journal_checkpoint(state) else 1
+    
+    if args.command == "apply":
+        result = db.rebuild_from_journal(state)
+        if result is None:
+            print("Rebuild failed, see the log")
+            return 1
+        print(f"rebuilt: {result}")
+        return 0
+    
+    drift = counter_drift(db, state.counts)
+    stored_winners = Counter((winner['user_id'], winner['prize_type']) for winner in db.get_winners())
+    journal_winners = Counter((user_id, prize_type) for user_id, prize_type, _, _ in state.winners)
+    print(f"counter drift: {drift['users']} users")
+    for user_id, stored, expected in drift['samples']:
+        print(f"  user {user_id}: stored {stored}, journal {expected}")
+    print(f"winners: {'match' if stored_winners == journal_winners else 'differ'}")
+    return 0 if not drift['users'] and stored_winners == journal_winners else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+"""CircuitBreaker: closed -> open -> half-open -> closed or open again"""
+
+import asyncio
+
+import pytest
+
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from utils.http_pools import RoutedRequest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('utils.circuit_breaker.time.monotonic', lambda: now[0])
+    return now
+
+
+def tripped(clock, cooldown=30.0):
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4, cooldown=cooldown)
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record(False)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4)
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+
+
+def test_stays_closed_below_failure_rate(clock):
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4)
+    for ok in (True, True, True, False, True, False):
+        breaker.record(ok)
+    assert breaker.state == CLOSED
+    assert breaker.failures == 2
+
+
+def test_old_failures_leave_the_window(clock):
+    breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4)
+    for ok in (False, True, True, True, True, True):
+        breaker.record(ok)
+    assert breaker.failures == 0
+
+
+def test_open_circuit_fails_fast(clock):
+    breaker = tripped(clock)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    assert breaker.rejected == 1
+
+
+def test_probe_success_closes(clock):
+    breaker = tripped(clock)
+    closed = []
+    breaker.on_close = lambda: closed.append(True)
+    clock[0] += 30
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert closed == [True]
+    assert breaker.failures == 0
+
+
+def test_probe_failure_reopens(clock):
+    breaker = tripped(clock)
+    clock[0] += 30
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    clock[0] += 30
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_lost_probe_is_replaced(clock):
+    breaker = tripped(clock)
+    clock[0] += 30
+    breaker.before_call()
+    clock[0] += 30
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+class FakePool:
+    """do_request answering with the given status code"""
+
+    def __init__(self, code):
+        self.code = code
+
+    async def do_request(self, *args):
+        return self.code, b"{}"
+
+
+def test_client_errors_do_not_count_as_failures(clock):
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4)
+    for code in (400, 403, 429, 400, 403):
+        request = RoutedRequest(FakePool(code), FakePool(code), breaker=breaker)
+        asyncio.run(request.do_request("https://api.telegram.org/bot/sendMessage", "POST"))
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+    request = RoutedRequest(FakePool(502), FakePool(502), breaker=breaker)
+    for _ in range(5):
+        asyncio.run(request.do_request("https://api.telegram.org/bot/sendMessage", "POST"))
+    assert breaker.state == OPEN
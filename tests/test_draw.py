@@ -0,0 +1,91 @@
+"""Winner draw: deterministic reservoir sampling and draw verification"""
+
+import random
+import sqlite3
+
+from database import Database
+from utils.draw_utils import DrawEngine, PRIZES, reservoir_sample
+
+
+def candidates(n, weight=1):
+    return [(user_id, weight) for user_id in range(1, n + 1)]
+
+
+def test_same_seed_same_winners():
+    first = reservoir_sample(iter(candidates(1000)), 6, True, random.Random(42))
+    second = reservoir_sample(iter(candidates(1000)), 6, True, random.Random(42))
+    assert first == second
+    assert first[1] == 1000
+    assert len(set(first[0])) == 6
+
+
+def test_different_seed_different_winners():
+    first, _ = reservoir_sample(candidates(1000), 6, False, random.Random(1))
+    second, _ = reservoir_sample(candidates(1000), 6, False, random.Random(2))
+    assert first != second
+
+
+def test_fewer_candidates_than_prizes():
+    winners, seen = reservoir_sample(candidates(3), 6, True, random.Random(7))
+    assert sorted(winners) == [1, 2, 3]
+    assert seen == 3
+
+
+def test_weight_raises_the_odds():
+    # One heavy user among many light ones wins far more often than 1 in 100
+    wins = 0
+    for seed in range(200):
+        pool = candidates(99) + [(1000, 50)]
+        winners, _ = reservoir_sample(pool, 1, True, random.Random(seed))
+        wins += winners == [1000]
+    assert wins > 40
+
+
+def test_uniform_ignores_weights():
+    heavy = [(user_id, user_id * 100) for user_id in range(1, 200)]
+    plain = candidates(199)
+    assert reservoir_sample(heavy, 6, False, random.Random(3)) == reservoir_sample(plain, 6, False, random.Random(3))
+
+
+def make_engine(tmp_path, participants=20):
+    db = Database(str(tmp_path / "draw.db"))
+    conn = sqlite3.connect(db.db_path)
+    conn.executemany(
+        "INSERT INTO users (user_id, username, first_name, referral_count, eligible, referral_code) VALUES (?, ?, ?, ?, 1, ?)",
+        [(user_id, f"user{user_id}", f"User {user_id}", user_id % 5 + 1, f"ref_{user_id}") for user_id in range(1, participants + 1)]
+    )
+    conn.commit()
+    conn.close()
+    return db, DrawEngine(db)
+
+
+def test_verify_replays_a_completed_draw(tmp_path):
+    db, engine = make_engine(tmp_path)
+    draw = engine.prepare()
+    winners = engine.execute(draw['draw_id'])
+    assert len(winners) == len(PRIZES)
+
+    result = engine.verify(draw['draw_id'])
+    assert result['ok']
+    assert result['winners'] == [winner['user_id'] for winner in winners]
+
+
+def test_verify_detects_a_changed_snapshot(tmp_path):
+    db, engine = make_engine(tmp_path)
+    draw = engine.prepare()
+    engine.execute(draw['draw_id'])
+
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("UPDATE draw_entries SET weight = weight + 1 WHERE draw_id = ? AND position = 1", (draw['draw_id'],))
+    conn.commit()
+    conn.close()
+
+    result = engine.verify(draw['draw_id'])
+    assert not result['digest_ok']
+    assert not result['ok']
+
+
+def test_verify_ignores_pending_draws(tmp_path):
+    db, engine = make_engine(tmp_path)
+    draw = engine.prepare()
+    assert engine.verify(draw['draw_id']) is None
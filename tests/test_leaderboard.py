@@ -0,0 +1,52 @@
+"""Leaderboard: ranks with ties, top-n ordering, incremental updates"""
+
+from utils.leaderboard import Leaderboard
+
+
+def make_board(rows):
+    board = Leaderboard()
+    board.load(rows)
+    return board
+
+
+def test_ties_share_a_rank():
+    board = make_board([(1, 5), (2, 3), (3, 5), (4, 0), (5, 3)])
+    assert board.rank(1) == (1, 5)
+    assert board.rank(3) == (1, 5)
+    assert board.rank(2) == (3, 5)
+    assert board.rank(5) == (3, 5)
+    assert board.rank(4) == (5, 5)
+    assert board.rank(99) is None
+
+
+def test_top_lists_ties_by_user_id_and_skips_zero():
+    board = make_board([(7, 2), (3, 2), (5, 4), (1, 0), (9, 2)])
+    assert board.top(10) == [(1, 5, 4), (2, 3, 2), (2, 7, 2), (2, 9, 2)]
+
+
+def test_top_cuts_inside_a_tie():
+    board = make_board([(user_id, 1) for user_id in range(100, 0, -1)] + [(500, 3)])
+    assert board.top(4) == [(1, 500, 3), (2, 1, 1), (2, 2, 1), (2, 3, 1)]
+
+
+def test_set_count_moves_user():
+    board = make_board([(1, 1), (2, 2)])
+    board.set_count(1, 3)
+    board.set_count(3, 0)
+    assert board.rank(1) == (1, 3)
+    assert board.rank(2) == (2, 3)
+    assert board.top(5) == [(1, 1, 3), (2, 2, 2)]
+
+
+def test_count_beyond_tree_size_grows_it():
+    board = make_board([(1, 1)])
+    board.set_count(2, 1000)
+    assert board.rank(2) == (1, 2)
+    assert board.top(2) == [(1, 2, 1000), (2, 1, 1)]
+
+
+def test_reset_zeroes_everyone():
+    board = make_board([(1, 4), (2, 1)])
+    board.reset()
+    assert board.top(5) == []
+    assert board.rank(1) == (1, 2)
@@ -0,0 +1,33 @@
+"""Every locale defines every key with the same placeholders"""
+
+import pytest
+
+from utils.catalog import MessageCatalog, placeholders, validate_locales
+from utils.locales import LOCALES
+
+
+def test_locales_are_consistent():
+    validate_locales(LOCALES)
+
+
+def test_every_locale_has_every_key_and_placeholder():
+    reference = LOCALES['uz']
+    for name, texts in LOCALES.items():
+        assert texts.keys() == reference.keys(), name
+        for key, template in texts.items():
+            assert placeholders(template) == placeholders(reference[key]), f"{name}.{key}"
+
+
+def test_mismatched_placeholder_is_rejected():
+    broken = {'uz': {'greeting': "Salom, {name}!"}, 'ru': {'greeting': "Привет, {first_name}!"}}
+    with pytest.raises(ValueError, match="ru.greeting"):
+        validate_locales(broken)
+
+
+def test_language_code_resolution():
+    catalog = MessageCatalog()
+    assert catalog.locale('ru-RU').name == 'ru'
+    assert catalog.locale('uk').name == 'ru'
+    assert catalog.locale('uz-Latn').name == 'uz'
+    assert catalog.locale('en').name == 'uz'
+    assert catalog.locale(None).name == 'uz'
@@ -0,0 +1,54 @@
+"""SamplingFilter: bursts pass, the rest is sampled, warnings always pass"""
+
+import logging
+
+from utils.logging_utils import SamplingFilter
+
+
+def record(msg, level=logging.INFO, event=None):
+    rec = logging.LogRecord('test', level, __file__, 0, msg, (), None)
+    if event:
+        rec.event = event
+    return rec
+
+
+def test_burst_then_sampling():
+    sampler = SamplingFilter(burst=3, interval=60, sample_every=5)
+    passed = [sampler.filter(record("x", event='tick')) for _ in range(10)]
+    # 3 in the burst, then only the 5th and 10th record of the window
+    assert passed == [True, True, True, False, True, False, False, False, False, True]
+
+
+def test_warnings_are_never_dropped():
+    sampler = SamplingFilter(burst=1, interval=60, sample_every=1000)
+    assert all(sampler.filter(record("boom", level=logging.WARNING, event='e')) for _ in range(50))
+
+
+def test_events_are_sampled_independently():
+    sampler = SamplingFilter(burst=1, interval=60, sample_every=1000)
+    assert sampler.filter(record("a", event='a'))
+    assert not sampler.filter(record("a", event='a'))
+    assert sampler.filter(record("b", event='b'))
+
+
+def test_drop_count_reported_when_window_resets(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('utils.logging_utils.time.monotonic', lambda: now[0])
+    sampler = SamplingFilter(burst=1, interval=1, sample_every=1000)
+    for _ in range(4):
+        sampler.filter(record("x", event='tick'))
+    now[0] += 1
+    fresh = record("x", event='tick')
+    assert sampler.filter(fresh)
+    assert fresh.sampled_out == 3
+
+
+def test_expired_windows_are_pruned(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('utils.logging_utils.time.monotonic', lambda: now[0])
+    sampler = SamplingFilter(interval=1)
+    for i in range(1000):
+        sampler.filter(record(f"third-party message {i}"))
+    now[0] += 2
+    sampler.filter(record("later"))
+    assert len(sampler._windows) == 1
@@ -0,0 +1,79 @@
+"""Outbox: outages are deferred and retried, permanent errors are dropped"""
+
+import asyncio
+
+from telegram.error import BadRequest, Forbidden, TimedOut
+
+from database import Database
+from utils.circuit_breaker import CircuitBreaker
+from utils.outbox import Outbox
+
+
+class FakeBot:
+    """send_message raising errors[chat_id] if set, else recording the message"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        error = self.errors.get(chat_id)
+        if error:
+            raise error
+        self.sent.append(chat_id)
+
+
+def make_outbox(tmp_path, batch_size=50):
+    db = Database(str(tmp_path / "outbox.db"))
+    return db, Outbox(db, CircuitBreaker(), batch_size=batch_size)
+
+
+def test_bad_request_head_message_is_dropped_and_rest_delivered(tmp_path):
+    db, outbox = make_outbox(tmp_path, batch_size=2)
+    for chat_id in (1, 2, 3, 4):
+        db.enqueue_outbox(chat_id, f"hi {chat_id}")
+    outbox.pending = db.count_outbox()
+    bot = FakeBot({1: BadRequest("Chat not found")})
+
+    sent = asyncio.run(outbox.drain(bot))
+
+    assert sent == 3
+    assert bot.sent == [2, 3, 4]
+    assert db.count_outbox() == 0
+    assert outbox.pending == 0
+
+
+def test_forbidden_is_dropped(tmp_path):
+    db, outbox = make_outbox(tmp_path)
+    db.enqueue_outbox(1, "hi")
+    db.enqueue_outbox(2, "hi")
+    outbox.pending = 2
+    bot = FakeBot({1: Forbidden("bot was blocked by the user")})
+
+    assert asyncio.run(outbox.drain(bot)) == 1
+    assert bot.sent == [2]
+    assert db.count_outbox() == 0
+
+
+def test_outage_stops_drain_and_keeps_messages(tmp_path):
+    db, outbox = make_outbox(tmp_path)
+    for chat_id in (1, 2, 3):
+        db.enqueue_outbox(chat_id, "hi")
+    outbox.pending = 3
+    bot = FakeBot({2: TimedOut()})
+
+    assert asyncio.run(outbox.drain(bot)) == 1
+    assert bot.sent == [1]
+    assert db.count_outbox() == 2
+
+
+def test_send_defers_outages_but_not_bad_requests(tmp_path):
+    db, outbox = make_outbox(tmp_path)
+    bot = FakeBot({1: TimedOut(), 2: BadRequest("Message is too long")})
+
+    assert asyncio.run(outbox.send(bot, 1, "hi")) is True
+    assert asyncio.run(outbox.send(bot, 2, "hi")) is False
+    assert asyncio.run(outbox.send(bot, 3, "hi")) is True
+    assert bot.sent == [3]
+    assert db.count_outbox() == 1
+    assert outbox.pending == 1
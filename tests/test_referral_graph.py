@@ -0,0 +1,52 @@
+"""ReferralGraph: ring detection, bursts and report ids"""
+
+from utils.referral_graph import ReferralGraph, report_user_ids
+
+
+def make_graph(edges):
+    graph = ReferralGraph()
+    graph.load(edges)
+    return graph
+
+
+def test_tree_has_no_rings():
+    graph = make_graph([(1, 2, 0), (1, 3, 0), (2, 4, 0), (4, 5, 0)])
+    assert graph.cycles() == []
+    assert graph.subtree_size(1) == 4
+    assert graph.depth(5) == 3
+
+
+def test_rings_are_found():
+    graph = make_graph([
+        (1, 2, 0), (2, 3, 0), (3, 1, 0),
+        (3, 4, 0),
+        (10, 11, 0), (11, 10, 0),
+    ])
+    assert sorted(graph.cycles()) == [[1, 2, 3], [10, 11]]
+
+
+def test_ring_closed_by_a_new_referral():
+    graph = make_graph([(1, 2, 0), (2, 3, 0)])
+    assert graph.cycles() == []
+    graph.add_edge(3, 1, 0)
+    assert graph.cycles() == [[1, 2, 3]]
+    assert graph.subtree_size(1) == 2
+
+
+def test_deep_chain_does_not_recurse():
+    graph = make_graph([(i, i + 1, 0) for i in range(1, 5000)] + [(5000, 1, 0)])
+    assert graph.cycles() == [list(range(1, 5001))]
+
+
+def test_bursts_and_report_user_ids():
+    graph = make_graph(
+        [(1, 100 + i, 1000 + i) for i in range(5)]
+        + [(2, 200 + i, i * 3600) for i in range(5)]
+        + [(7, 8, 0), (8, 7, 0)]
+    )
+    bursts = graph.bursts(window=60, min_size=3)
+    assert [burst['referrer_id'] for burst in bursts] == [1]
+    assert bursts[0]['burst_size'] == 5
+    report = graph.report(window=60, min_size=3)
+    assert report['ring_count'] == 1
+    assert report_user_ids(report) == [7, 8, 1]
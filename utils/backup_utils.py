@@ -0,0 +1,188 @@
+"""
+Backup utility functions
+Compressed, checksummed database snapshots with retention and offline verification
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import List, Optional
+
+SNAPSHOT_SUFFIX = ".db.gz"
+CHECKSUM_SUFFIX = ".sha256"
+
+# Row counts shown by verify_snapshot so a restore can be sanity-checked at a glance
+VERIFY_TABLES = ('users', 'referrals', 'winners', 'draws', 'campaigns')
+
+_LABEL = re.compile(r"[^a-z0-9_-]+")
+
+
+class _HashingWriter:
+    """File wrapper that hashes everything written through it"""
+    
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+    
+    def write(self, data):
+        self.sha256.update(data)
+        return self.f.write(data)
+    
+    def flush(self):
+        self.f.flush()
+
+
+def clean_label(label: str) -> str:
+    """Snapshot label safe for a file name ("pre-draw", "auto", ...)"""
+    return _LABEL.sub("-", label.lower()).strip("-")[:32] or "manual"
+
+
+def snapshot_path(directory: str, label: str, now: Optional[datetime] = None) -> str:
+    """
+    quiz_bot-YYYYMMDD-HHMMSS-ffffff-<label>.db.gz inside directory; the
+    microseconds keep a /backup and a scheduled run in the same second apart
+    """
+    stamp = (now or datetime.now()).strftime('%Y%m%d-%H%M%S-%f')
+    return os.path.join(directory, f"quiz_bot-{stamp}-{clean_label(label)}{SNAPSHOT_SUFFIX}")
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def compress_snapshot(db_path: str, gz_path: str) -> str:
+    """
+    Gzip a finished backup copy and write its checksum file.
+
+    The SHA-256 of the .gz is computed while it is written and stored as
+    "<digest>  <name>" in <gz_path>.sha256, so `sha256sum -c` checks it too.
+    """
+    partial = gz_path + ".part"
+    with open(db_path, 'rb') as src, open(partial, 'wb') as raw:
+        out = _HashingWriter(raw)
+        with gzip.GzipFile(filename=os.path.basename(db_path), mode='wb', fileobj=out, compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    # Only complete snapshots ever carry the final name
+    os.replace(partial, gz_path)
+    
+    digest = out.sha256.hexdigest()
+    with open(gz_path + CHECKSUM_SUFFIX, 'w') as f:
+        f.write(f"{digest}  {os.path.basename(gz_path)}\n")
+    return digest
+
+
+def list_snapshots(directory: str, label: Optional[str] = None) -> List[str]:
+    """Snapshot paths in directory, oldest first (names sort by timestamp)"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.endswith(SNAPSHOT_SUFFIX))
+    if label is not None:
+        names = [name for name in names if name.endswith(f"-{clean_label(label)}{SNAPSHOT_SUFFIX}")]
+    return [os.path.join(directory, name) for name in names]
+
+
+def apply_retention(directory: str, label: str, keep: int) -> List[str]:
+    """Delete all but the newest `keep` snapshots with this label; returns removed paths"""
+    snapshots = list_snapshots(directory, label)
+    removed = snapshots[:-keep] if keep > 0 else []
+    for path in removed:
+        for stale in (path, path + CHECKSUM_SUFFIX):
+            if os.path.exists(stale):
+                os.remove(stale)
+    return removed
+
+
+def create_snapshot(db, directory: str, label: str = "manual", keep: int = 14,
+                    pages: int = 256, sleep: float = 0.005) -> dict:
+    """
+    Take an online backup of the live database into a compressed snapshot.
+
+    The page-stepped copy is written next to the snapshots, compressed,
+    checksummed and removed; older snapshots with the same label beyond
+    `keep` are then deleted. Raises on failure, leaving no partial
+    snapshot behind.
+    """
+    os.makedirs(directory, exist_ok=True)
+    started = time.monotonic()
+    gz_path = snapshot_path(directory, label)
+    fd, copy_path = tempfile.mkstemp(suffix=".db", prefix="backup_", dir=directory)
+    os.close(fd)
+    try:
+        copied = db.backup_to(copy_path, pages, sleep)
+        if copied is None:
+            raise RuntimeError("online backup failed")
+        digest = compress_snapshot(copy_path, gz_path)
+    finally:
+        os.remove(copy_path)
+        if os.path.exists(gz_path + ".part"):
+            os.remove(gz_path + ".part")
+    
+    removed = apply_retention(directory, label, keep)
+    return {
+        'path': gz_path,
+        'sha256': digest,
+        'bytes': os.path.getsize(gz_path),
+        'db_bytes': copied['pages'] * copied['page_size'],
+        'seconds': round(time.monotonic() - started, 1),
+        'removed': len(removed)
+    }
+
+
+def verify_snapshot(gz_path: str, restore_to: Optional[str] = None) -> dict:
+    """
+    Check a snapshot without touching the live database.
+
+    Compares the .gz against its checksum file, decompresses it to a
+    scratch file, runs PRAGMA integrity_check and counts the main tables.
+    With restore_to, the verified copy is moved there. Returns 'ok' plus
+    the individual results.
+    """
+    result = {'path': gz_path, 'checksum': None, 'integrity': None, 'tables': {}, 'ok': False}
+    
+    checksum_path = gz_path + CHECKSUM_SUFFIX
+    if os.path.exists(checksum_path):
+        with open(checksum_path) as f:
+            expected = f.read().split()[0]
+        result['checksum'] = 'ok' if file_sha256(gz_path) == expected else 'mismatch'
+    else:
+        result['checksum'] = 'missing'
+    if result['checksum'] == 'mismatch':
+        return result
+    
+    fd, copy_path = tempfile.mkstemp(suffix=".db", prefix="verify_",
+                                     dir=os.path.dirname(os.path.abspath(restore_to)) if restore_to else None)
+    os.close(fd)
+    try:
+        with gzip.open(gz_path, 'rb') as src, open(copy_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        
+        conn = sqlite3.connect(f"file:{copy_path}?mode=ro", uri=True)
+        try:
+            result['integrity'] = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table in VERIFY_TABLES:
+                if table in existing:
+                    result['tables'][table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        finally:
+            conn.close()
+        
+        result['ok'] = result['integrity'] == 'ok' and result['checksum'] == 'ok'
+        if restore_to and result['ok']:
+            os.replace(copy_path, restore_to)
+            result['restored_to'] = restore_to
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        result['integrity'] = str(e)
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+    return result
@@ -0,0 +1,229 @@
+"""
+Callback query router
+Dispatches inline-button callbacks by prefix with typed parameters through a
+middleware chain (metrics, rate limits, admin ACL)
+"""
+
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from utils.flood_control import TokenBuckets
+
+logger = logging.getLogger(__name__)
+
+# callback_data is "prefix" or "prefix:param:param"; Telegram allows 64 bytes
+SEPARATOR = ":"
+MAX_DATA_BYTES = 64
+
+
+def callback_data(prefix: str, *params) -> str:
+    """Encode a route prefix and its parameters as callback_data"""
+    data = SEPARATOR.join([prefix, *(str(param) for param in params)])
+    if len(data.encode('utf-8')) > MAX_DATA_BYTES:
+        raise ValueError(f"callback_data longer than {MAX_DATA_BYTES} bytes: {data!r}")
+    return data
+
+
+class Route:
+    """A registered prefix: its handler, parameter types and per-route options"""
+    
+    def __init__(self, prefix: str, handler: Callable, params: Tuple[type, ...] = (),
+                 admin: bool = False, rate: Optional[float] = None):
+        self.prefix = prefix
+        self.handler = handler
+        self.params = params
+        self.admin = admin
+        self.rate = rate
+        self.chain = None
+
+
+class CallbackCall:
+    """One callback query on its way through the middleware chain"""
+    
+    def __init__(self, query, context: ContextTypes.DEFAULT_TYPE, route: Route, params: tuple):
+        self.query = query
+        self.context = context
+        self.route = route
+        self.params = params
+        self.user_id = query.from_user.id
+        self.language_code = query.from_user.language_code
+        self.answered = False
+    
+    async def answer(self, text: Optional[str] = None, show_alert: bool = False):
+        """Answer the query once; later calls are ignored"""
+        if self.answered:
+            return
+        self.answered = True
+        await self.query.answer(text, show_alert=show_alert)
+
+
+Handler = Callable[[CallbackCall], Awaitable[None]]
+Middleware = Callable[[CallbackCall, Handler], Awaitable[None]]
+
+
+def _bind(middleware: Middleware, inner: Handler) -> Handler:
+    async def step(call: CallbackCall):
+        await middleware(call, inner)
+    return step
+
+
+class CallbackRouter:
+    """
+    Prefix table of callback routes.
+
+    dispatch() splits off the prefix and finds its route with one dict
+    lookup, converts the parameters with the route's types and runs the
+    route's middleware chain, composed once on first use. The query is
+    answered right before the handler runs, so the button stops spinning
+    even if the handler is slow. Unknown prefixes and parameters that do not
+    parse (buttons left over from an older version, forged data) go to the
+    fallback, which should answer with something friendly.
+    """
+    
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+        self.middleware = []
+        self.fallback: Optional[Callable] = None
+        self.unknown = 0
+    
+    def route(self, prefix: str, handler: Handler, params: Tuple[type, ...] = (),
+              admin: bool = False, rate: Optional[float] = None) -> Route:
+        """Register handler for callback_data starting with prefix"""
+        if SEPARATOR in prefix:
+            raise ValueError(f"route prefix must not contain {SEPARATOR!r}: {prefix}")
+        if prefix in self.routes:
+            raise ValueError(f"route already registered: {prefix}")
+        route = Route(prefix, handler, tuple(params), admin, rate)
+        self.routes[prefix] = route
+        return route
+    
+    def use(self, middleware: Middleware):
+        """Append a middleware; the first one added is the outermost"""
+        self.middleware.append(middleware)
+        for route in self.routes.values():
+            route.chain = None
+    
+    def set_fallback(self, handler: Callable):
+        """handler(query, context) for unknown or stale callback data"""
+        self.fallback = handler
+    
+    def _compose(self, route: Route) -> Handler:
+        async def invoke(call: CallbackCall):
+            await call.answer()
+            await route.handler(call)
+        
+        chain = invoke
+        for middleware in reversed(self.middleware):
+            chain = _bind(middleware, chain)
+        return chain
+    
+    def _parse(self, data: str) -> Tuple[Optional[Route], tuple]:
+        prefix, _, rest = data.partition(SEPARATOR)
+        route = self.routes.get(prefix)
+        if route is None:
+            return None, ()
+        values = rest.split(SEPARATOR) if rest else []
+        if len(values) != len(route.params):
+            return None, ()
+        try:
+            return route, tuple(kind(value) for kind, value in zip(route.params, values))
+        except ValueError:
+            return None, ()
+    
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """CallbackQueryHandler callback"""
+        query = update.callback_query
+        route, params = self._parse(query.data or "")
+        
+        if route is None:
+            self.unknown += 1
+            logger.info("Unknown callback data", extra={'event': 'callback_unknown', 'user_id': query.from_user.id, 'data': query.data})
+            if self.fallback:
+                await self.fallback(query, context)
+            else:
+                await query.answer()
+            return
+        
+        if route.chain is None:
+            route.chain = self._compose(route)
+        call = CallbackCall(query, context, route, params)
+        try:
+            await route.chain(call)
+        finally:
+            if not call.answered:
+                await call.answer()
+
+
+class RouteMetrics:
+    """Middleware counting calls, errors and handler time per route"""
+    
+    def __init__(self):
+        self.routes: Dict[str, dict] = {}
+    
+    async def __call__(self, call: CallbackCall, handler: Handler):
+        stats = self.routes.get(call.route.prefix)
+        if stats is None:
+            stats = self.routes[call.route.prefix] = {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+        stats['calls'] += 1
+        started = time.perf_counter()
+        try:
+            await handler(call)
+        except Exception:
+            stats['errors'] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats['seconds'] += elapsed
+            if elapsed > stats['max_seconds']:
+                stats['max_seconds'] = elapsed
+    
+    def snapshot(self) -> list:
+        """(prefix, stats) pairs, busiest route first"""
+        return sorted(((prefix, dict(stats)) for prefix, stats in self.routes.items()),
+                      key=lambda item: item[1]['calls'], reverse=True)
+
+
+class RateLimit:
+    """
+    Middleware enforcing a minimum interval between taps of a route by the
+    same user, for routes registered with rate=seconds: a one-token bucket
+    refilled every `rate` seconds in the shared flood-control buckets. The
+    first tap that comes too soon is answered with text(call), the rest of
+    the streak with an empty answer; none of them is handled.
+    """
+    
+    def __init__(self, text: Callable[[CallbackCall], str], buckets: Optional[TokenBuckets] = None):
+        self.text = text
+        self.buckets = buckets or TokenBuckets()
+        self.limited = 0
+    
+    async def __call__(self, call: CallbackCall, handler: Handler):
+        rate = call.route.rate
+        if rate:
+            drops = self.buckets.take(("route", call.route.prefix, call.user_id), 1 / rate, 1)
+            if drops:
+                self.limited += 1
+                await call.answer(self.text(call) if drops == 1 else None)
+                return
+        await handler(call)
+
+
+class AdminOnly:
+    """Middleware rejecting taps on admin=True routes by non-admins"""
+    
+    def __init__(self, is_admin: Callable[[int], bool], text: str):
+        self.is_admin = is_admin
+        self.text = text
+        self.denied = 0
+    
+    async def __call__(self, call: CallbackCall, handler: Handler):
+        if call.route.admin and not self.is_admin(call.user_id):
+            self.denied += 1
+            logger.info("Admin callback denied", extra={'event': 'callback_denied', 'user_id': call.user_id, 'route': call.route.prefix})
+            await call.answer(self.text, show_alert=True)
+            return
+        await handler(call)
@@ -0,0 +1,158 @@
+"""
+Message catalog for the Quiz Bot
+Compiles the user-facing texts and static keyboards of every locale once at
+startup and picks a locale from the user's Telegram language_code
+"""
+
+import string
+from typing import Dict, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+from utils.locales import LOCALES
+
+DEFAULT_LOCALE = 'uz'
+
+# Telegram language_code (IETF tag, primary subtag) -> locale; anything else gets DEFAULT_LOCALE
+LANGUAGE_LOCALES = {
+    'uz': 'uz',
+    'ru': 'ru',
+    'uk': 'ru',
+    'be': 'ru',
+    'kk': 'ru',
+    'ky': 'ru',
+    'tg': 'ru',
+}
+
+MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+
+class _KeepMissing(dict):
+    """format_map mapping that leaves unknown {fields} for the per-message values"""
+    
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def placeholders(template: str) -> frozenset:
+    """Names of the {fields} in a template"""
+    return frozenset(field for _, field, _, _ in string.Formatter().parse(template) if field)
+
+
+def validate_locales(locales: dict, reference: str = DEFAULT_LOCALE):
+    """
+    Raise ValueError unless every locale has the reference locale's keys with
+    the same placeholders, so a missing translation fails at startup rather
+    than on the first user who hits it.
+    """
+    expected = {key: placeholders(template) for key, template in locales[reference].items()}
+    problems = []
+    for name, texts in locales.items():
+        missing = expected.keys() - texts.keys()
+        extra = texts.keys() - expected.keys()
+        if missing:
+            problems.append(f"{name}: missing {sorted(missing)}")
+        if extra:
+            problems.append(f"{name}: unknown {sorted(extra)}")
+        for key in expected.keys() & texts.keys():
+            fields = placeholders(texts[key])
+            if fields != expected[key]:
+                problems.append(f"{name}.{key}: placeholders {sorted(fields)}, expected {sorted(expected[key])}")
+    if problems:
+        raise ValueError("Locale catalog is inconsistent: " + "; ".join(problems))
+
+
+class Locale:
+    """
+    Compiled texts and keyboards of one language.
+
+    Static values are baked into the templates at construction, and the
+    keyboards that do not depend on the user are built once and shared;
+    telegram markup objects are immutable, so reusing them is safe.
+    """
+    
+    def __init__(self, name: str, texts: Dict[str, str], static_values: dict, min_referrals: int):
+        self.name = name
+        self.min_referrals = min_referrals
+        static = _KeepMissing(static_values)
+        self._texts = {key: template.format_map(static) for key, template in texts.items()}
+        self._formatters = {key: template.format for key, template in self._texts.items()}
+        
+        self.back_button = InlineKeyboardButton(self._texts['btn_back'], callback_data="back_to_menu")
+        self.main_menu = InlineKeyboardMarkup([
+            [InlineKeyboardButton(self._texts['btn_my_results'], callback_data="my_results")],
+            [InlineKeyboardButton(self._texts['btn_invite'], callback_data="invite_friends")],
+            [InlineKeyboardButton(self._texts['btn_leaderboard'], callback_data="leaderboard")],
+            [InlineKeyboardButton(self._texts['btn_rules'], callback_data="rules")]
+        ])
+        self.back_menu = InlineKeyboardMarkup([[self.back_button]])
+        self.phone_keyboard = ReplyKeyboardMarkup(
+            [[KeyboardButton(self._texts['btn_send_phone'], request_contact=True)]],
+            one_time_keyboard=True,
+            resize_keyboard=True
+        )
+    
+    def text(self, key: str, **values) -> str:
+        """A compiled text, with its per-message placeholders filled from values"""
+        if values:
+            return self._formatters[key](**values)
+        return self._texts[key]
+    
+    def invite_keyboard(self, referral_link: str) -> InlineKeyboardMarkup:
+        """Share button for the user's own link above the shared back button"""
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton(self._texts['btn_share'], url=f"https://t.me/share/url?url={referral_link}")],
+            [self.back_button]
+        ])
+    
+    def my_results(self, referral_count: int, eligible: bool, rank: Optional[tuple] = None) -> str:
+        """User's referral results, with their leaderboard position when ranked"""
+        rank_info = self.text('results_rank', rank=rank[0], total=rank[1]) if rank else ""
+        if eligible:
+            return self.text('results_eligible', referral_count=referral_count, rank_info=rank_info)
+        return self.text('results_not_eligible', referral_count=referral_count, rank_info=rank_info,
+                         needed=self.min_referrals - referral_count)
+    
+    def leaderboard(self, entries: list, rank: Optional[tuple] = None) -> str:
+        """Top referrers with the viewing user's own rank"""
+        if not entries:
+            parts = [self._texts['leaderboard_empty']]
+        else:
+            line = self._formatters['leaderboard_line']
+            parts = [self._texts['leaderboard_header']]
+            parts.extend(
+                line(place=MEDALS.get(entry['rank'], f"{entry['rank']}."),
+                     first_name=entry['first_name'] or self._texts['leaderboard_anonymous'],
+                     referral_count=entry['referral_count'])
+                for entry in entries
+            )
+        if rank:
+            parts.append(self.text('leaderboard_rank', rank=rank[0], total=rank[1]))
+        return "".join(parts)
+    
+    def rules(self, quiz_date: Optional[str] = None) -> str:
+        """Quiz rules with the configured date"""
+        return self.text('rules', quiz_date=quiz_date or self._texts['rules_no_date'])
+
+
+class MessageCatalog:
+    """All locales, compiled once; locale() resolves a Telegram language_code"""
+    
+    def __init__(self, bot_username: str = "QuizBot", min_referrals: int = 1,
+                 group_username: str = "testforviktorina", locales: Optional[dict] = None):
+        locales = locales or LOCALES
+        validate_locales(locales)
+        static_values = {
+            'bot_username': bot_username,
+            'group_username': group_username,
+            'min_referrals': min_referrals
+        }
+        self.locales = {name: Locale(name, texts, static_values, min_referrals) for name, texts in locales.items()}
+        self.default = self.locales[DEFAULT_LOCALE]
+    
+    def locale(self, language_code: Optional[str] = None) -> Locale:
+        """Locale for a language_code such as "ru" or "uz-Latn"; the default one if unknown"""
+        if not language_code:
+            return self.default
+        name = LANGUAGE_LOCALES.get(language_code.split('-', 1)[0].lower(), DEFAULT_LOCALE)
+        return self.locales.get(name, self.default)
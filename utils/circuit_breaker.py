@@ -0,0 +1,117 @@
+"""
+Circuit breaker
+Stops outbound Bot API calls from each waiting out a full timeout while
+the API is down, and lets one probe through to find out when it is back
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from telegram.error import NetworkError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(NetworkError):
+    """Raised instead of calling the Bot API while the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate breaker over the last `window` Bot API calls.
+
+    Closed: calls go through and their outcomes are counted; once at least
+    min_calls are in the window and failure_rate of them failed, it opens.
+    Open: before_call() raises CircuitOpen at once, for cooldown seconds.
+    Half-open: the first call after the cooldown is the probe and everyone
+    else still fails fast; a successful probe closes the circuit and calls
+    on_close(), a failed one opens it for another cooldown. A probe that
+    never reports back (cancelled task) is replaced after a cooldown.
+
+    Failures are network errors, timeouts and 5xx answers; 4xx answers
+    (blocked bot, bad request, flood wait) mean the API is up.
+    """
+    
+    def __init__(self, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10, cooldown: float = 30.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.on_close: Optional[Callable[[], None]] = None
+        self.trips = 0
+        self.rejected = 0
+    
+    @property
+    def is_open(self) -> bool:
+        """True while calls would fail fast (a due probe counts as open too)"""
+        return self.state != CLOSED
+    
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go out now"""
+        if self.state == CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self.probe_started = now
+            return
+        if self.state == HALF_OPEN and now - self.probe_started >= self.cooldown:
+            self.probe_started = now
+            return
+        self.rejected += 1
+        raise CircuitOpen("Bot API circuit is open")
+    
+    def record(self, ok: bool):
+        """Count the outcome of a call that went out"""
+        if self.state == HALF_OPEN:
+            if ok:
+                self._close()
+            else:
+                self._open()
+            return
+        if self.state == OPEN:
+            # Late answers to calls sent before the trip
+            return
+        
+        if len(self.outcomes) == self.outcomes.maxlen and not self.outcomes[0]:
+            self.failures -= 1
+        self.outcomes.append(ok)
+        if not ok:
+            self.failures += 1
+            if len(self.outcomes) >= self.min_calls and self.failures >= self.failure_rate * len(self.outcomes):
+                self._open()
+    
+    def _open(self):
+        if self.state == CLOSED:
+            self.trips += 1
+            logger.warning("Bot API circuit opened", extra={'event': 'circuit_opened', 'failures': self.failures,
+                                                            'calls': len(self.outcomes)})
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+    
+    def _close(self):
+        self.state = CLOSED
+        self.outcomes.clear()
+        self.failures = 0
+        logger.info("Bot API circuit closed", extra={'event': 'circuit_closed', 'rejected': self.rejected})
+        if self.on_close:
+            self.on_close()
+    
+    def metrics(self) -> dict:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'calls': len(self.outcomes),
+            'trips': self.trips,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,67 @@
+"""
+Conversation state
+What each user's next text message means, kept in memory and written
+through to the database so it survives restarts
+"""
+
+import logging
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# conversation_states.state; idle users are not stored at all
+IDLE = 0
+AWAITING_PHONE = 1
+ADMIN_SET_DATE = 2
+
+STATE_NAMES = {IDLE: 'idle', AWAITING_PHONE: 'awaiting_phone', ADMIN_SET_DATE: 'admin_set_date'}
+
+
+class ConversationStates:
+    """
+    Per-user conversation state.
+
+    get() is a dict lookup and never touches the database; set() writes
+    through to it only when the state actually changes, so repeated
+    /start taps or menu texts cost nothing. Only non-idle users are held,
+    which keeps both the dict and the table small.
+    """
+    
+    def __init__(self, store: Callable[[int, int], bool]):
+        self.store = store
+        self.states: Dict[int, int] = {}
+        self.menu_sent: Dict[int, float] = {}
+    
+    def load(self, rows: Iterable[Tuple[int, int]]):
+        """Rebuild from a stream of (user_id, state)"""
+        self.states = {user_id: state for user_id, state in rows if state in STATE_NAMES and state != IDLE}
+        logger.info("Conversation states loaded", extra={'event': 'conversation_states_loaded', 'users': len(self.states)})
+    
+    def get(self, user_id: int) -> int:
+        return self.states.get(user_id, IDLE)
+    
+    def set(self, user_id: int, state: int):
+        """Move a user to state, persisting the change"""
+        if self.states.get(user_id, IDLE) == state:
+            return
+        if state == IDLE:
+            del self.states[user_id]
+        else:
+            self.states[user_id] = state
+        # Memory stays authoritative for this run even if the write fails
+        self.store(user_id, state)
+    
+    def menu_due(self, user_id: int, interval: float) -> bool:
+        """
+        True if an idle user's stray text should get the main menu again,
+        at most once per interval seconds; the menu they already have works.
+        """
+        now = time.monotonic()
+        last = self.menu_sent.get(user_id)
+        if last is not None and now - last < interval:
+            return False
+        if len(self.menu_sent) > 10000:
+            self.menu_sent = {key: sent for key, sent in self.menu_sent.items() if now - sent < interval}
+        self.menu_sent[user_id] = now
+        return True
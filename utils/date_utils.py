@@ -0,0 +1,25 @@
+"""
+Date utility functions
+Parses admin-entered quiz dates into cutoff timestamps
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+DATE_FORMATS = ["%d.%m.%Y %H:%M", "%d.%m.%Y"]
+
+
+def parse_quiz_date(text: str, utc_offset_hours: float = 5) -> Optional[datetime]:
+    """
+    Parse "DD.MM.YYYY" or "DD.MM.YYYY HH:MM" in the quiz's local time.
+
+    A date without a time means the start of that day. Returns a timezone-aware
+    datetime, or None if the text matches neither format.
+    """
+    tz = timezone(timedelta(hours=utc_offset_hours))
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), date_format).replace(tzinfo=tz)
+        except ValueError:
+            continue
+    return None
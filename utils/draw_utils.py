@@ -0,0 +1,163 @@
+"""
+Winner draw utilities
+Reproducible, streaming uniform or referral-weighted sampling of quiz winners
+"""
+
+import hashlib
+import heapq
+import logging
+import math
+import random
+import secrets
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+FIRST_PRIZE = "Blender (1-o'rin)"
+VOUCHER_PRIZE = "100,000 so'm vaucher"
+PRIZES = [FIRST_PRIZE] + [VOUCHER_PRIZE] * 5
+
+# Recorded with every draw; bump the version if the sampling or digest changes
+ALGORITHM_WEIGHTED = "a-res-mt19937-v1/weighted"
+ALGORITHM_UNIFORM = "a-res-mt19937-v1/uniform"
+
+
+def reservoir_sample(candidates: Iterable[Tuple[int, int]], k: int, weighted: bool,
+                     rng: random.Random) -> Tuple[List[int], int]:
+    """
+    Pick k user_ids from a stream of (user_id, referral_count) in one pass.
+
+    Uses the Efraimidis-Spirakis A-Res algorithm: every candidate gets the key
+    log(u) / weight and the k largest keys win, so only a k-sized heap is kept
+    in memory. With weighted=False every weight is 1, which is a uniform
+    sample. Exactly one rng.random() call is made per candidate, so the result
+    depends only on the seed and the candidate order. Returns the winners
+    ordered by key (best first) and the number of candidates seen.
+    """
+    heap = []
+    seen = 0
+    for user_id, referral_count in candidates:
+        seen += 1
+        weight = max(referral_count, 1) if weighted else 1
+        # 1 - random() is in (0, 1], so the log is always defined
+        key = math.log(1.0 - rng.random()) / weight
+        if len(heap) < k:
+            heapq.heappush(heap, (key, user_id))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, user_id))
+    
+    winners = [user_id for _, user_id in sorted(heap, reverse=True)]
+    return winners, seen
+
+
+def _digesting(entries: Iterable[Tuple[int, int, int]], digest) -> Iterator[Tuple[int, int]]:
+    """Feed snapshot rows into a hash while yielding (user_id, weight)"""
+    for position, user_id, weight in entries:
+        digest.update(f"{position}:{user_id}:{weight}\n".encode())
+        yield user_id, weight
+
+
+def hash_seed(seed: str) -> str:
+    """Commitment published before a draw: SHA-256 of the hex seed"""
+    return hashlib.sha256(seed.encode()).hexdigest()
+
+
+class DrawEngine:
+    def __init__(self, database):
+        self.db = database
+        self.config = Config()
+    
+    def prepare(self) -> Optional[dict]:
+        """
+        Commit to a new draw before any winner is chosen.
+
+        Generates a secret seed, freezes the eligible set as an ordered
+        snapshot and computes its digest. The returned seed_hash and
+        snapshot_digest are meant to be published before execute() runs.
+        Draws with too few participants are cancelled right away.
+        """
+        seed = secrets.token_hex(32)
+        algorithm = ALGORITHM_WEIGHTED if self.config.draw_weighted else ALGORITHM_UNIFORM
+        
+        draw = self.db.create_draw(seed, hash_seed(seed), algorithm)
+        if not draw:
+            return None
+        
+        if draw['participant_count'] < len(PRIZES):
+            self.db.cancel_draw(draw['draw_id'])
+            return draw
+        
+        digest = hashlib.sha256()
+        for _ in _digesting(self.db.iter_draw_entries(draw['draw_id']), digest):
+            pass
+        
+        if not self.db.set_draw_digest(draw['draw_id'], digest.hexdigest()):
+            return None
+        
+        draw['seed_hash'] = hash_seed(seed)
+        draw['snapshot_digest'] = digest.hexdigest()
+        return draw
+    
+    def _replay(self, draw: dict) -> Tuple[List[int], str]:
+        """Run the sampling for a draw over its snapshot; returns (winner_ids, digest)"""
+        rng = random.Random(int(draw['seed'], 16))
+        digest = hashlib.sha256()
+        winner_ids, _ = reservoir_sample(
+            _digesting(self.db.iter_draw_entries(draw['draw_id']), digest),
+            len(PRIZES),
+            draw['algorithm'] == ALGORITHM_WEIGHTED,
+            rng
+        )
+        return winner_ids, digest.hexdigest()
+    
+    def execute(self, draw_id: int) -> List[dict]:
+        """
+        Choose the winners of a prepared draw and store them in one transaction.
+
+        Returns the winner dicts (with a 'prize_type' key, first prize first),
+        or an empty list if the draw is not pending or its snapshot changed.
+        """
+        draw = self.db.get_draw(draw_id)
+        if not draw or draw['status'] != 'committed':
+            return []
+        
+        winner_ids, digest = self._replay(draw)
+        if digest != draw['snapshot_digest']:
+            logger.error("Draw snapshot digest mismatch", extra={'event': 'draw_digest_mismatch', 'draw_id': draw_id})
+            return []
+        
+        winners = self.db.get_users_by_ids(winner_ids)
+        for winner, prize_type in zip(winners, PRIZES):
+            winner['prize_type'] = prize_type
+        
+        if not self.db.complete_draw(draw_id, [(w['user_id'], w['prize_type']) for w in winners]):
+            return []
+        
+        return winners
+    
+    def verify(self, draw_id: int) -> Optional[dict]:
+        """
+        Re-run a completed draw deterministically and compare with the record.
+
+        Makes a single streaming pass over the frozen snapshot, checking the
+        seed against its published hash, the snapshot digest and the winners.
+        """
+        draw = self.db.get_draw(draw_id)
+        if not draw or draw['status'] != 'completed':
+            return None
+        
+        winner_ids, digest = self._replay(draw)
+        result = {
+            'draw_id': draw_id,
+            'seed': draw['seed'],
+            'seed_hash': draw['seed_hash'],
+            'participant_count': draw['participant_count'],
+            'seed_ok': hash_seed(draw['seed']) == draw['seed_hash'],
+            'digest_ok': digest == draw['snapshot_digest'],
+            'winners_ok': winner_ids == draw['winners'],
+            'winners': winner_ids
+        }
+        result['ok'] = result['seed_ok'] and result['digest_ok'] and result['winners_ok']
+        return result
@@ -0,0 +1,70 @@
+"""
+Export utility functions
+Streams database rows into CSV or XLSX files with bounded memory
+"""
+
+import csv
+import gzip
+import os
+import shutil
+from typing import Iterator, Optional
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX export is optional
+    Workbook = None
+
+EXPORT_KINDS = ('participants', 'winners', 'referrals', 'users')
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+
+class ExportProgress:
+    """Row counter shared between the writer thread and the handler"""
+    
+    def __init__(self, total: Optional[int] = None):
+        self.total = total
+        self.rows = 0
+
+
+def xlsx_available() -> bool:
+    return Workbook is not None
+
+
+def write_csv(rows: Iterator[tuple], path: str, progress: ExportProgress):
+    """
+    Write an export stream (header first) to a CSV file.
+
+    Uses a UTF-8 BOM so Excel opens Uzbek/Cyrillic names correctly. Rows go
+    straight from the cursor to the file buffer, so memory stays flat.
+    """
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(next(rows))
+        for row in rows:
+            writer.writerow(row)
+            progress.rows += 1
+
+
+def write_xlsx(rows: Iterator[tuple], path: str, progress: ExportProgress, title: str = "export"):
+    """
+    Write an export stream (header first) to an XLSX file.
+
+    openpyxl's write-only workbook streams rows to disk instead of keeping
+    the sheet in memory.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(next(rows))
+    for row in rows:
+        sheet.append(row)
+        progress.rows += 1
+    workbook.save(path)
+
+
+def gzip_file(path: str) -> str:
+    """Compress a finished export next to itself, remove the original and return the new path"""
+    gz_path = path + ".gz"
+    with open(path, 'rb') as src, gzip.open(gz_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.remove(path)
+    return gz_path
@@ -0,0 +1,155 @@
+"""
+Flood control
+Per-user token buckets checked before any handler, so one client spamming
+commands, text or button taps is dropped before it reaches the database
+"""
+
+import logging
+import time
+from collections import Counter
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Limits: kind -> (tokens per second, burst). Kinds are command names
+# ("start", "export", ...) plus the ones below; "default" covers the rest.
+KIND_TEXT = "text"
+KIND_CONTACT = "contact"
+KIND_CALLBACK = "callback"
+KIND_DEFAULT = "default"
+
+DEFAULT_LIMITS = {
+    "start": (0.2, 3),
+    "help": (0.2, 3),
+    KIND_TEXT: (0.5, 5),
+    KIND_CONTACT: (0.2, 3),
+    KIND_CALLBACK: (1.0, 6),
+    KIND_DEFAULT: (0.5, 5),
+}
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """
+    "start=0.2/3,text=0.5/5" -> {'start': (0.2, 3.0), 'text': (0.5, 5.0)}
+    on top of DEFAULT_LIMITS; malformed entries are ignored.
+    """
+    limits = dict(DEFAULT_LIMITS)
+    for item in spec.split(","):
+        kind, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            rate, burst = float(rate), float(burst)
+        except ValueError:
+            continue
+        if kind.strip() and rate > 0 and burst >= 1:
+            limits[kind.strip().lower()] = (rate, burst)
+    return limits
+
+
+class TokenBuckets:
+    """
+    Token buckets keyed by anything hashable, e.g. (kind, user_id).
+
+    A bucket is a three-slot list (tokens, last refill, drops in a row),
+    refilled lazily on take(). Buckets idle long enough to be full again
+    carry no information, so once the table passes prune_size they are
+    dropped, keeping memory proportional to recently active users.
+    """
+    
+    def __init__(self, prune_size: int = 50000):
+        self.prune_size = prune_size
+        self.next_prune = prune_size
+        self.buckets: Dict[Hashable, list] = {}
+        self.longest_refill = 0.0
+    
+    def take(self, key: Hashable, rate: float, burst: float, now: Optional[float] = None) -> int:
+        """Spend one token; returns 0 if allowed, else the number of drops in a row"""
+        if now is None:
+            now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.next_prune:
+                self.prune(now)
+            refill = burst / rate
+            if refill > self.longest_refill:
+                self.longest_refill = refill
+            self.buckets[key] = [burst - 1, now, 0]
+            return 0
+        
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            bucket[2] = 0
+            return 0
+        bucket[0] = tokens
+        bucket[2] += 1
+        return bucket[2]
+    
+    def prune(self, now: float):
+        """Forget buckets untouched for longer than the slowest full refill"""
+        horizon = now - self.longest_refill
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[1] > horizon}
+        # With that many users all active, wait for the table to double before scanning again
+        self.next_prune = max(self.prune_size, 2 * len(self.buckets))
+
+
+class FloodGuard:
+    """
+    TypeHandler callback for handler group -1.
+
+    Classifies each update (command name, text, contact, callback), spends
+    a token from the sender's bucket for that kind and raises
+    ApplicationHandlerStop when it is empty, so no later handler, database
+    call or reply runs. Only the first drop of a streak costs anything: a
+    log line and, for button taps, an answer with text(language_code).
+    Membership updates and updates without a user are never limited.
+    """
+    
+    def __init__(self, limits: Dict[str, Tuple[float, float]], text: Callable[[Optional[str]], str],
+                 buckets: Optional[TokenBuckets] = None):
+        self.limits = limits
+        self.text = text
+        self.buckets = buckets or TokenBuckets()
+        self.dropped = Counter()
+    
+    def kind(self, update: Update) -> Optional[str]:
+        """Limit kind of an update, None if it is not limited"""
+        if update.callback_query:
+            return KIND_CALLBACK
+        message = update.message
+        if message is None or message.new_chat_members or message.left_chat_member:
+            return None
+        if message.contact:
+            return KIND_CONTACT
+        text = message.text
+        if text and text.startswith("/"):
+            parts = text[1:].split(maxsplit=1)
+            command = parts[0].split("@", 1)[0].lower() if parts else ""
+            return command if command in self.limits else KIND_DEFAULT
+        return KIND_TEXT
+    
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        if user is None:
+            return
+        kind = self.kind(update)
+        if kind is None:
+            return
+        rate, burst = self.limits.get(kind) or self.limits[KIND_DEFAULT]
+        drops = self.buckets.take((kind, user.id), rate, burst)
+        if not drops:
+            return
+        
+        self.dropped[kind] += 1
+        if drops == 1:
+            logger.info("Update dropped by flood control", extra={'event': 'flood_limited', 'user_id': user.id, 'kind': kind})
+            if update.callback_query:
+                try:
+                    await update.callback_query.answer(self.text(user.language_code))
+                except Exception as e:
+                    logger.error("Failed to answer limited callback", extra={'event': 'flood_answer_failed', 'user_id': user.id, 'error': e})
+        raise ApplicationHandlerStop
@@ -0,0 +1,211 @@
+"""
+Bot API connection pools
+Separate HTTP pools for long polling, interactive replies and bulk sends,
+with per-pool timeouts, keep-alive, optional HTTP/2 and occupancy metrics
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+import httpx
+from telegram.error import NetworkError
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+
+from utils.circuit_breaker import CircuitBreaker
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+except ImportError:
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+POOL_UPDATES = "updates"
+POOL_INTERACTIVE = "interactive"
+POOL_BULK = "bulk"
+
+# Set inside bulk_traffic(); read by RoutedRequest to pick the pool of each call
+_bulk = ContextVar("bulk_traffic", default=False)
+
+
+def http2_available() -> bool:
+    return h2 is not None
+
+
+@contextlib.contextmanager
+def bulk_traffic():
+    """
+    Send the Bot API calls made inside this block (and in tasks started from
+    it) through the throttled bulk pool, away from interactive replies.
+    """
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+class MeteredRequest(HTTPXRequest):
+    """
+    HTTPXRequest with its own keep-alive limits and occupancy counters.
+
+    in_flight counts requests holding or waiting for one of the pool's
+    connections; peak is its high-water mark. Comparing them with size
+    shows whether a pool is too small (peak at size, pool timeouts) or
+    oversized.
+    """
+    
+    def __init__(self, name: str, size: int, timeout: float, pool_timeout: float,
+                 http2: bool = False, keepalive: Optional[int] = None, keepalive_expiry: float = 30.0):
+        if http2 and not http2_available():
+            logger.warning("HTTP/2 requested but h2 is not installed, using HTTP/1.1", extra={'event': 'http2_unavailable', 'pool': name})
+            http2 = False
+        super().__init__(
+            connection_pool_size=size,
+            read_timeout=timeout,
+            write_timeout=timeout,
+            connect_timeout=timeout,
+            pool_timeout=pool_timeout,
+            http_version="2" if http2 else "1.1",
+        )
+        self._client_kwargs["limits"] = httpx.Limits(
+            max_connections=size,
+            max_keepalive_connections=size if keepalive is None else keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client = self._build_client()
+        
+        self.name = name
+        self.size = size
+        self.in_flight = 0
+        self.peak = 0
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+    
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> Tuple[int, bytes]:
+        self.in_flight += 1
+        if self.in_flight > self.peak:
+            self.peak = self.in_flight
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, read_timeout, write_timeout,
+                                            connect_timeout, pool_timeout)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.requests += 1
+            self.seconds += time.perf_counter() - started
+    
+    def metrics(self) -> dict:
+        return {
+            'size': self.size,
+            'in_flight': self.in_flight,
+            'peak': self.peak,
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_ms': round(self.seconds * 1000 / self.requests) if self.requests else 0,
+            'http_version': self.http_version
+        }
+
+
+class RoutedRequest(BaseRequest):
+    """
+    The application's request object for everything except getUpdates.
+
+    Calls go to the interactive pool unless made inside bulk_traffic(),
+    in which case they are paced to at most bulk_rate per second and sent
+    through the bulk pool, so a winner announcement loop or an export
+    upload never takes a connection a user's reply is waiting for. With a
+    breaker, every call is checked against it and reports its outcome, so
+    an outage fails fast instead of holding handlers for a full timeout.
+    """
+    
+    def __init__(self, interactive: MeteredRequest, bulk: MeteredRequest, bulk_rate: float = 20.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.interactive = interactive
+        self.bulk = bulk
+        self.breaker = breaker
+        self.bulk_interval = 1 / bulk_rate if bulk_rate > 0 else 0
+        self._next_bulk = 0.0
+        self._bulk_lock = asyncio.Lock()
+    
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.interactive.read_timeout
+    
+    async def initialize(self):
+        await self.interactive.initialize()
+        await self.bulk.initialize()
+    
+    async def shutdown(self):
+        await self.interactive.shutdown()
+        await self.bulk.shutdown()
+    
+    async def _pace_bulk(self):
+        """Wait for the next bulk slot; slots are handed out in arrival order"""
+        async with self._bulk_lock:
+            now = time.monotonic()
+            delay = self._next_bulk - now
+            self._next_bulk = max(now, self._next_bulk) + self.bulk_interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> Tuple[int, bytes]:
+        breaker = self.breaker
+        if breaker:
+            breaker.before_call()
+        if _bulk.get():
+            if self.bulk_interval:
+                await self._pace_bulk()
+            pool = self.bulk
+        else:
+            pool = self.interactive
+        try:
+            code, payload = await pool.do_request(url, method, request_data, read_timeout, write_timeout,
+                                                  connect_timeout, pool_timeout)
+        except NetworkError:
+            # TimedOut included
+            if breaker:
+                breaker.record(False)
+            raise
+        if breaker:
+            breaker.record(code < 500)
+        return code, payload
+
+
+def build_pools(config, breaker: Optional[CircuitBreaker] = None) -> Tuple[MeteredRequest, RoutedRequest, dict]:
+    """
+    (get_updates request, routed request for everything else, {name: pool})
+    from the HTTP_* settings in Config. getUpdates stays outside the
+    breaker; PTB already retries it with backoff.
+    """
+    # PTB adds the long-poll timeout to this pool's read timeout on every getUpdates
+    updates = MeteredRequest(
+        POOL_UPDATES, size=1, timeout=config.http_updates_timeout, pool_timeout=config.http_updates_timeout,
+        http2=config.http2, keepalive_expiry=config.http_keepalive_expiry
+    )
+    interactive = MeteredRequest(
+        POOL_INTERACTIVE, size=config.http_interactive_pool_size, timeout=config.http_interactive_timeout,
+        pool_timeout=config.http_interactive_pool_timeout, http2=config.http2,
+        keepalive_expiry=config.http_keepalive_expiry
+    )
+    bulk = MeteredRequest(
+        POOL_BULK, size=config.http_bulk_pool_size, timeout=config.http_bulk_timeout,
+        pool_timeout=config.http_bulk_timeout, http2=config.http2,
+        keepalive=1, keepalive_expiry=config.http_keepalive_expiry
+    )
+    pools = {POOL_UPDATES: updates, POOL_INTERACTIVE: interactive, POOL_BULK: bulk}
+    return updates, RoutedRequest(interactive, bulk, config.http_bulk_rate, breaker), pools
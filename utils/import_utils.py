@@ -0,0 +1,109 @@
+"""
+Import utility functions
+Reads and validates CSV/JSONL files of users and referral pairs for bulk import
+"""
+
+import csv
+import json
+from typing import Iterator, Optional, Tuple
+
+from utils.phone_utils import normalize_phone
+
+
+class ImportErrors:
+    """Counts rejected rows and keeps the first few for the report"""
+    
+    def __init__(self, keep: int = 20):
+        self.keep = keep
+        self.count = 0
+        self.samples = []
+    
+    def add(self, line: int, reason: str):
+        self.count += 1
+        if len(self.samples) < self.keep:
+            self.samples.append(f"line {line}: {reason}")
+
+
+def read_records(path: str, errors: ImportErrors) -> Iterator[Tuple[int, dict]]:
+    """Stream (line number, record) from a .csv (with header) or .jsonl file"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if path.endswith('.jsonl'):
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    errors.add(line_number, "invalid JSON")
+                    continue
+                if isinstance(record, dict):
+                    yield line_number, record
+                else:
+                    errors.add(line_number, "not a JSON object")
+        else:
+            # Line 1 is the header
+            for line_number, record in enumerate(csv.DictReader(f), 2):
+                yield line_number, record
+
+
+def _user_id(value) -> Optional[int]:
+    try:
+        user_id = int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return user_id if user_id > 0 else None
+
+
+def _text(value) -> str:
+    return str(value).strip() if value is not None else ""
+
+
+def iter_users(path: str, errors: ImportErrors, country_code: str = "998",
+               national_length: int = 9) -> Iterator[Tuple[int, str, str, Optional[str]]]:
+    """
+    Validated user rows as (user_id, username, first_name, phone_e164).
+
+    Needs a user_id column; username, first_name and phone_number are
+    optional. An unparseable phone is dropped, not the row.
+    """
+    seen = set()
+    for line_number, record in read_records(path, errors):
+        user_id = _user_id(record.get('user_id'))
+        if user_id is None:
+            errors.add(line_number, "invalid user_id")
+            continue
+        if user_id in seen:
+            errors.add(line_number, f"duplicate user_id {user_id}")
+            continue
+        seen.add(user_id)
+        
+        phone = _text(record.get('phone_number'))
+        phone_e164 = normalize_phone(phone, country_code, national_length) if phone else None
+        if phone and not phone_e164:
+            errors.add(line_number, f"invalid phone {phone!r} (row kept without phone)")
+        
+        yield (
+            user_id,
+            _text(record.get('username')).lstrip('@'),
+            _text(record.get('first_name')),
+            phone_e164
+        )
+
+
+def iter_referrals(path: str, errors: ImportErrors) -> Iterator[Tuple[int, int, Optional[str]]]:
+    """
+    Validated referral pairs as (referrer_id, referred_id, date).
+
+    date is optional and passed to SQLite as is ("YYYY-MM-DD HH:MM:SS").
+    """
+    for line_number, record in read_records(path, errors):
+        referrer_id = _user_id(record.get('referrer_id'))
+        referred_id = _user_id(record.get('referred_id'))
+        if referrer_id is None or referred_id is None:
+            errors.add(line_number, "invalid referrer_id/referred_id")
+            continue
+        if referrer_id == referred_id:
+            errors.add(line_number, "self-referral")
+            continue
+        
+        yield referrer_id, referred_id, _text(record.get('date')) or None
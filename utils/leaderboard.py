@@ -0,0 +1,150 @@
+"""
+Referral leaderboard
+In-memory ranking of users by referral_count, kept in sync with the database
+"""
+
+import bisect
+import logging
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    """
+    Ranks users by referral count using a Fenwick tree over count values.
+
+    tree[c] answers "how many users have a count <= c" in O(log C), which
+    gives a user's rank (1 + users with a strictly higher count) and lets
+    top() jump from one occupied count to the next without scanning empty
+    ones. Users with equal counts share a rank and are listed by user_id;
+    each count's bucket is a sorted list of user ids, so the top-n cut
+    inside a large tie is a slice rather than a scan of the whole bucket.
+    Moving a user between buckets is a bisect plus a list shift: linear in
+    the bucket size, but a single memmove, and top() never reads the
+    count-0 bucket where most users sit.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.buckets = {}
+        self.size = 64
+        self.tree = [0] * (self.size + 1)
+    
+    def load(self, rows: Iterable[Tuple[int, int]]):
+        """Rebuild from a stream of (user_id, referral_count)"""
+        with self.lock:
+            self.counts = {}
+            self.buckets = {}
+            for user_id, count in rows:
+                self.counts[user_id] = count
+                self.buckets.setdefault(count, []).append(user_id)
+            for users in self.buckets.values():
+                users.sort()
+            self._rebuild_tree(max(self.buckets, default=0))
+        logger.info("Leaderboard loaded", extra={'event': 'leaderboard_loaded', 'users': len(self.counts)})
+    
+    def _rebuild_tree(self, max_count: int):
+        """Size the tree for max_count and rebuild it from the buckets in O(C)"""
+        while self.size <= max_count:
+            self.size *= 2
+        tree = [0] * (self.size + 1)
+        for count, users in self.buckets.items():
+            tree[count + 1] += len(users)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self.tree = tree
+    
+    def _add(self, count: int, delta: int):
+        i = count + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+    
+    def _prefix(self, count: int) -> int:
+        """Number of users with a count <= count"""
+        i = min(count + 1, self.size)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+    
+    def _kth_smallest(self, k: int) -> int:
+        """Smallest count c such that at least k users have a count <= c"""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos
+    
+    def set_count(self, user_id: int, count: int):
+        """Insert a user or move them to a new count"""
+        with self.lock:
+            old = self.counts.get(user_id)
+            if old == count:
+                return
+            if old is not None:
+                users = self.buckets[old]
+                del users[bisect.bisect_left(users, user_id)]
+                if not users:
+                    del self.buckets[old]
+                self._add(old, -1)
+            self.counts[user_id] = count
+            bisect.insort(self.buckets.setdefault(count, []), user_id)
+            if count >= self.size:
+                self._rebuild_tree(count)
+            else:
+                self._add(count, 1)
+    
+    def reset(self):
+        """Set every user's count to zero (a new campaign started)"""
+        self.load((user_id, 0) for user_id in list(self.counts))
+    
+    def rank(self, user_id: int) -> Optional[Tuple[int, int]]:
+        """(rank, total users) for a user, or None if unknown"""
+        with self.lock:
+            count = self.counts.get(user_id)
+            if count is None:
+                return None
+            total = len(self.counts)
+            return total - self._prefix(count) + 1, total
+    
+    def top(self, n: int) -> List[Tuple[int, int, int]]:
+        """Top n users with at least one referral as (rank, user_id, count)"""
+        with self.lock:
+            result = []
+            remaining = len(self.counts)
+            while len(result) < n and remaining > 0:
+                count = self._kth_smallest(remaining)
+                if count == 0:
+                    break
+                users = self.buckets[count]
+                rank = len(self.counts) - remaining + 1
+                for user_id in users[:n - len(result)]:
+                    result.append((rank, user_id, count))
+                remaining -= len(users)
+            return result
+    
+    def handle_event(self, event: str, data: dict):
+        """Database listener keeping the leaderboard in sync"""
+        if event == 'user_added':
+            if data['user_id'] not in self.counts:
+                self.set_count(data['user_id'], 0)
+        elif event == 'referral_added':
+            self.set_count(data['referrer_id'], data['referral_count'])
+        elif event == 'counters_reset':
+            self.reset()
+        elif event == 'counts_recomputed':
+            self.load(data['counts']())
+        elif event == 'referral_counts_repaired':
+            for user_id, count in data['counts']:
+                self.set_count(user_id, count)
@@ -0,0 +1,296 @@
+"""
+User-facing texts of the Quiz Bot per locale
+Compiled by utils.catalog; every locale must define the same keys with the
+same {placeholders}. {min_referrals} and {group_username} are filled in from
+the configuration at startup, the rest per message.
+"""
+
+UZ = {
+    # Buttons
+    'btn_my_results': "📊 Mening natijam",
+    'btn_invite': "👥 Do'stlarni taklif qilish",
+    'btn_leaderboard': "🏆 Reyting",
+    'btn_rules': "📋 Qoidalar",
+    'btn_back': "🔙 Asosiy menyu",
+    'btn_share': "📤 Havola ulashish",
+    'btn_send_phone': "📱 Raqamni yuborish",
+    
+    'welcome': """
+Universal aka kanalining viktorina botiga xush kelibsiz!
+
+Kanalimiz rivojiga qo'shgan hissangiz hisobiga kanal nomidan o'ynaladigan yutuqli o'yinda qatnashish imkoniyatiga ega bo'lasiz.
+
+Quyidagi tugmalardan birini tanlang:
+""",
+    
+    'results_eligible': """
+📊 **Sizning natijangiz:**
+
+✅ Taklif qilingan do'stlar: {referral_count}
+✅ Viktorina huquqi: Mavjud{rank_info}
+
+🎉 Tabriklaymiz! Siz viktorinaga qatnasha olasiz!
+""",
+    'results_not_eligible': """
+📊 **Sizning natijangiz:**
+
+👥 Taklif qilingan do'stlar: {referral_count}
+❌ Viktorina huquqi: Yo'q{rank_info}
+
+Viktorinaga qatnashish uchun yana {needed} ta do'st taklif qilishingiz kerak.
+""",
+    'results_rank': "\n🏆 Reytingdagi o'rningiz: {rank} / {total}",
+    
+    'leaderboard_empty': "🏆 **Reyting**\n\nHozircha hech kim do'st taklif qilmagan.",
+    'leaderboard_header': "🏆 **Reyting - eng faol ishtirokchilar:**\n\n",
+    'leaderboard_line': "{place} {first_name} - {referral_count} ta do'st\n",
+    'leaderboard_rank': "\n📍 Sizning o'rningiz: {rank} / {total}",
+    'leaderboard_anonymous': "Ishtirokchi",
+    
+    'invite_friends': """🎉 **Bepul viktorinaga taklif qilaman!**
+
+Ajoyib sovrinlar va kutilmagan g'alabalar kutmoqda:
+🏆 1-o'rin: Blender
+💰 5 kishi: 100,000 so'm pul yutug'i
+
+Siz ham ishtirok eting! Quyidagi havola orqali guruhga qo'shiling:
+{referral_link}
+
+⏰ Cheklanmagan vaqt yo'q - hoziroq ulanib qoling!""",
+    
+    'rules': """
+📋 **Viktorina qoidalari:**
+
+**🎯 Qatnashish shartlari:**
+• @{group_username} guruhiga a'zo bo'lish shart
+• Kamida {min_referrals} ta do'stni taklif qilish kerak
+• Har bir do'st avval referal link orqali guruhga qo'shilishi shart!
+• Faqat haqiqiy foydalanuvchilar hisobga olinadi
+
+**🏆 Sovrinlar:**
+• 1-o'rin: Blender
+• 5 kishi: 100,000 so'm vaucher
+
+**📝 Viktorina jarayoni:**
+• G'oliblar random tanlash orqali aniqlanadi
+• Barcha talablarni bajargan qatnashuvchilar o'rtasidan
+• Natijalar e'lon qilinganidan keyin o'zgartirilmaydi
+
+📅 **Viktorina sanasi:** {quiz_date}
+
+**📞 Aloqa:**
+Savollar uchun administratorlar bilan bog'laning:
+https://t.me/doniyorjon_k
+""",
+    'rules_no_date': "Admin tomonidan belgilanadi",
+    
+    'help': """
+ℹ️ **Yordam:**
+
+Bu bot maishiy texnika do'koni viktorinasi uchun mo'ljallangan.
+
+**Asosiy buyruqlar:**
+• /start - Botni ishga tushirish
+• /help - Yordam ma'lumotlari
+
+**Qanday ishlaydi:**
+1. Botni ishga tushiring
+2. Do'stlaringizni taklif qiling
+3. Viktorinaga qatnashish huquqini qo'lga kiriting
+4. G'olib bo'lish uchun omad tilang!
+
+Batafsil ma'lumot uchun "Qoidalar" tugmasini bosing.
+""",
+    
+    'referral_success': """
+🎉 **Yangi referal!**
+
+{name} sizning havolangiz orqali botga qo'shildi!
+
+Referallaringiz soni yangilandi. Natijalarni "Mening natijam" tugmasi orqali ko'ring.
+""",
+    'referral_joined_group': (
+        "🎉 Tabriklaymiz!\n\n"
+        "Sizning referalingiz orqali {name} guruhga qo'shildi!\n"
+        "Sizning referal soningiz: {referral_count}\n"
+        "Viktorinaga qatnashish huquqi: {eligible}"
+    ),
+    'eligible_yes': "✅ Bor",
+    'eligible_no': "❌ Yo'q",
+    
+    'join_group_first': (
+        "📢 Viktorinaga qatnashish uchun avval @{group_username} guruhiga qo'shiling!\n\n"
+        "🔗 Guruh havola: https://t.me/{group_username}\n\n"
+        "Guruhga qo'shilganingizdan so'ng, /start buyrug'ini qayta yuboring."
+    ),
+    'group_welcome': (
+        "🎉 @{group_username} guruhiga xush kelibsiz!\n\n"
+        "Viktorinaga qatnashish uchun botni ishga tushiring: /start"
+    ),
+    
+    'phone_request': (
+        "📱 **Telefon raqamingizni kiriting**\n\n"
+        "Viktorinada g'olib bo'lganingizda shu raqam orqali aniqlanasiz.\n\n"
+        "Raqamni quyidagi tugma orqali yuboring yoki qo'lda kiriting:\n"
+        "Masalan: +998901234567"
+    ),
+    'phone_saved': (
+        "✅ Telefon raqamingiz muvaffaqiyatli saqlandi!\n\n"
+        "Endi viktorinada g'olib bo'lganingizda shu raqam orqali aniqlanasiz."
+    ),
+    'phone_taken': (
+        "❌ Bu telefon raqami boshqa akkauntda ro'yxatdan o'tgan.\n\n"
+        "Har bir raqam faqat bitta akkaunt uchun ishlatilishi mumkin."
+    ),
+    'phone_invalid': "❌ Noto'g'ri raqam formati. Qayta urinib ko'ring.",
+    
+    'error': "❌ Xatolik yuz berdi. Iltimos, qayta urinib ko'ring.",
+    'callback_stale': "Bu tugma eskirgan. /start buyrug'ini yuboring.",
+    'callback_too_fast': "⏳ Biroz kuting...",
+}
+
+RU = {
+    # Buttons
+    'btn_my_results': "📊 Мои результаты",
+    'btn_invite': "👥 Пригласить друзей",
+    'btn_leaderboard': "🏆 Рейтинг",
+    'btn_rules': "📋 Правила",
+    'btn_back': "🔙 Главное меню",
+    'btn_share': "📤 Поделиться ссылкой",
+    'btn_send_phone': "📱 Отправить номер",
+    
+    'welcome': """
+Добро пожаловать в бот викторины канала Universal aka!
+
+За ваш вклад в развитие нашего канала вы получаете возможность участвовать в розыгрыше призов от имени канала.
+
+Выберите одну из кнопок ниже:
+""",
+    
+    'results_eligible': """
+📊 **Ваш результат:**
+
+✅ Приглашено друзей: {referral_count}
+✅ Участие в викторине: Есть{rank_info}
+
+🎉 Поздравляем! Вы можете участвовать в викторине!
+""",
+    'results_not_eligible': """
+📊 **Ваш результат:**
+
+👥 Приглашено друзей: {referral_count}
+❌ Участие в викторине: Нет{rank_info}
+
+Чтобы участвовать в викторине, пригласите ещё {needed} друзей.
+""",
+    'results_rank': "\n🏆 Ваше место в рейтинге: {rank} / {total}",
+    
+    'leaderboard_empty': "🏆 **Рейтинг**\n\nПока никто не пригласил друзей.",
+    'leaderboard_header': "🏆 **Рейтинг - самые активные участники:**\n\n",
+    'leaderboard_line': "{place} {first_name} - друзей: {referral_count}\n",
+    'leaderboard_rank': "\n📍 Ваше место: {rank} / {total}",
+    'leaderboard_anonymous': "Участник",
+    
+    'invite_friends': """🎉 **Приглашаю на бесплатную викторину!**
+
+Отличные призы и неожиданные победы:
+🏆 1-е место: Блендер
+💰 5 человек: денежный приз 100 000 сумов
+
+Участвуйте и вы! Вступайте в группу по ссылке:
+{referral_link}
+
+⏰ Не откладывайте - присоединяйтесь прямо сейчас!""",
+    
+    'rules': """
+📋 **Правила викторины:**
+
+**🎯 Условия участия:**
+• Обязательно быть участником группы @{group_username}
+• Нужно пригласить не менее {min_referrals} друзей
+• Каждый друг должен сначала вступить в группу по реферальной ссылке!
+• Учитываются только настоящие пользователи
+
+**🏆 Призы:**
+• 1-е место: Блендер
+• 5 человек: ваучер на 100 000 сумов
+
+**📝 Проведение викторины:**
+• Победители определяются случайным выбором
+• Среди участников, выполнивших все условия
+• Результаты после объявления не меняются
+
+📅 **Дата викторины:** {quiz_date}
+
+**📞 Связь:**
+По вопросам обращайтесь к администраторам:
+https://t.me/doniyorjon_k
+""",
+    'rules_no_date': "Определяется администратором",
+    
+    'help': """
+ℹ️ **Помощь:**
+
+Этот бот предназначен для викторины магазина бытовой техники.
+
+**Основные команды:**
+• /start - Запустить бота
+• /help - Справка
+
+**Как это работает:**
+1. Запустите бота
+2. Пригласите друзей
+3. Получите право участвовать в викторине
+4. Пожелайте себе удачи!
+
+Подробности - по кнопке "Правила".
+""",
+    
+    'referral_success': """
+🎉 **Новый реферал!**
+
+{name} присоединился к боту по вашей ссылке!
+
+Число ваших рефералов обновлено. Смотрите результат по кнопке "Мои результаты".
+""",
+    'referral_joined_group': (
+        "🎉 Поздравляем!\n\n"
+        "По вашей ссылке в группу вступил(а) {name}!\n"
+        "Ваших рефералов: {referral_count}\n"
+        "Участие в викторине: {eligible}"
+    ),
+    'eligible_yes': "✅ Есть",
+    'eligible_no': "❌ Нет",
+    
+    'join_group_first': (
+        "📢 Чтобы участвовать в викторине, сначала вступите в группу @{group_username}!\n\n"
+        "🔗 Ссылка на группу: https://t.me/{group_username}\n\n"
+        "После вступления в группу отправьте /start ещё раз."
+    ),
+    'group_welcome': (
+        "🎉 Добро пожаловать в группу @{group_username}!\n\n"
+        "Чтобы участвовать в викторине, запустите бота: /start"
+    ),
+    
+    'phone_request': (
+        "📱 **Введите номер телефона**\n\n"
+        "Если вы выиграете, мы свяжемся с вами по этому номеру.\n\n"
+        "Отправьте номер кнопкой ниже или введите вручную:\n"
+        "Например: +998901234567"
+    ),
+    'phone_saved': (
+        "✅ Номер телефона сохранён!\n\n"
+        "Если вы выиграете, мы свяжемся с вами по этому номеру."
+    ),
+    'phone_taken': (
+        "❌ Этот номер уже зарегистрирован на другой аккаунт.\n\n"
+        "Каждый номер можно использовать только для одного аккаунта."
+    ),
+    'phone_invalid': "❌ Неверный формат номера. Попробуйте ещё раз.",
+    
+    'error': "❌ Произошла ошибка. Пожалуйста, попробуйте ещё раз.",
+    'callback_stale': "Эта кнопка устарела. Отправьте /start.",
+    'callback_too_fast': "⏳ Подождите немного...",
+}
+
+LOCALES = {'uz': UZ, 'ru': RU}
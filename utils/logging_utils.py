@@ -0,0 +1,123 @@
+"""
+Logging utilities for the Quiz Bot
+Queued, structured logging with sampling for high-frequency success logs
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'event'}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formatter that appends structured ``extra`` fields as key=value pairs"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        fields = [
+            f"{key}={value}"
+            for key, value in record.__dict__.items()
+            if key not in _RESERVED_ATTRS and not key.startswith('_')
+        ]
+        event = getattr(record, 'event', None)
+        if event:
+            fields.insert(0, f"event={event}")
+        if fields:
+            message = f"{message} | {' '.join(fields)}"
+        return message
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Per-event rate limiting for INFO/DEBUG records.
+
+    Records are grouped by their ``event`` field (or message template when no
+    event is given). Each group may emit ``burst`` records per ``interval``
+    seconds; after that only every ``sample_every``-th record passes until the
+    window resets. WARNING and above are never dropped. Keys include
+    third-party message templates, so windows that have expired are
+    swept out at most once per interval.
+    """
+
+    def __init__(self, burst: int = 20, interval: float = 1.0, sample_every: int = 100):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.sample_every = max(1, sample_every)
+        self._windows = {}
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = getattr(record, 'event', None) or record.msg
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = window[2] if window else 0
+                if now >= self._next_prune:
+                    self._prune(now)
+                self._windows[key] = [now, 1, 0]
+                if dropped:
+                    record.sampled_out = dropped
+                return True
+
+            window[1] += 1
+            if window[1] <= self.burst or window[1] % self.sample_every == 0:
+                return True
+
+            window[2] += 1
+            return False
+
+    def _prune(self, now: float):
+        # Expired windows go with their unreported drop counts
+        self._windows = {key: window for key, window in self._windows.items() if now - window[0] < self.interval}
+        self._next_prune = now + self.interval
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that defers message formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener lives in this process, so the record (args, exc_info)
+        # can be handed over as-is instead of being rendered on the caller.
+        return record
+
+
+def setup_logging(level: int = logging.INFO, burst: int = 20, interval: float = 1.0,
+                  sample_every: int = 100) -> logging.handlers.QueueListener:
+    """
+    Route all log records through a queue to a background writer thread.
+
+    The event loop only pays for enqueueing a record; formatting and stream
+    I/O happen on the listener thread. Returns the started listener, which is
+    also stopped automatically at interpreter exit to flush pending records.
+    """
+    log_queue = queue.SimpleQueue()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(StructuredFormatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    ))
+
+    queue_handler = _InProcessQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(burst, interval, sample_every))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,126 +1,122 @@
 """
 Message templates for the Quiz Bot
-Contains all user-facing messages in Uzbek
+Contains the admin-facing messages in Uzbek; texts shown to users are
+per-locale in utils.locales and served by utils.catalog
 """
 
+from telegram.helpers import escape_markdown
+
 class Messages:
-    def __init__(self, bot_username="QuizBot"):
-        self.min_referrals = 1
+    def __init__(self, bot_username="QuizBot", min_referrals=1):
+        self.min_referrals = min_referrals
         self.bot_username = bot_username
     
-    def welcome_message(self) -> str:
-        """Welcome message for new users"""
-        return """
-Universal aka kanalining viktorina botiga xush kelibsiz!
-
-Kanalimiz rivojiga qo'shgan hissangiz hisobiga kanal nomidan o'ynaladigan yutuqli o'yinda qatnashish imkoniyatiga ega bo'lasiz.
-
-Quyidagi tugmalardan birini tanlang:
+    def admin_participants_message(self, participants: list) -> str:
+        """Admin message showing participants"""
+        if not participants:
+            return "📋 Hozircha hech kim viktorinaga qatnasha olmaydi."
+        
+        message = "👥 **Viktorina qatnashuvchilari:**\n\n"
+        for i, participant in enumerate(participants, 1):
+            username = f"@{participant['username']}" if participant['username'] else "Username yo'q"
+            message += f"{i}. {participant['first_name']} ({username})\n"
+            message += f"   Referallar: {participant['referral_count']}\n\n"
+        
+        message += f"**Jami qatnashuvchilar: {len(participants)}**"
+        return message
     
-    def my_results_message(self, referral_count: int, eligible: bool) -> str:
-        """User's referral results message"""
-        if eligible:
-            return f"""
-📊 **Sizning natijangiz:**
-
-✅ Taklif qilingan do'stlar: {referral_count}
-✅ Viktorina huquqi: Mavjud
-
-🎉 Tabriklaymiz! Siz viktorinaga qatnasha olasiz!
-            """
-        else:
-            needed = self.min_referrals - referral_count
-            return f"""
-📊 **Sizning natijangiz:**
+    def draw_commitment_message(self, draw: dict) -> str:
+        """Seed commitment published before winners are drawn"""
+        return f"""
+🔐 **Qur'a #{draw['draw_id']} e'lon qilindi**
 
-👥 Taklif qilingan do'stlar: {referral_count}
-❌ Viktorina huquqi: Yo'q
+👥 Qatnashuvchilar: {draw['participant_count']}
+📋 Ro'yxat xeshi: `{draw['snapshot_digest']}`
+🔑 Seed xeshi (SHA-256): `{draw['seed_hash']}`
 
-Viktorinaga qatnashish uchun yana {needed} ta do'st taklif qilishingiz kerak.
-            """
+G'oliblar faqat shu ro'yxat va seed asosida aniqlanadi.
+        """
     
-    def invite_friends_message(self, referral_link: str) -> str:
-        """Beautiful invitation message to share with friends"""
-        return f"""🎉 **Bepul viktorinaga taklif qilaman!**
-
-Ajoyib sovrinlar va kutilmagan g'alabalar kutmoqda:
-🏆 1-o'rin: Blender
-💰 5 kishi: 100,000 so'm pul yutug'i
-
-Siz ham ishtirok eting! Quyidagi havola orqali guruhga qo'shiling:
-{referral_link} 
-
-⏰ Cheklanmagan vaqt yo'q - hoziroq ulanib qoling!"""
+    def draw_seed_message(self, draw_id: int, seed: str) -> str:
+        """Seed reveal appended to draw results"""
+        return f"\n🔑 Seed: `{seed}`\n🔎 Tekshirish: `/verifydraw {draw_id}`"
     
-    def rules_message(self, quiz_date: str = None) -> str:
-        """Quiz rules message"""
-        date_info = f"📅 **Viktorina sanasi:** {quiz_date}" if quiz_date else "📅 **Viktorina sanasi:** Admin tomonidan belgilanadi"
+    def draw_verification_message(self, result: dict) -> str:
+        """Result of re-running a draw from its snapshot"""
+        def mark(ok):
+            return "✅" if ok else "❌"
+        
+        verdict = "✅ Qur'a natijasi tasdiqlandi." if result['ok'] else "❌ Qur'a natijasi mos kelmadi!"
         
         return f"""
-📋 **Viktorina qoidalari:**
-
-**🎯 Qatnashish shartlari:**
-• @testforviktorina guruhiga a'zo bo'lish shart
-• Kamida {self.min_referrals} ta do'stni taklif qilish kerak
-• Har bir do'st avval referal link orqali guruhga qo'shilishi shart!
-• Faqat haqiqiy foydalanuvchilar hisobga olinadi
+🔎 **Qur'a #{result['draw_id']} tekshiruvi**
 
-**🏆 Sovrinlar:**
-• 1-o'rin: Blender
-• 5 kishi: 100,000 so'm vaucher
+{mark(result['seed_ok'])} Seed xeshga mos keladi
+{mark(result['digest_ok'])} Qatnashuvchilar ro'yxati o'zgarmagan ({result['participant_count']} ta)
+{mark(result['winners_ok'])} G'oliblar qayta hisoblashda bir xil chiqdi
 
-**📝 Viktorina jarayoni:**
-• G'oliblar random tanlash orqali aniqlanadi
-• Barcha talablarni bajargan qatnashuvchilar o'rtasidan
-• Natijalar e'lon qilinganidan keyin o'zgartirilmaydi
-
-{date_info}
-
-**📞 Aloqa:**
-Savollar uchun administratorlar bilan bog'laning:
-https://t.me/doniyorjon_k
+{verdict}
         """
     
-    def referral_success(self, referred_user_name: str) -> str:
-        """Message when someone joins via referral"""
-        return f"""
-🎉 **Yangi referal!**
-
-{referred_user_name} sizning havolangiz orqali botga qo'shildi!
-
-Referallaringiz soni yangilandi. Natijalarni "Mening natijam" tugmasi orqali ko'ring.
-        """
+    def suspicious_report_message(self, report: dict, users: dict, window: int) -> str:
+        """Referral rings and signup bursts flagged by the referral graph"""
+        def name(user_id):
+            user = users.get(user_id)
+            if not user:
+                return str(user_id)
+            # Names are user-supplied; an unescaped "_" or "*" breaks the Markdown message
+            username = f" (@{escape_markdown(user['username'])})" if user['username'] else ""
+            return f"{escape_markdown(user['first_name']) if user['first_name'] else user_id}{username}"
+        
+        if not report['ring_count'] and not report['burst_count']:
+            return "✅ Shubhali referal guruhlari topilmadi."
+        
+        message = "⚠️ **Shubhali referallar**\n\n"
+        if report['ring_count']:
+            message += f"**🔁 Referal halqalari: {report['ring_count']}**\n"
+            for i, ring in enumerate(report['rings'], 1):
+                message += f"{i}. " + ", ".join(name(user_id) for user_id in ring[:5])
+                if len(ring) > 5:
+                    message += f" va yana {len(ring) - 5} ta"
+                message += "\n"
+            message += "\n"
+        
+        if report['burst_count']:
+            message += f"**⚡ {window} soniya ichida ko'p referal: {report['burst_count']}**\n"
+            for i, burst in enumerate(report['bursts'], 1):
+                message += f"{i}. {name(burst['referrer_id'])} - {burst['burst_size']}/{burst['referrals']} referal"
+                message += f", daraxt: {burst['subtree_size']}, chuqurlik: {burst['depth']}\n"
+        
+        return message
     
-    def help_message(self) -> str:
-        """Help message"""
-        return """
-ℹ️ **Yordam:**
-
-Bu bot maishiy texnika do'koni viktorinasi uchun mo'ljallangan.
-
-**Asosiy buyruqlar:**
-• /start - Botni ishga tushirish
-• /help - Yordam ma'lumotlari
+    def user_search_message(self, users: list) -> str:
+        """/find results, best match first"""
+        labels = {'id': "ID", 'code': "kod", 'phone': "telefon", 'name': "ism"}
+        message = f"🔍 Topildi: {len(users)}\n\n"
+        for i, user in enumerate(users, 1):
+            username = f" (@{user['username']})" if user['username'] else ""
+            message += f"{i}. {user['first_name'] or 'Ismsiz'}{username} [{labels[user['match']]}]\n"
+            message += f"   🆔 {user['user_id']}"
+            if user['phone_number']:
+                message += f" | 📱 {user['phone_number']}"
+            message += f" | 🔗 {user['referral_count']}\n"
+        return message
+    
+    def user_card_message(self, user: dict, rank: tuple = None, subtree_size: int = 0, depth: int = 0) -> str:
+        """Admin view of one user, with the ids needed for /addref"""
+        username = f"@{user['username']}" if user['username'] else "Username yo'q"
+        eligible = "✅ Bor" if user['eligible'] else "❌ Yo'q"
+        rank_info = f"\n🏆 Reyting: {rank[0]}/{rank[1]}" if rank else ""
+        
+        return f"""
+👤 {user['first_name'] or 'Ismsiz'} ({username})
 
-**Qanday ishlaydi:**
-1. Botni ishga tushiring
-2. Do'stlaringizni taklif qiling
-3. Viktorinaga qatnashish huquqini qo'lga kiriting
-4. G'olib bo'lish uchun omad tilang!
+🆔 ID: {user['user_id']}
+📱 Telefon: {user['phone_number'] or "yo'q"}
+🎟 Kod: {user['referral_code']}
+🔗 Referallar: {user['referral_count']}
+🎯 Qatnashish huquqi: {eligible}{rank_info}
+🌳 Taklif daraxti: {subtree_size}, chuqurlik: {depth}
 
-Batafsil ma'lumot uchun "Qoidalar" tugmasini bosing.
+Referal qo'shish: /addref {user['user_id']} REFERRED_ID
         """
-    
-    def admin_participants_message(self, participants: list) -> str:
-        """Admin message showing participants"""
-        if not participants:
-            return "📋 Hozircha hech kim viktorinaga qatnasha olmaydi."
-        
-        message = "👥 **Viktorina qatnashuvchilari:**\n\n"
-        for i, participant in enumerate(participants, 1):
-            username = f"@{participant['username']}" if participant['username'] else "Username yo'q"
-            message += f"{i}. {participant['first_name']} ({username})\n"
-            message += f"   Referallar: {participant['referral_count']}\n\n"
-        
-        message += f"**Jami qatnashuvchilar: {len(participants)}**"
-        return message
@@ -0,0 +1,101 @@
+"""
+Outbox
+Non-critical messages (referrer notices, welcome DMs) that could not be sent
+because the Bot API was down, kept in the database and sent once it is back
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from utils.circuit_breaker import CircuitBreaker
+from utils.http_pools import bulk_traffic
+
+logger = logging.getLogger(__name__)
+
+
+def _is_outage(error: Exception) -> bool:
+    """
+    True for errors worth retrying later: network errors, timeouts, an open
+    circuit and flood waits. PTB derives BadRequest from NetworkError, but a
+    400 (chat not found, message too long) fails the same way every time.
+    """
+    return isinstance(error, (NetworkError, RetryAfter)) and not isinstance(error, BadRequest)
+
+
+class Outbox:
+    """
+    Send-or-defer for messages nobody is waiting on.
+
+    send() queues the message without calling the API while the circuit is
+    open, and queues it as well when the call fails with a network error or
+    flood wait, so a handler never waits more than one request timeout.
+    Delivery is at least once: a send that timed out may have arrived.
+    drain() sends the queue through the bulk pool, oldest first, and stops
+    at the first outage error; the breaker's probe decides when it resumes.
+    """
+    
+    def __init__(self, database, breaker: CircuitBreaker, batch_size: int = 50, ttl: int = 86400):
+        self.db = database
+        self.breaker = breaker
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.pending = database.count_outbox()
+        self.sent = 0
+        self._draining = asyncio.Lock()
+    
+    def _defer(self, chat_id: int, text: str, kind: Optional[str]) -> bool:
+        if self.db.enqueue_outbox(chat_id, text, kind):
+            self.pending += 1
+            logger.info("Message deferred to outbox", extra={'event': 'outbox_deferred', 'chat_id': chat_id, 'kind': kind})
+            return True
+        return False
+    
+    async def send(self, bot, chat_id: int, text: str, kind: Optional[str] = None) -> bool:
+        """Send now or queue for later; False only if the message is lost"""
+        if self.breaker.is_open:
+            return self._defer(chat_id, text, kind)
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            return True
+        except Exception as e:
+            if _is_outage(e):
+                return self._defer(chat_id, text, kind)
+            # Blocked the bot, chat not found, ...: retrying won't help
+            logger.error("Failed to send message", extra={'event': 'message_send_failed', 'chat_id': chat_id, 'kind': kind, 'error': e})
+            return False
+    
+    async def drain(self, bot) -> int:
+        """Send queued messages until the queue is empty or the API fails again"""
+        if not self.pending or self._draining.locked():
+            return 0
+        sent = 0
+        async with self._draining:
+            with bulk_traffic():
+                while True:
+                    batch = await asyncio.to_thread(self.db.next_outbox_batch, self.batch_size, self.ttl)
+                    if not batch:
+                        break
+                    done = []
+                    outage = False
+                    for message in batch:
+                        try:
+                            await bot.send_message(chat_id=message['chat_id'], text=message['text'])
+                            sent += 1
+                        except TelegramError as e:
+                            if _is_outage(e):
+                                outage = True
+                                break
+                            logger.error("Dropping undeliverable outbox message", extra={'event': 'outbox_undeliverable', 'chat_id': message['chat_id'], 'error': e})
+                        done.append(message['id'])
+                    if done:
+                        await asyncio.to_thread(self.db.delete_outbox, done)
+                    if outage or len(batch) < self.batch_size:
+                        break
+            self.pending = await asyncio.to_thread(self.db.count_outbox)
+        self.sent += sent
+        if sent:
+            logger.info("Outbox drained", extra={'event': 'outbox_drained', 'sent': sent, 'pending': self.pending})
+        return sent
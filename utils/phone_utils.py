@@ -0,0 +1,41 @@
+"""
+Phone number utility functions
+Normalizes user-entered and shared-contact phone numbers to E.164
+"""
+
+import re
+from typing import Optional
+
+_SEPARATORS = re.compile(r"[\s\-().]")
+
+
+def normalize_phone(text: str, country_code: str = "998", national_length: int = 9) -> Optional[str]:
+    """
+    Normalize a phone number to E.164 ("+998901234567").
+
+    Accepts "+998 90 123-45-67", "998901234567", "00998901234567" and the
+    national form "901234567", which gets country_code prepended. Telegram
+    contacts arrive without the "+". Returns None if the text is not a
+    plausible phone number.
+    """
+    if not text:
+        return None
+    
+    compact = _SEPARATORS.sub("", text.strip())
+    if compact.startswith("+"):
+        digits = compact[1:]
+    elif compact.startswith("00"):
+        digits = compact[2:]
+    elif len(compact) == national_length:
+        digits = country_code + compact
+    else:
+        digits = compact
+    
+    if not digits.isdigit() or digits.startswith("0"):
+        return None
+    if digits.startswith(country_code) and len(digits) != len(country_code) + national_length:
+        return None
+    if not 8 <= len(digits) <= 15:
+        return None
+    
+    return "+" + digits
@@ -0,0 +1,48 @@
+"""
+Processed updates
+In-memory window of Telegram updates whose writes are committed, so updates
+redelivered after a restart are skipped before any database work
+"""
+
+import logging
+from collections import deque
+from typing import Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessedUpdates:
+    """
+    Set of (update_id, subject) pairs over the last `window` update ids.
+
+    Loaded from the processed_updates table at startup and extended as
+    handlers commit; the database mark written inside each transaction stays
+    the authority, this only answers "already done?" in O(1). Update ids
+    grow, so the deque is in id order and eviction pops from its left.
+    """
+    
+    def __init__(self, window: int = 100000):
+        self.window = window
+        self.seen = set()
+        self.order = deque()
+    
+    def load(self, rows: Iterable[Tuple[int, int]]):
+        """Rebuild from a stream of (update_id, subject), oldest first"""
+        self.seen = set()
+        self.order = deque()
+        for update_id, subject in rows:
+            self.add(update_id, subject)
+        logger.info("Processed updates loaded", extra={'event': 'processed_updates_loaded', 'updates': len(self.seen)})
+    
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        return key in self.seen
+    
+    def add(self, update_id: int, subject: int = 0):
+        key = (update_id, subject)
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        self.order.append(key)
+        horizon = update_id - self.window
+        while self.order and self.order[0][0] < horizon:
+            self.seen.discard(self.order.popleft())
@@ -0,0 +1,202 @@
+"""
+Referral graph index
+In-memory adjacency index over the current campaign's referrals for spotting
+referral rings and bursts of throwaway accounts
+"""
+
+import bisect
+import logging
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ReferralGraph:
+    """
+    Directed referrer -> referred graph kept in sync with the referrals table.
+
+    Each referrer keeps its referred users and their creation times sorted,
+    so burst queries are a single sliding-window pass over one list. Subtree
+    and depth walks are iterative and guard against cycles, which a plain
+    recursive CTE over the edge list does not.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.children = {}
+        self.parents = {}
+    
+    def load(self, edges: Iterable[Tuple[int, int, Optional[int]]]):
+        """Rebuild from a stream of (referrer_id, referred_id, created_ts)"""
+        with self.lock:
+            self.children = {}
+            self.parents = {}
+            count = 0
+            for referrer_id, referred_id, created_ts in edges:
+                self._add_edge(referrer_id, referred_id, created_ts)
+                count += 1
+        logger.info("Referral graph loaded", extra={'event': 'referral_graph_loaded', 'edges': count})
+    
+    def _add_edge(self, referrer_id: int, referred_id: int, created_ts: Optional[int]):
+        children = self.children.setdefault(referrer_id, [])
+        if created_ts is None:
+            created_ts = 0
+        
+        # Kept sorted by (created_ts, user_id); edges mostly arrive in order
+        bisect.insort(children, (created_ts, referred_id))
+        self.parents.setdefault(referred_id, referrer_id)
+    
+    def add_edge(self, referrer_id: int, referred_id: int, created_ts: Optional[int]):
+        """Record a new referral"""
+        with self.lock:
+            self._add_edge(referrer_id, referred_id, created_ts)
+    
+    def reset(self):
+        """Forget all edges (a new campaign started)"""
+        self.load(())
+    
+    def subtree_size(self, user_id: int) -> int:
+        """Number of users reachable from user_id through referrals"""
+        with self.lock:
+            return self._subtree_size(user_id)
+    
+    def _subtree_size(self, user_id: int) -> int:
+        seen = {user_id}
+        stack = [user_id]
+        while stack:
+            for _, child in self.children.get(stack.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return len(seen) - 1
+    
+    def depth(self, user_id: int) -> int:
+        """Length of the referral chain above user_id (0 for a root)"""
+        with self.lock:
+            return self._depth(user_id)
+    
+    def _depth(self, user_id: int) -> int:
+        seen = {user_id}
+        depth = 0
+        parent = self.parents.get(user_id)
+        while parent is not None and parent not in seen:
+            seen.add(parent)
+            depth += 1
+            parent = self.parents.get(parent)
+        return depth
+    
+    def cycles(self) -> List[List[int]]:
+        """
+        Referral rings: strongly connected components with more than one user.
+
+        Iterative Tarjan, O(users + referrals), so deep chains cannot hit the
+        recursion limit.
+        """
+        with self.lock:
+            index = {}
+            low = {}
+            on_stack = set()
+            stack = []
+            rings = []
+            counter = 0
+            
+            for root in self.children:
+                if root in index:
+                    continue
+                index[root] = low[root] = counter
+                counter += 1
+                stack.append(root)
+                on_stack.add(root)
+                work = [(root, iter(self.children.get(root, ())))]
+                while work:
+                    node, edges = work[-1]
+                    advanced = False
+                    for _, child in edges:
+                        if child not in index:
+                            index[child] = low[child] = counter
+                            counter += 1
+                            stack.append(child)
+                            on_stack.add(child)
+                            work.append((child, iter(self.children.get(child, ()))))
+                            advanced = True
+                            break
+                        if child in on_stack:
+                            low[node] = min(low[node], index[child])
+                    if advanced:
+                        continue
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1:
+                            rings.append(sorted(component))
+            return rings
+    
+    def bursts(self, window: int, min_size: int) -> List[dict]:
+        """
+        Referrers whose referred users were created within `window` seconds of
+        each other at least `min_size` times, largest burst first.
+        """
+        with self.lock:
+            result = []
+            for referrer_id, children in self.children.items():
+                if len(children) < min_size:
+                    continue
+                best = 0
+                best_start = 0
+                start = 0
+                for end in range(len(children)):
+                    while children[end][0] - children[start][0] > window:
+                        start += 1
+                    if end - start + 1 > best:
+                        best = end - start + 1
+                        best_start = children[start][0]
+                if best >= min_size:
+                    result.append({
+                        'referrer_id': referrer_id,
+                        'burst_size': best,
+                        'burst_start': best_start,
+                        'referrals': len(children),
+                        'subtree_size': self._subtree_size(referrer_id),
+                        'depth': self._depth(referrer_id)
+                    })
+            result.sort(key=lambda item: (-item['burst_size'], item['referrer_id']))
+            return result
+    
+    def report(self, window: int, min_size: int, limit: int = 20) -> dict:
+        """Suspicious clusters for the admin: referral rings and signup bursts"""
+        rings = self.cycles()
+        bursts = self.bursts(window, min_size)
+        return {
+            'rings': rings[:limit],
+            'ring_count': len(rings),
+            'bursts': bursts[:limit],
+            'burst_count': len(bursts)
+        }
+    
+    def handle_event(self, event: str, data: dict):
+        """Database listener keeping the graph in sync"""
+        if event == 'referral_added':
+            self.add_edge(data['referrer_id'], data['referred_id'], data.get('created_ts'))
+        elif event == 'counters_reset':
+            self.reset()
+        elif event == 'counts_recomputed':
+            self.load(data['edges']())
+
+
+def report_user_ids(report: dict, per_ring: int = 5) -> List[int]:
+    """User ids named in a report, for looking up display names"""
+    user_ids = []
+    for ring in report['rings']:
+        user_ids.extend(ring[:per_ring])
+    user_ids.extend(burst['referrer_id'] for burst in report['bursts'])
+    return list(dict.fromkeys(user_ids))
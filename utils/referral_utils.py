@@ -15,11 +15,17 @@ class ReferralUtils:
         self.db = database
         self.config = Config()
     
-    def generate_referral_code(self, user_id: int) -> str:
-        """Generate unique referral code for user"""
+    def generate_referral_code(self, user_id: int, attempt: int = 0) -> str:
+        """
+        Generate unique referral code for user.
+
+        Codes only carry 24 bits, so distinct users can collide; a caller
+        that finds the code taken retries with attempt=1, 2, ... Attempt 0
+        is the original code, so existing codes never change.
+        """
         # Create a hash based on user_id and a secret
         secret = "quiz_bot_secret_2024"  # In production, use environment variable
-        data = f"{user_id}_{secret}"
+        data = f"{user_id}_{secret}" if not attempt else f"{user_id}_{secret}_{attempt}"
         
         # Create SHA256 hash
         hash_object = hashlib.sha256(data.encode())